@@ -34,8 +34,14 @@
 # Access libraries and import necessary functions
 from cww_functions import *
 import os
+import sys
 import glob
 from os import walk
+from numpy import array, where, ones
+from PIL import Image
+from scipy.misc import imfilter
+from matplotlib import pyplot as plt
+from cww_draw import plot_scatter
 #import numpy as np
 #import scipy
 #from scipy.ndimage import measurements, morphology, gaussian_filter
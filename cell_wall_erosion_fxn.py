@@ -25,55 +25,138 @@
 #                                    #
 #  numpy                             #
 #  scipy                             #
-#  pylab                             #
-#  matplotlib                        #
+#  matplotlib (only to draw plots,   #
+#    see cww_draw)                   #
 #  Python Imaging Library (PIL)      #
 #                                    #
 ######################################
 
 # Access libraries and import necessary functions
 import os
+import numpy as np
+from scipy.ndimage import measurements, morphology, gaussian_filter
 from cww_functions import *
+from cww_geometry import area_perimeter
+from cww_widths import wall_widths
+from cww_threshold import find_threshold
+from cww_tiff import read_page, page_count
+from cww_cache import image_key
+import cww_profile
+from cww_output import save_npz
+from cww_log import logger, LimitedLog
+from cww_results import (image_name, table_files, write_cells_tsv,
+                         write_widths_tsv, write_all_widths_tsv)
+from cww_tiles import (TILE_SIZE, tile_boxes, core_in_halo, tile_map,
+                       image_array, stitch_labels, tile_centroids,
+                       tiled_wall_widths)
 
 
 ### Assign input/output file names and shortest distance ranges
 def name_files(file_in, out_path):
-    tail = os.path.split(file_in)[1]
-    file_out = os.path.join(out_path, tail.replace(".tif", ".tsv"))
-    png_name = os.path.join(out_path, tail.replace(".tif", ".png"))
-    print "OUTS", file_out, png_name
+    tail = os.path.splitext(os.path.split(file_in)[1])[0]
+    file_out = os.path.join(out_path, tail + ".tsv")
+    png_name = os.path.join(out_path, tail + ".png")
+    logger.debug("Output files %s, %s", file_out, png_name)
     return (file_out, png_name)
 
 
+### Name of the wall width distribution plot of an image
+def distribution_file(png_name):
+    png_name_tail = os.path.split(png_name)
+    return os.path.join(png_name_tail[0], "distribution_" + png_name_tail[1])
+
+
+### Reuse the array called name in buffers if it has this shape and dtype
+def reuse_buffer(buffers, name, shape, dtype):
+    buf = buffers.get(name)
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        buf = buffers[name] = np.empty(shape, dtype)
+    return buf
+
+
+#### Equalize, blur and threshold an 8-bit image to a boolean mask of cells
+def preprocess(im_raw, threshold, gauss_blur, buffers=None):
+    # Works from a 256-entry equalization table and float32 arrays; pass the
+    # same buffers dict for images of one size to reuse the arrays (the
+    # returned mask is one of them, so it is overwritten by the next call)
+    lut, cdf, counts = histeq_lut(im_raw)
+    threshold = find_threshold(threshold, counts, lut)
+    return threshold_image(im_raw, lut, threshold, gauss_blur,
+                           buffers), threshold
+
+
+### Equalize with the table lut, blur and threshold to a boolean mask
+def threshold_image(im_raw, lut, threshold, gauss_blur, buffers=None):
+    if buffers is None:
+        buffers = {}
+    equalized = reuse_buffer(buffers, 'equalized', im_raw.shape, np.float32)
+    np.take(lut.astype(np.float32), im_raw, out=equalized, mode='clip')
+    blurred = reuse_buffer(buffers, 'blurred', im_raw.shape, np.float32)
+    gaussian_filter(equalized, gauss_blur, output=blurred)
+    mask = reuse_buffer(buffers, 'mask', im_raw.shape, np.bool_)
+    np.less(blurred, threshold, out=mask)
+    return mask
+
+
+### Binary opening then closing of a mask, to separate and fill in objects
+#   (0 iterations skips the step; scipy would repeat it until nothing changed)
+def open_close(im, structuring_element, binary_open_iterations,
+               binary_close_iterations):
+    im_open = im
+    if binary_open_iterations > 0:
+        im_open = morphology.binary_opening(im_open,
+                                            structuring_element,
+                                            iterations=binary_open_iterations)
+    if binary_close_iterations > 0:
+        im_open = morphology.binary_closing(im_open,
+                                            structuring_element,
+                                            iterations=binary_close_iterations)
+    return im_open
+
+
+### Opened and closed mask of the core of one tile (see process_image_tiled)
+def tile_mask(tile, core, grown, lut, threshold, gauss_blur,
+              binary_open_iterations, binary_close_iterations,
+              structuring_element):
+    im = threshold_image(tile, lut, threshold, gauss_blur)
+    im_open = open_close(im, structuring_element, binary_open_iterations,
+                         binary_close_iterations)
+    return core, im_open[core_in_halo(core, grown)]
+
+
+### Warn that only one page of a multi-page file is analyzed
+def page_notice(file_in, page, pages):
+    logger.warning("%s has %d pages; analyzing page %d (choose another with "
+                   "--page, or analyze them all with --stack)", file_in,
+                   pages, page + 1)
+
+
 #### Process image
 def process_image(file_in, file_out, threshold, gauss_blur,
                   binary_open_iterations, binary_close_iterations,
                   dilation_iterations, area_cutoff, perimeter_cutoff,
-                  structuring_element):
-    print "Open image file"
+                  structuring_element, page=0):
+    logger.info("Open image file %s", file_in)
 
-    # Open image file and convert to grayscale
+    # Open image file and convert to grayscale (page is the page of a
+    # multi-page TIFF to use; uncompressed TIFFs are memory-mapped, see cww_tiff)
     #.convert('RGB')) #,'f') #L converts to grayscale, f to float;
     # 1 converts to black and white
-    im_raw = array(Image.open(file_in).convert("L"))
-
-    # Contrast stretch/normalize with histogram
-    # call histogram function to normalize color from 0 to 1
-    # instead of 0 to 255; contrast is increased by distributing the histogram
-    im, cdf = histeq(im_raw)
-
-    # Get average value of pixels > 0 and find mean, set threshold to mean
-    if threshold == 'mean':
-        sum_pix = 0
-        count = 0
-        for line in im:
-            for pix in line:
-                if pix > 0:
-                    sum_pix = sum_pix + pix
-                    count = count + 1
-                #print "sum count:",sum_pix,count
-        #150 to 170 good, 190 ok(some objects merge) **** 170 good for wt.tif
-        threshold = (sum_pix / count)
+    with cww_profile.stage('read'):
+        im_raw = read_page(file_in, page)
+        pages = page_count(file_in)
+    cww_profile.count('pixels', im_raw.size)
+    if pages > 1:
+        page_notice(file_in, page, pages)
+
+    # Contrast stretch/normalize with histogram (contrast is increased by
+    # distributing the histogram), smooth the image (to remove small objects)
+    # with gaussian blur, and threshold it to a binary mask.  The threshold is
+    # a fixed value, the mean of pixels > 0, or a level found from the
+    # histogram (otsu, triangle, percentile:N; see cww_threshold)
+    #150 to 170 good, 190 ok(some objects merge) **** 170 good for wt.tif
+    with cww_profile.stage('preprocess'):
+        im, threshold = preprocess(im_raw, threshold, gauss_blur)
 # Threshold is mean of all grey pixels
 #   Need good separation of cell wall from cell
 #   --mean should work, but will miss walls of small cells
@@ -82,15 +165,7 @@ def process_image(file_in, file_out, threshold, gauss_blur,
 #   to very few, only noise blobs (not good cell wall representations)
 #   will be left.
 
-    print "Threshold =", threshold
-
-    # Smooth the image (to remove small objects) with gaussian blur
-    im = gaussian_filter(im, gauss_blur)
-
-    # Threshold image to make binary
-    # threshold and *1 to make binary not boolean; anything <128  becomes black
-    im = 1 * (im < threshold)
-    where(im > 1, 1, 0)        # threshold anything greater than 1 = 1
+    logger.info("Threshold = %s", threshold)
 
     # Fill holes to connect components of single object
     #im_open = morphology.binary_fill_holes(im,structuring_element)
@@ -102,256 +177,235 @@ def process_image(file_in, file_out, threshold, gauss_blur,
     # necessary)
     #groups based on neighbors (ones) one above, one below,
     # and the current pixel for x and y
-    im_open = morphology.binary_opening(im,
-                                        structuring_element,
-                                        iterations=binary_open_iterations)
-    im_open = morphology.binary_closing(im_open,
-                                        structuring_element,
-                                        iterations=binary_close_iterations)
+    with cww_profile.stage('morphology'):
+        im_open = open_close(im, structuring_element, binary_open_iterations,
+                             binary_close_iterations)
 
     # Label objects within image and count number of objects
-    labels_open, num_objects_open = measurements.label(im_open)
-    print "Number of objects: ", num_objects_open
+    with cww_profile.stage('label'):
+        labels_open, num_objects_open = measurements.label(im_open)
+    cww_profile.count('objects', num_objects_open)
+    logger.info("Number of objects: %d", num_objects_open)
 
     # Get edges (contours) of image, use binary erosion to
     # see edges within labeled segments
-    contours = imfilter(im_open, 'contour')  # contour image filter
+    #contours = imfilter(im_open, 'contour')  # contour image filter
     # Need one preliminary binary erosion to clean data (connect contours)
     # for area & perim
     # erode label object at borders to get full edges
-    contours = morphology.binary_erosion(labels_open)
+    with cww_profile.stage('morphology'):
+        contours = morphology.binary_erosion(labels_open)
     # should be in order of labels
-    centroids = measurements.center_of_mass(im_open,
-                                            labels_open,
-                                            xrange(1, num_objects_open + 1))
+    with cww_profile.stage('label'):
+        centroids = measurements.center_of_mass(
+            im_open, labels_open, xrange(1, num_objects_open + 1))
     x_center = tuple(x[0] for x in centroids)
     y_center = tuple(x[1] for x in centroids)
     return (im_raw, labels_open, y_center, x_center, contours)
 
 
-####  Get area and perimeter of cells (must run image process first!!)
-def area_perim(area_cutoff, perimeter_cutoff, labels_open, contours, file_out):
-    coord = {}
-# Map labels to x,y coordinates
-    for x in range(len(labels_open - 1)):
-        for y in range(len(labels_open[x] - 1)):
-            #print labels_open[x][y]
-            # for each unique label value (key), its x,y tuple is
-            # appended to the current list of tuples (value)
-            coord.setdefault(labels_open[x][y], []).append(tuple([x, y]))
-
-    edges = {}
-    # Iterate through each cluster in dictionary of clusters and
-    # identify edge pixels for each cluster
-    for cluster in coord.keys():
-        #print "Cluster", cluster
-        # get value (list of points in single cluster) from key
-        clust = coord[cluster]
-        #print "value",clust, "clust size", len(clust)
-        # check each value in list to see if it is an edge (if it is a contour)
-        for pixel in clust:
-            x, y = pixel[0], pixel[1]
-            if contours[x][y] == 0:
-                # black edge of cell segments, these are bordering segments,
-                # not inside segments...
-                # contours present in binary opening are assigned as edges
-                # potential alternative method: erode labeled object within
-                # image; (image - erosion) to get border
-                edges.setdefault(cluster, []).append(tuple([x, y]))
-
-    # Open output file
-    output = open(file_out, 'w')
-    output.write('object_label, area, perimeter\n')
-
-    edges_relisted = []
-    area_list = []
-    labels = sorted(edges.keys())
-    for i in range(0, len(labels)):
-        output.write(str(labels[i]))
-        # 0th is background, will end on last i+1 (=last j)
-        edge_list = edges[labels[i]]
-        sangles = sort_coord(edge_list)
-        #print "Sangles: ",sangles
-        # find area of label i+1 by passing its edge coordinates
-        # to area function
-        area = area2D_Polygon(sangles)
-        if area < area_cutoff:
-            print "Area", area
-            area_list.append(area)
-            output.write('\t' + str(area))
-        p = perimeter(sangles)  # pass edge coordinates to perimeter function
-        if p < perimeter_cutoff:
-            print "Perimeter", p
-            output.write('\t' + str(p))
-        #print "EDGES: ",edge_list
-        output.write('\n')
-        edges_relisted.append(sangles)
-    output.close()
-
-
-### Find distribution of cell wall widths (must run image processing first!)
-def cell_wall_widths(dilation_iterations, labels_open, file_out, png_name):
-    # Open second output data file
-    #output2 = open("widths_"+file_out,'w')
-    # attempting to fix error where widths is added before the entire file
-    # output path
-    output2_list = os.path.split(file_out)
-    output2_list_tail = "widths_" + output2_list[1]
-    output2_path = os.path.join(output2_list[0], output2_list_tail)
-    print "Outputting to %s" % output2_path
-    output2 = open(output2_path, 'wb')
-
-    output2.write('pixel_width\tnum_cell_walls\n')
-
-    # Label objects within image and count number of objects
-    dilating, total = measurements.label(labels_open)
-    #print "Number of objects post initial erode: ", total
-    max_merged = 0
-    prev_merged = 0
-    pixel_count = []
-    object_count = []
-    all_widths = []
-    # Iteratively erode and then count objects
-    for i in range(1, dilation_iterations):
-        # Erode objects 1 pixel width at a time
-        # (2  objects touching side of edge at time, so 2 pixels off cell wall)
-        dilating = morphology.binary_dilation(dilating, iterations=1)
-        # Label objects within image and count number of objects
-        labels_open, num_objects_open = measurements.label(dilating)
-        #print "Number of objects with ", i, "dilations: ", num_objects_open
-        merged_objects = total - num_objects_open
-        print (merged_objects - prev_merged, " cell walls with width of ",
-               i * 2, "pixels\n", )
-        all_widths.extend([(i * 2)] * (merged_objects - prev_merged))
-        output2.write(str(i * 2) + '\t' +
-                      str(merged_objects - prev_merged) + '\n')
-        pixel_count.append(i * 2)
-        object_count.append(merged_objects - prev_merged)
-        prev_merged = merged_objects
-        if max_merged < merged_objects:  # for optimizing y axis in plot
-            max_merged = merged_objects
-
-    output2.close()
+#### Process image, or reuse its results from cache (an ImageCache, see
+#   cww_cache) if the same image was processed with the same settings before
+def cached_process_image(cache, file_in, file_out, threshold, gauss_blur,
+                         binary_open_iterations, binary_close_iterations,
+                         dilation_iterations, area_cutoff, perimeter_cutoff,
+                         structuring_element, page=0):
+    key = image_key(file_in, threshold, gauss_blur, binary_open_iterations,
+                    binary_close_iterations, structuring_element, page)
+    with cww_profile.stage('cache'):
+        stored = cache.get(key)
+    if stored is not None:
+        logger.info("Using cached image processing for %s", file_in)
+        cww_profile.count('cache_hits')
+        with cww_profile.stage('read'):
+            im_raw = read_page(file_in, page)
+        return (im_raw, stored['labels_open'], tuple(stored['y_center']),
+                tuple(stored['x_center']), stored['contours'])
+    (im_raw, labels_open, y_center, x_center,
+     contours) = process_image(file_in, file_out, threshold, gauss_blur,
+                               binary_open_iterations, binary_close_iterations,
+                               dilation_iterations, area_cutoff,
+                               perimeter_cutoff, structuring_element, page)
+    with cww_profile.stage('cache'):
+        cache.put(key, {'labels_open': labels_open, 'contours': contours,
+                        'y_center': np.array(y_center),
+                        'x_center': np.array(x_center)})
+    return (im_raw, labels_open, y_center, x_center, contours)
 
-    ### Print list of all widths (including repeated values) to
-    ### new output file all_widths_filename
-    output3_list_tail = "all_widths_" + output2_list[1]
-    output3_path = os.path.join(output2_list[0], output3_list_tail)
-    output3 = open(output3_path, 'wb')
-    output3.write('pixel_width\n')
 
-    for i in all_widths:
-        output3.write(str(i) + "\n")
+#### Process image in tiles, for images too large to process all at once
+#   Gives the same labels and contours as process_image.  Each tile is worked
+#   on with a halo as wide as the blur and the opening and closing reach, on
+#   workers processes; labels and contours are kept in memory-mapped files
+#   under scratch_dir if one is given.
+def process_image_tiled(file_in, file_out, threshold, gauss_blur,
+                        binary_open_iterations, binary_close_iterations,
+                        dilation_iterations, area_cutoff, perimeter_cutoff,
+                        structuring_element, page=0, tile_size=TILE_SIZE,
+                        workers=1, scratch_dir=None):
+    logger.info("Open image file %s", file_in)
+    with cww_profile.stage('read'):
+        im_raw = read_page(file_in, page)
+        pages = page_count(file_in)
+    cww_profile.count('pixels', im_raw.size)
+    if pages > 1:
+        page_notice(file_in, page, pages)
+
+    # Histogram of the whole image, a tile at a time (pages of a memory-mapped
+    # image are read from disk here)
+    with cww_profile.stage('preprocess'):
+        counts = np.zeros(256, np.int64)
+        for core, grown in tile_boxes(im_raw.shape, tile_size):
+            counts += np.bincount(im_raw[core].ravel(), minlength=256)
+        lut, cdf = counts_lut(counts)
+        threshold = find_threshold(threshold, counts, lut)
+    logger.info("Threshold = %s", threshold)
+
+    # Blur (truncated at 4 standard deviations, as gaussian_filter does) and
+    # each erosion or dilation of the opening and closing move pixels
+    reach = max(np.shape(structuring_element)) // 2
+    halo = (int(4.0 * gauss_blur + 0.5) +
+            2 * (binary_open_iterations + binary_close_iterations) * reach)
+    masks = tile_map(tile_mask,
+                     ((np.array(im_raw[grown]), core, grown, lut, threshold,
+                       gauss_blur, binary_open_iterations,
+                       binary_close_iterations, structuring_element)
+                      for core, grown in tile_boxes(im_raw.shape, tile_size,
+                                                    halo)),
+                     workers)
+    # the tiles are blurred, thresholded, opened and closed (in the workers)
+    # as they are labeled
+    with cww_profile.stage('morphology'):
+        labels_open = image_array(im_raw.shape, np.int32, scratch_dir)
+        num_objects_open = stitch_labels(masks, labels_open)
+    cww_profile.count('tiles', len(tile_boxes(im_raw.shape, tile_size)))
+    cww_profile.count('objects', num_objects_open)
+    logger.info("Number of objects: %d", num_objects_open)
+
+    # Edges as process_image finds them (erosion reaches one pixel)
+    with cww_profile.stage('morphology'):
+        contours = image_array(im_raw.shape, np.bool_, scratch_dir)
+        for core, grown in tile_boxes(im_raw.shape, tile_size, 1):
+            eroded = morphology.binary_erosion(labels_open[grown])
+            contours[core] = eroded[core_in_halo(core, grown)]
+    with cww_profile.stage('label'):
+        x_center, y_center = tile_centroids(labels_open, num_objects_open,
+                                            tile_size)
+    return (im_raw, labels_open, tuple(y_center), tuple(x_center), contours)
 
-    output3.close()
 
+####  Get area and perimeter of cells (must run image process first!!)
+#   writes them to file_out, or to the cells table of store (a ResultStore,
+#   see cww_results) if one is given
+def area_perim(area_cutoff, perimeter_cutoff, labels_open, contours, file_out,
+               store=None):
+    # Group edge pixels by label: black edge of cell segments (contours == 0),
+    # these are bordering segments, not inside segments...
+    with cww_profile.stage('geometry'):
+        labels, edge_coords, offsets = label_edges(labels_open, contours)
+
+    # Sort every cell's edges by angle and find all areas and perimeters
+    # in a few array passes (see cww_geometry)
+    with cww_profile.stage('geometry'):
+        areas, perimeters = area_perimeter(edge_coords, offsets)
+
+    cells = LimitedLog('cells')
+    if cells.enabled:
+        for label, area, p in zip(labels.tolist(), areas.tolist(),
+                                  perimeters.tolist()):
+            cells.debug("Object %d: area %s, perimeter %s", label, area, p)
+        cells.close()
+
+    with cww_profile.stage('write'):
+        if store is not None:
+            store.put('cells', image_name(file_out),
+                      {'object_label': labels.astype(np.int32),
+                       'area': areas, 'perimeter': perimeters})
+        else:
+            write_cells_tsv(file_out, labels, areas, perimeters, area_cutoff,
+                            perimeter_cutoff)
 
-### Find distribution of cell distances apart to identify aggregates
-def cell_aggregates(dilation_iterations, labels_open, file_out, png_name):
-    # Open second output data file
-    output2_list = os.path.split(file_out)
-    output2_list_tail = "widths_" + output2_list[1]
-    output2_path = os.path.join(output2_list[0], output2_list_tail)
-    output2 = open(output2_path, 'wb')
-    output2.write('pixel_width\tnum_cell_walls\n')
 
-    # Label objects within image and count number of objects
-    dilating, total = measurements.label(labels_open)
-    #print "Number of objects post initial erode: ", total
-    max_merged = 0
-    prev_merged = 0
+### Find distribution of cell wall widths (must run image processing first!)
+#   dilates once and writes the widths TSV, all-widths TSV (in the
+#   all_widths format, see write_all_widths_tsv) and pairs table (or the
+#   widths and pairs tables of store, a ResultStore, if one is given), plus
+#   the distribution plot when plot is True; with a tile_size the widths are
+#   found a tile at a time on workers processes (see cww_tiles).  The
+#   dilation width engine only counts, so it writes no pairs table.
+def cell_wall_analysis(dilation_iterations, labels_open, file_out, png_name,
+                       width_mode='dilation', plot=True, tile_size=None,
+                       workers=1, store=None, all_widths='lines'):
+    # Number of objects merged at each dilation, either by iteratively
+    # dilating and relabeling or from one distance transform (see cww_widths),
+    # and the width of the wall between each pair of cells that touched
+    with cww_profile.stage('widths'):
+        if tile_size:
+            merged, pairs = tiled_wall_widths(dilation_iterations,
+                                              labels_open, labels_open.max(),
+                                              tile_size, workers, width_mode)
+        else:
+            merged, pairs = wall_widths(dilation_iterations, labels_open,
+                                        width_mode)
+    if pairs is not None:
+        cww_profile.count('walls', len(pairs['width_px']))
     pixel_count = []
     object_count = []
-    all_widths = []
-    # Iteratively erode and then count objects
+    steps = LimitedLog('widths')
     for i in range(1, dilation_iterations):
-        # Erode objects 1 pixel width at a time
         # (2  objects touching side of edge at time, so 2 pixels off cell wall)
-        dilating = morphology.binary_dilation(dilating, iterations=1)
-        # Label objects within image and count number of objects
-        labels_open, num_objects_open = measurements.label(dilating)
-        #  print "Number of objects with ", i, "dilations: ", num_objects_open
-        merged_objects = total - num_objects_open
-        print (merged_objects - prev_merged,
-               " cell walls with width of ", i * 2, "pixels\n", )
-        all_widths.extend([(i * 2)] * (merged_objects - prev_merged))
-        output2.write(str(i * 2) + '\t' +
-                      str(merged_objects - prev_merged) + '\n')
+        if steps.enabled:
+            steps.debug("%d cell walls with width of %d pixels",
+                        merged[i - 1], i * 2)
         pixel_count.append(i * 2)
-        object_count.append(merged_objects - prev_merged)
-        prev_merged = merged_objects
-        if max_merged < merged_objects:  # for optimizing y axis in plot
-            max_merged = merged_objects
+        object_count.append(merged[i - 1])
+    steps.close()
+
+    ### Write the number of walls of each width, the widths of all walls (as
+    ### runs, or repeating each width) and the table of cell pairs and the
+    ### width of the wall between them (label_a, label_b, width_px,
+    ### contact_x, contact_y columns) to widths_, all_widths_ and
+    ### pairs_filename.npz
+    with cww_profile.stage('write'):
+        if store is not None:
+            store.put('widths', image_name(file_out),
+                      {'pixel_width': np.array(pixel_count, np.int32),
+                       'num_cell_walls': np.array(object_count, np.int64)})
+            if pairs is not None:
+                store.put('pairs', image_name(file_out), pairs)
+        else:
+            files = table_files(file_out)
+            logger.info("Outputting to %s", files['widths'])
+            write_widths_tsv(files['widths'], pixel_count, object_count)
+            write_all_widths_tsv(files['all_widths'], pixel_count,
+                                 object_count, all_widths)
+            if pairs is not None:
+                save_npz(files['pairs'], pairs)
 
-    output2.close()
+    ###  Plot distribution of cell wall widths
+    if plot:
+        from cww_draw import plot_distribution   # loads matplotlib
+        with cww_profile.stage('plot'):
+            plot_distribution(pixel_count, object_count, dilation_iterations,
+                              distribution_file(png_name))
+    return pixel_count, object_count
 
-    ### Print list of all widths (including repeated values) to
-    ### new output file all_widths_filename
-    output3_list_tail = "widths_" + output2_list[1]
-    output3_path = os.path.join(output2_list[0], output3_list_tail)
-    output3 = open(output3_path, 'wb')
-    output3.write('pixel_width\n')
 
-    for i in all_widths:
-        output3.write(str(i) + "\n")
+### Find distribution of cell wall widths (must run image processing first!)
+def cell_wall_widths(dilation_iterations, labels_open, file_out, png_name,
+                     width_mode='dilation'):
+    cell_wall_analysis(dilation_iterations, labels_open, file_out, png_name,
+                       width_mode, plot=False)
 
-    output3.close()
 
-    ###  Plot distribution of cell wall widths
-    png_name_tail = os.path.split(png_name)
-    png_name_out = "distribution_" + png_name_tail[1]
-    dist_png_name = os.path.join(png_name_tail[0], png_name_out)
-    plot_scatter(pixel_count, object_count, "Cell Wall Pixel Width",
-                 "Number of Cell Walls", 'b', dist_png_name,
-                 "png", [0, (dilation_iterations * 2) + 5,
-                         0, max_merged + 5],
-                 "Distribution of Cell Wall Widths")
-    return labels_open
-
-
-    ### Plots modified from canny edge detector tutorial:
-    #   http://scikit-image.org/docs/dev/auto_examples/plot_canny.html
-
-def plot_image(im_raw, labels_open, labels_open_eroded,
-               y_center, x_center, contours, png_name, show_image):
-    # Display results on image; x and y axis switched since
-    # (0,0) is in upper left corner
-    plt.figure(figsize=(10, 4))
-
-    # Subplot 1s
-    plt.subplot(131)
-    plt.imshow(im_raw, cmap=plt.cm.gray)
-    plt.axis('off')
-    plt.title('Grey image', fontsize=20)
-    plt.scatter(x=y_center, y=x_center, c='r', s=10)
-
-    # Subplot 2
-    plt.subplot(132)
-    plt.imshow(contours, cmap=plt.cm.gray)
-    plt.axis('off')
-    plt.title('Contours, binary erosion', fontsize=20)
-    # Annotate each cell object with its label (corresponds to edge array
-    # numbers output to keep track of which cells are being measured)
-    for i in range(1, len(labels_open) - 1):
-        label1 = labels_open[i]  # skip the background, label 0
-        #x = y_center[i-1]
-        #y = x_center[i-1]
-        #plt.annotate(label1,xy = (x,y), xytext = (x,y), color = 'r')
-
-    # Subplot 3
-    plt.subplot(133)
-    plt.imshow(labels_open_eroded, cmap=plt.cm.gray)
-    plt.axis('off')
-    plt.title('Post-dilation', fontsize=20)
-    #plt.scatter(x=y_center, y=x_center, c='r', s=10)
-
-    # Create Figure
-    plt.subplots_adjust(wspace=0.02, hspace=0.02, top=0.9,
-                        bottom=0.02, left=0.02, right=0.98)
-
-    plt.savefig(png_name)
-    if show_image:
-        plt.show()
+### Find distribution of cell distances apart to identify aggregates
+#   same analysis as cell_wall_widths plus the distribution plot; returns the
+#   wall widths and the number of walls of each, as cell_wall_analysis
+def cell_aggregates(dilation_iterations, labels_open, file_out, png_name,
+                    width_mode='dilation'):
+    return cell_wall_analysis(dilation_iterations, labels_open, file_out,
+                              png_name, width_mode, plot=True)
+
 
 ##########
 #print "Done"
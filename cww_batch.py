@@ -0,0 +1,375 @@
+# Functions for running the pyCWW pipeline over many image files at once
+#
+# Each image's pipeline (process_image, cell wall widths, area and perimeter)
+# runs in one worker process of a process pool, and its plots are drawn by
+# another task on the pool once its tables are written (see cww_plots).
+# Results come back in file order or as they finish, and an error in one file
+# is reported with that file instead of stopping the batch.  Images processed in tiles
+# (see cww_tiles) are run one at a time, with the workers sharing the tiles.
+# Multi-page files can be analyzed as stacks instead (see cww_stack).  A batch
+# can report the stages of every file as they start and be cancelled between
+# stages (see cww_jobs).
+
+import os
+import glob
+import fnmatch
+import traceback
+import multiprocessing
+from collections import OrderedDict
+try:
+    from concurrent.futures import (ProcessPoolExecutor, wait,
+                                    FIRST_COMPLETED)
+except ImportError:  # python 2 needs the 'futures' backport; run serially
+    ProcessPoolExecutor = None
+
+from cell_wall_erosion_fxn import (name_files, process_image,
+                                   process_image_tiled, cached_process_image,
+                                   cell_wall_analysis, area_perim)
+from cww_stack import process_stack
+from cww_cache import ImageCache, CACHE_SIZE
+import cww_profile
+from cww_results import ResultStore, image_name, image_row
+from cww_plots import (plot_job, add_image, add_distribution, defer,
+                       discard, render, close_figures, use_agg)
+
+# Stages of the pipeline, in the order they run
+#   widths  - cell wall width TSVs and distribution plot (cell_wall_analysis)
+#   area    - area and perimeter TSV (area_perim)
+#   plot    - processed image plot (plot_image)
+STAGES = ('widths', 'area', 'plot')
+
+# Image files picked up from directories (matched case-insensitively)
+IMAGE_TYPES = ('*.tif', '*.tiff', '*.jpg', '*.jpeg', '*.png', '*.bmp')
+
+
+### Raised by a file's pipeline when its batch was cancelled
+class Cancelled(Exception):
+    pass
+
+
+### Image files from a list of files, directories and glob patterns
+def find_images(inputs, patterns=IMAGE_TYPES, recursive=False):
+    # files are kept as given, directories are searched for files matching
+    # patterns (and their subdirectories too if recursive), and glob patterns
+    # are expanded first; each file is listed once, in the order found
+    found = []
+    for item in inputs:
+        if glob.has_magic(item):
+            matches = sorted(glob.glob(item))
+        else:
+            matches = [item]
+        for match in matches:
+            if os.path.isdir(match):
+                found.extend(images_in_dir(match, patterns, recursive))
+            else:
+                found.append(match)
+    seen = set()
+    return [f for f in found if not (f in seen or seen.add(f))]
+
+
+### Image files in one directory (and below, if recursive)
+def images_in_dir(dirpath, patterns=IMAGE_TYPES, recursive=False):
+    images = []
+    for root, dirs, files in os.walk(dirpath):
+        dirs.sort()
+        for name in sorted(files):
+            for pattern in patterns:
+                if fnmatch.fnmatch(name.lower(), pattern.lower()):
+                    images.append(os.path.join(root, name))
+                    break
+        if not recursive:
+            break
+    return images
+
+
+### Number of worker processes to use when none is given
+def default_workers():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+### Report a stage of a file as it starts, or stop if the batch was cancelled
+def start_stage(file_in, stage, progress=None, cancel=None):
+    # progress is a queue that gets (file_in, stage), cancel an event that is
+    # set to cancel; both can be shared with worker processes
+    if cancel is not None and cancel.is_set():
+        raise Cancelled(file_in)
+    if progress is not None:
+        progress.put((file_in, stage))
+
+
+### Run the chosen stages of the pipeline on one image file
+def run_pipeline(file_in, out_path, formatted, stages=STAGES, **options):
+    # options are the keyword arguments of analyze; returns the outputs
+    return analyze(file_in, out_path, formatted, stages, **options)[0]
+
+
+### Analyze an image file, returning its outputs and its deferred plots
+def analyze(file_in, out_path, formatted, stages=STAGES, tile_size=None,
+            workers=1, scratch_dir=None, stack=False, label_3d=False,
+            cache_dir=None, cache_size=CACHE_SIZE, progress=None,
+            cancel=None, profile=False, results_dir=None, all_widths='lines',
+            plots=True, thumbnails=False, defer_plots=False, page=0):
+    # formatted is the list made by Functions.formatValues from a preset;
+    # page is the page of a multi-page file that is analyzed (counting from
+    # 0); with a tile_size the image is processed in tiles on workers
+    # processes.
+    # With stack the file's pages are analyzed as one stack and the names of
+    # the stack and cells tables are the outputs instead.  With a cache_dir
+    # the image processing results are kept there (see cww_cache) and reused.
+    # progress and cancel are as for start_stage ('process' is the image
+    # processing stage).  With profile the stages' timings and memory are
+    # saved to profile_<name>.json next to the tables (see cww_profile), even
+    # if the file fails.  With a results_dir the tables go to the results
+    # store there (see cww_results) instead of files of their own; plots are
+    # still saved to out_path.  all_widths is the format of the all_widths_
+    # table (see write_all_widths_tsv).
+    # The plots ('plot' stage, and the distribution plot of the 'widths'
+    # stage) are drawn once the tables are written, small with thumbnails,
+    # and not at all without plots.  With defer_plots they are not drawn but
+    # saved as a plot job for render_in_worker (see cww_plots); the job is
+    # None if there is nothing to draw.
+    (file_out, png_name) = name_files(file_in, out_path)
+    recorder = cww_profile.Profile(file_in) if profile else None
+    try:
+        with cww_profile.profiling(recorder):
+            outputs, job = run_stages(file_in, file_out, png_name, formatted,
+                                      stages, tile_size, workers,
+                                      scratch_dir, stack, label_3d,
+                                      cache_dir, cache_size, progress,
+                                      cancel, results_dir, all_widths,
+                                      plots, thumbnails, page)
+            if job is not None and defer_plots:
+                job = defer(job)
+            elif job is not None:
+                start_stage(file_in, 'plot', progress, cancel)
+                with cww_profile.stage('plot'):
+                    render(job)
+                job = None
+        return outputs, job
+    finally:
+        if recorder is not None:
+            recorder.save(cww_profile.profile_file(file_out))
+
+
+### The stages of analyze, with the output files already named
+def run_stages(file_in, file_out, png_name, formatted, stages, tile_size,
+               workers, scratch_dir, stack, label_3d, cache_dir, cache_size,
+               progress, cancel, results_dir=None, all_widths='lines',
+               plots=True, thumbnails=False, page=0):
+    # returns the outputs and the plot job (see cww_plots), or None
+    start_stage(file_in, 'stack' if stack else 'process', progress, cancel)
+    if stack and results_dir:
+        raise ValueError("stacks are not written to a results store")
+    if stack:
+        with cww_profile.stage('stack'):
+            return (process_stack(file_in, file_out, *formatted[:8],
+                                  width_mode=formatted[8], label_3d=label_3d,
+                                  stages=stages),
+                    None)
+    if tile_size:
+        (im_raw, labels_open, y_center, x_center,
+         contours) = process_image_tiled(file_in, png_name, *formatted[:8],
+                                         page=page, tile_size=tile_size,
+                                         workers=workers,
+                                         scratch_dir=scratch_dir)
+    elif cache_dir:
+        (im_raw, labels_open, y_center, x_center,
+         contours) = cached_process_image(ImageCache(cache_dir, cache_size),
+                                          file_in, png_name, *formatted[:8],
+                                          page=page)
+    else:
+        (im_raw, labels_open, y_center, x_center,
+         contours) = process_image(file_in, png_name, *formatted[:8],
+                                   page=page)
+    store = None
+    if results_dir:
+        store = ResultStore(results_dir)
+        store.put('images', image_name(file_out),
+                  image_row(file_in, im_raw, labels_open, formatted))
+    job = None
+    if plots and ('widths' in stages or 'plot' in stages):
+        job = plot_job(png_name, thumbnails)
+    if 'widths' in stages:
+        start_stage(file_in, 'widths', progress, cancel)
+        pixel_count, object_count = cell_wall_analysis(
+            formatted[4], labels_open, file_out, png_name, formatted[8],
+            plot=False, tile_size=tile_size, workers=workers, store=store,
+            all_widths=all_widths)
+        if job is not None:
+            add_distribution(job, pixel_count, object_count, formatted[4])
+    if 'area' in stages:
+        start_stage(file_in, 'area', progress, cancel)
+        area_perim(formatted[5], formatted[6], labels_open, contours,
+                   file_out, store)
+    if 'plot' in stages and job is not None:
+        add_image(job, im_raw, labels_open, y_center, x_center, contours)
+    return (file_out, png_name), job
+
+
+### Call function(file_in, ...), returning (file_in, its result, error)
+def call_safely(function, file_in, *args, **options):
+    # error is None, or the traceback text if the call failed (and the result
+    # None); a cancelled batch is not an error of the file, so Cancelled is
+    # raised
+    try:
+        return (file_in, function(file_in, *args, **options), None)
+    except Cancelled:
+        close_figures()
+        raise
+    except Exception:
+        return (file_in, None, traceback.format_exc())
+
+
+### run_pipeline that returns the error instead of raising it
+def run_safely(file_in, out_path, formatted, stages=STAGES, **options):
+    # options are the keyword arguments of analyze
+    return call_safely(run_pipeline, file_in, out_path, formatted, stages,
+                       **options)
+
+
+### analyze in a pool worker, returning (file_in, (outputs, job), error)
+def analyze_in_worker(file_in, out_path, formatted, stages=STAGES,
+                      **options):
+    # the job is the file's deferred plots, for render_in_worker
+    return call_safely(analyze, file_in, out_path, formatted, stages,
+                       defer_plots=True, **options)
+
+
+### Draw a file's deferred plots in a pool worker, returning the error if any
+def render_in_worker(file_in, job, progress=None, cancel=None,
+                     profile_path=None):
+    # with a profile_path the time of drawing is added to the file's profile;
+    # the job's file is removed even if it is never drawn (e.g. cancelled)
+    try:
+        use_agg()
+        start_stage(file_in, 'plot', progress, cancel)
+        recorder = cww_profile.Profile(file_in) if profile_path else None
+        with cww_profile.profiling(recorder):
+            with cww_profile.stage('plot'):
+                try:
+                    render(job)
+                    error = None
+                except Exception:
+                    error = traceback.format_exc()
+        if recorder is not None and os.path.exists(profile_path):
+            cww_profile.add_to_file(recorder, profile_path)
+        return error
+    finally:
+        discard(job)
+
+
+### Join the chunks of a batch's results store, if it has one (see cww_results)
+def close_store(results_dir):
+    if results_dir:
+        ResultStore(results_dir).close()
+
+
+### Run the pipeline on every file, yielding (file_in, outputs, error)
+def batch_process(file_list, out_path, formatted, stages=STAGES,
+                  workers=None, ordered=True, tile_size=None,
+                  scratch_dir=None, stack=False, label_3d=False,
+                  cache_dir=None, cache_size=CACHE_SIZE, separate=False,
+                  progress=None, cancel=None, profile=False,
+                  results_dir=None, all_widths='lines', plots=True,
+                  thumbnails=False, page=0):
+    # outputs is the (file_out, png_name) pair from name_files (the stack and
+    # cells tables with stack) and error is None, or the traceback text if
+    # the file failed.  With ordered=False results are yielded as they finish
+    # instead of in file order.  With separate, even a single worker runs in
+    # its own process (where plots are only saved), so a program showing
+    # plots on screen can run the batch on a thread.  progress and cancel are
+    # as for start_stage; once cancel is set Cancelled is raised, and files
+    # not yet started are never run.  With profile every file's profile is
+    # saved, and with a results_dir all files' tables go to the results store
+    # there (see analyze), joined into a file per table once every file is
+    # done.  all_widths, plots, thumbnails and page are as for analyze.  On a
+    # worker pool each file's plots are drawn by a task of their own once its
+    # tables are written, ahead of the files not yet started; a file is done
+    # (and yielded) once its plots are drawn.
+    if workers is None:
+        workers = default_workers()
+    options = {'stack': stack, 'label_3d': label_3d, 'cache_dir': cache_dir,
+               'cache_size': cache_size, 'progress': progress,
+               'cancel': cancel, 'profile': profile,
+               'results_dir': results_dir, 'all_widths': all_widths,
+               'plots': plots, 'thumbnails': thumbnails, 'page': page}
+    if tile_size:
+        for file_in in file_list:
+            yield run_safely(file_in, out_path, formatted, stages,
+                             tile_size=tile_size, workers=workers,
+                             scratch_dir=scratch_dir, **options)
+        close_store(results_dir)
+        return
+    workers = min(workers, len(file_list))
+    if (workers <= 1 and not separate) or ProcessPoolExecutor is None:
+        for file_in in file_list:
+            yield run_safely(file_in, out_path, formatted, stages, **options)
+        close_store(results_dir)
+        return
+
+    to_start = iter(file_list)
+    waiting = list(file_list)   # files not yet yielded, in order
+    running = {}                # future: the file it analyzes or draws
+    renders = set()             # the futures that draw plots
+    jobs = {}                   # file: its deferred plots, until drawn
+    outputs = {}                # file: its outputs, while its plots are drawn
+    done = OrderedDict()        # file: its result, once finished
+    pool = ProcessPoolExecutor(max(workers, 1))
+    try:
+        while True:
+            # only as many files are started as there are workers, so the
+            # plots of the files analyzed go ahead of the files not started
+            while len(running) < workers:
+                file_in = next(to_start, None)
+                if file_in is None:
+                    break
+                running[pool.submit(analyze_in_worker, file_in, out_path,
+                                    formatted, stages, **options)] = file_in
+            if not running:
+                break
+            for future in wait(running, return_when=FIRST_COMPLETED)[0]:
+                file_in = running.pop(future)
+                result = error = None
+                try:
+                    result = future.result()
+                except Cancelled:
+                    raise
+                except Exception:  # the worker died (e.g. out of memory)
+                    error = traceback.format_exc()
+                if future in renders:   # result is the error drawing
+                    renders.discard(future)
+                    del jobs[file_in]
+                    done[file_in] = (file_in, outputs.pop(file_in),
+                                     error or result)
+                    continue
+                if error is None:
+                    (file_in, analyzed, error) = result
+                if error is not None:
+                    done[file_in] = (file_in, None, error)
+                elif analyzed[1] is None:   # no plots to draw
+                    done[file_in] = (file_in, analyzed[0], None)
+                else:
+                    (outputs[file_in], jobs[file_in]) = analyzed
+                    profile_path = None
+                    if profile:
+                        profile_path = cww_profile.profile_file(
+                            outputs[file_in][0])
+                    render = pool.submit(render_in_worker, file_in,
+                                         jobs[file_in], progress, cancel,
+                                         profile_path)
+                    running[render] = file_in
+                    renders.add(render)
+            while done and (not ordered or waiting[0] in done):
+                file_in = waiting[0] if ordered else next(iter(done))
+                waiting.remove(file_in)
+                yield done.pop(file_in)
+        close_store(results_dir)
+    finally:   # cancelled, or the caller stopped early
+        for future in running:
+            future.cancel()
+        pool.shutdown()
+        for job in jobs.values():   # plots that were never drawn
+            discard(job)
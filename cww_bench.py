@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+# encoding: utf-8
+###############################################################################
+#  Benchmarks for pyCWW on synthetic cell images of known wall width.         #
+#  Times the public functions of cell_wall_erosion_fxn.py across image sizes, #
+#  checks every width engine against the known widths, and writes the        #
+#  results as JSON, optionally compared with an earlier run.                  #
+#                                                                             #
+#  python cww_bench.py                                                        #
+#  python cww_bench.py --sizes 512,2048 --wall-width 8 -o after.json          #
+#  python cww_bench.py -o after.json --baseline before.json                   #
+#  python cww_bench.py --imports --sizes ""                                   #
+###############################################################################
+
+# The synthetic images are Voronoi tessellations: cells grown around seeds on a
+# jittered grid (cell_size pixels apart), separated by walls exactly
+# wall_width pixels thick (every pixel closer than wall_width / 2 to the
+# bisector of its two nearest seeds is wall), drawn dark cells on bright walls
+# with gaussian noise, as in confocal images of stained walls.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+# plots are only ever saved to files by the benchmarks
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+import numpy as np
+from scipy.ndimage import measurements
+from scipy.spatial import cKDTree
+from PIL import Image
+
+from cww_functions import histeq
+from cell_wall_erosion_fxn import (name_files, process_image, area_perim,
+                                   cell_wall_widths, cell_aggregates)
+from cww_draw import plot_image
+from cww_widths import WIDTH_MODES, wall_widths
+
+# Grey levels of the cells and of the walls between them
+CELL_GREY = 60
+WALL_GREY = 190
+
+# Image sizes benchmarked when none are given (pixels along each side)
+SIZES = (256, 512, 1024, 2048)
+
+# Functions timed, in the order they run
+FUNCTIONS = ('histeq', 'process_image', 'area_perim', 'cell_wall_widths',
+             'cell_aggregates', 'plot_image')
+
+# Settings the synthetic images are processed with, as from format_values
+# (the threshold is halfway between the cell and wall grey levels)
+BENCH_SETTINGS = [(CELL_GREY + WALL_GREY) // 2, 1, 1, 1, 15, 3000, 350,
+                  [[1, 1, 1], [1, 1, 1], [1, 1, 1]], 'dilation']
+
+# Modules timed by --imports: the analysis, the command line and the plots
+IMPORTS = ('cww_functions', 'cell_wall_erosion_fxn', 'cww_batch', 'pycww',
+           'cww_draw')
+
+# Columns of the pair tables every width engine must agree on (all of them:
+# the engines give a pixel as far from two cells to the same one)
+PAIR_COLUMNS = ('label_a', 'label_b', 'width_px', 'contact_x', 'contact_y')
+
+# A run is slower than its baseline past this ratio of the best times
+TOLERANCE = 1.25
+
+
+### Synthetic image of Voronoi cells with walls of a known width
+def synthetic_cells(size, cell_size=40, wall_width=6, noise=10.0, seed=0):
+    # returns the 8-bit image and the labels of the cells in it, labeled as
+    # measurements.label would label the noise-free image
+    rng = np.random.RandomState(seed)
+    per_side = int(np.ceil(size / float(cell_size)))
+    grid = np.mgrid[0:per_side, 0:per_side].reshape(2, -1).T
+    seeds = (grid + 0.5 + rng.uniform(-0.35, 0.35, grid.shape)) * cell_size
+    tree = cKDTree(seeds)
+    cells = np.zeros((size, size), bool)
+    for top in xrange(0, size, 256):   # a band of rows at a time
+        bottom = min(top + 256, size)
+        points = np.mgrid[top:bottom, 0:size].reshape(2, -1).T
+        distances, nearest = tree.query(points, k=2)
+        apart = seeds[nearest[:, 1]] - seeds[nearest[:, 0]]
+        from_wall = ((distances[:, 1] ** 2 - distances[:, 0] ** 2) /
+                     (2 * np.hypot(apart[:, 0], apart[:, 1])))
+        cells[top:bottom] = (from_wall >= wall_width / 2.0).reshape(
+            bottom - top, size)
+    image = np.where(cells, CELL_GREY, WALL_GREY) + rng.normal(0, noise,
+                                                               cells.shape)
+    image = np.clip(np.round(image), 0, 255).astype(np.uint8)
+    return image, measurements.label(cells)[0]
+
+
+### Send whatever is printed to nowhere while timing
+@contextlib.contextmanager
+def quiet():
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+### Seconds each of repeat calls of func took (the last call's result too)
+def time_call(func, repeat=3):
+    times = []
+    with quiet():
+        for i in xrange(repeat):
+            start = time.time()
+            result = func()
+            times.append(time.time() - start)
+    return times, result
+
+
+### Result record of a timed function
+def timing(function, size, times, **fields):
+    record = {'function': function, 'size': size, 'times': times,
+              'best': min(times), 'mean': sum(times) / len(times)}
+    record.update(fields)
+    return record
+
+
+### Time the chosen functions on one synthetic image
+def bench_size(size, work_dir, cell_size=40, wall_width=6, noise=10.0,
+               functions=FUNCTIONS, width_modes=WIDTH_MODES, repeat=3):
+    image, truth = synthetic_cells(size, cell_size, wall_width, noise)
+    file_in = os.path.join(work_dir, "synthetic_%d.tif" % size)
+    Image.fromarray(image).save(file_in)
+    with quiet():
+        (file_out, png_name) = name_files(file_in, work_dir)
+    settings = BENCH_SETTINGS
+    fields = {'cells': int(truth.max())}
+    records = []
+
+    if 'histeq' in functions:
+        times, result = time_call(lambda: histeq(image), repeat)
+        records.append(timing('histeq', size, times, **fields))
+    # the functions after process_image work on its results
+    times, processed = time_call(lambda: process_image(file_in, png_name,
+                                                       *settings[:8]),
+                                 repeat if 'process_image' in functions else 1)
+    (im_raw, labels_open, y_center, x_center, contours) = processed
+    if 'process_image' in functions:
+        records.append(timing('process_image', size, times,
+                              objects=int(labels_open.max()), **fields))
+    if 'area_perim' in functions:
+        times, result = time_call(lambda: area_perim(settings[5], settings[6],
+                                                     labels_open, contours,
+                                                     file_out), repeat)
+        records.append(timing('area_perim', size, times, **fields))
+    for mode in width_modes:
+        if 'cell_wall_widths' in functions:
+            times, result = time_call(lambda: cell_wall_widths(
+                settings[4], labels_open, file_out, png_name, mode), repeat)
+            records.append(timing('cell_wall_widths', size, times,
+                                  width_mode=mode, **fields))
+        if 'cell_aggregates' in functions:
+            times, result = time_call(lambda: cell_aggregates(
+                settings[4], labels_open, file_out, png_name, mode), repeat)
+            plt.close('all')
+            records.append(timing('cell_aggregates', size, times,
+                                  width_mode=mode, **fields))
+    if 'plot_image' in functions:
+        def plot():
+            plot_image(im_raw, labels_open, labels_open, y_center, x_center,
+                       contours, png_name, False)
+            plt.close('all')
+        times, result = time_call(plot, repeat)
+        records.append(timing('plot_image', size, times, **fields))
+
+    records.extend(check_widths(truth, size, wall_width, width_modes))
+    records.append(check_the_check(truth, size, wall_width))
+    return records
+
+
+### Seconds to import a module in a new python, and if it loaded matplotlib
+def import_time(module, repeat=3):
+    # only the import is timed, not the start of python itself
+    code = ("import sys, time; sys.path.insert(0, %r); start = time.time(); "
+            "import %s; print time.time() - start, "
+            "'matplotlib' in sys.modules" %
+            (os.path.dirname(os.path.abspath(__file__)), module))
+    times = []
+    for i in xrange(repeat):
+        seconds, loaded = subprocess.check_output(
+            [sys.executable, '-c', code]).split()
+        times.append(float(seconds))
+    return timing('import ' + module, 0, times, matplotlib=loaded == 'True')
+
+
+### Check the wall widths every engine finds against the known wall width
+def check_widths(truth, size, wall_width, width_modes=WIDTH_MODES):
+    # the widths come from the noise-free labels, so they only depend on the
+    # engine.  Widths are measured in steps of 2 pixels and walls at an angle
+    # to the pixel grid come out a step wider or narrower, so a check passes
+    # when the median width is the wall width and every engine finds the same
+    # merge counts as the first, and the same pairs as the first engine with
+    # a pair table (the dilation engine only counts, so its widths are those
+    # of the walls it merged across)
+    dilation_iterations = wall_width + 5
+    reference = None
+    first_pairs = None
+    records = []
+    for mode in width_modes:
+        merged, pairs = wall_widths(dilation_iterations, truth, mode)
+        if reference is None:
+            reference = merged
+        if first_pairs is None:
+            first_pairs = pairs
+        records.append(width_record(size, mode, wall_width,
+                                    dilation_iterations, merged, pairs,
+                                    reference, first_pairs))
+    return records
+
+
+### Check record of one engine's widths, against the known wall width and
+### the counts and pairs (or None) of the engine it is compared with
+def width_record(size, mode, wall_width, dilation_iterations, merged, pairs,
+                 reference, reference_pairs):
+    if pairs is None:
+        widths = np.repeat(np.arange(2, dilation_iterations * 2, 2), merged)
+    else:
+        widths = pairs['width_px']
+    same = (list(merged) == list(reference) and
+            (pairs is None or reference_pairs is None or
+             same_pairs(pairs, reference_pairs)))
+    median = float(np.median(widths)) if len(widths) else None
+    return {'check': 'wall_widths', 'size': size, 'width_mode': mode,
+            'wall_width': wall_width, 'walls': len(widths),
+            'median_width': median,
+            'within_2px': float(np.mean(np.abs(widths - wall_width) <= 2))
+                          if len(widths) else None,
+            'same_as_first_mode': bool(same),
+            'ok': bool(same and median == wall_width)}
+
+
+### True if two pair tables have the same rows in every column compared
+def same_pairs(pairs, other):
+    for key in PAIR_COLUMNS:
+        if not np.array_equal(pairs[key], other[key]):
+            return False
+    return True
+
+
+### Check that the widths check fails when it should
+def check_the_check(truth, size, wall_width):
+    # a wrong wall width, a pair table missing a wall and counts missing a
+    # merge must each fail width_record; ok only if all three did
+    dilation_iterations = wall_width + 5
+    merged, pairs = wall_widths(dilation_iterations, truth, 'distance')
+    fewer = dict((key, column[:-1]) for key, column in pairs.items())
+    lost = list(merged)
+    lost[lost.index(max(lost))] -= 1
+    failed = [not width_record(size, 'distance', wall, dilation_iterations,
+                               counts, table, merged, pairs)['ok']
+              for wall, counts, table in ((wall_width + 2, merged, pairs),
+                                          (wall_width, merged, fewer),
+                                          (wall_width, lost, pairs))]
+    return {'check': 'check_fails', 'size': size, 'failed': failed,
+            'ok': all(failed)}
+
+
+### Key matching a timing record with the same timing of another run
+def record_key(record, settings):
+    return (record['function'], record['size'], record.get('width_mode'),
+            settings['cell_size'], settings['wall_width'], settings['noise'])
+
+
+### Timings slower than in baseline past tolerance, as (record, ratio) pairs
+def regressions(results, baseline, tolerance=TOLERANCE):
+    before = dict((record_key(r, baseline['settings']), r)
+                  for r in baseline['results'] if 'function' in r)
+    slower = []
+    for record in results['results']:
+        if 'function' not in record:
+            continue
+        old = before.get(record_key(record, results['settings']))
+        if old is not None and old['best'] > 0:
+            ratio = record['best'] / old['best']
+            if ratio > tolerance:
+                slower.append((record, ratio))
+    return slower
+
+
+### Comma separated list of items of type kind
+def comma_list(kind):
+    def parse(text):
+        try:
+            return [kind(item) for item in text.split(',') if item.strip()]
+        except ValueError:
+            raise argparse.ArgumentTypeError("not a comma separated list: %s"
+                                             % text)
+    return parse
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='cww_bench',
+        description="Time the pyCWW functions on synthetic cell images and "
+                    "check the wall width engines against the known widths.")
+    parser.add_argument('--sizes', type=comma_list(int), default=list(SIZES),
+                        help="comma separated image sizes in pixels "
+                             "(default: %s)" % ','.join(map(str, SIZES)))
+    parser.add_argument('--cell-size', type=int, default=40,
+                        help="distance between cells in pixels "
+                             "(default: %(default)s)")
+    parser.add_argument('--wall-width', type=int, default=6,
+                        help="wall width in pixels, an even number "
+                             "(default: %(default)s)")
+    parser.add_argument('--noise', type=float, default=10.0,
+                        help="standard deviation of the noise in grey levels "
+                             "(default: %(default)s)")
+    parser.add_argument('--functions', type=comma_list(str),
+                        default=list(FUNCTIONS),
+                        help="comma separated functions to time "
+                             "(default: all)")
+    parser.add_argument('--width-modes', type=comma_list(str),
+                        default=list(WIDTH_MODES),
+                        help="comma separated width engines to time and "
+                             "check (default: all)")
+    parser.add_argument('--imports', action='store_true',
+                        help="also time importing the main modules, each in "
+                             "a new python")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="times each function is run; the best time is "
+                             "compared (default: %(default)s)")
+    parser.add_argument('-o', '--output',
+                        help="write the results to this JSON file")
+    parser.add_argument('--baseline', metavar='JSON',
+                        help="results of an earlier run to compare with; "
+                             "exits with 1 if a function got slower")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="slowdown ratio counted as slower with "
+                             "--baseline (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.wall_width < 2 or args.wall_width % 2:
+        parser.error("--wall-width must be an even number of pixels")
+    for function in args.functions:
+        if function not in FUNCTIONS:
+            parser.error("unknown function %s (choose from %s)" %
+                         (function, ', '.join(FUNCTIONS)))
+    for mode in args.width_modes:
+        if mode not in WIDTH_MODES:
+            parser.error("unknown width mode %s (choose from %s)" %
+                         (mode, ', '.join(WIDTH_MODES)))
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    settings = {'cell_size': args.cell_size, 'wall_width': args.wall_width,
+                'noise': args.noise, 'repeat': args.repeat}
+    results = {'settings': settings,
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'machine': platform.machine(),
+               'results': []}
+    work_dir = tempfile.mkdtemp(prefix='cww_bench')
+    try:
+        for size in args.sizes:
+            records = bench_size(size, work_dir, args.cell_size,
+                                 args.wall_width, args.noise, args.functions,
+                                 args.width_modes, args.repeat)
+            for record in records:
+                if 'function' in record:
+                    print "%-17s %5d px %-12s %8.3f s" % (
+                        record['function'], size,
+                        record.get('width_mode', ''), record['best'])
+                elif record['check'] == 'check_fails':
+                    print "%-17s %5d px %-12s %s" % (
+                        'check self-test', size, '',
+                        'fails on bad widths' if record['ok'] else
+                        'FAILED, passes bad widths')
+                else:
+                    print "%-17s %5d px %-12s median %s px, %d%% within " \
+                          "2 px%s" % (
+                              'widths check', size, record['width_mode'],
+                              record['median_width'],
+                              round(100 * (record['within_2px'] or 0)),
+                              '' if record['ok'] else '  FAILED')
+            results['results'].extend(records)
+        if args.imports:
+            for module in IMPORTS:
+                record = import_time(module, args.repeat)
+                print "%-30s %12.3f s  %s" % (
+                    record['function'], record['best'],
+                    'loads matplotlib' if record['matplotlib'] else '')
+                results['results'].append(record)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    status = 0
+    if not all(r['ok'] for r in results['results'] if 'check' in r):
+        print "Wall width check failed"
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for record, ratio in regressions(results, baseline, args.tolerance):
+            print "Slower: %s %d px %s %.2fx" % (
+                record['function'], record['size'],
+                record.get('width_mode', ''), ratio)
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# On-disk cache of process_image results, so running the analysis again on the
+# same image with the same settings skips the image processing
+#
+# Each entry is a compressed .npz of the labels, contours and centroids that
+# process_image returned, named by a hash of the image file's contents plus the
+# settings process_image uses (threshold, blur, opening, closing, structuring
+# element and page).  Changing only the dilation iterations, the cutoffs or the
+# width engine reuses the entry.  Entries are written to a temporary file and
+# renamed into place, so workers sharing a cache never read a partial entry,
+# and the least recently used entries are removed when the cache grows past
+# its size limit.
+
+import os
+import glob
+import hashlib
+import numpy as np
+
+from cww_output import save_npz
+
+# Cache size limit used when none is given, in bytes
+CACHE_SIZE = 1024 ** 3
+
+# Changed whenever what process_image returns for the same settings changes,
+# so entries from older versions are never used
+CACHE_VERSION = 1
+
+# Digests of files already hashed by this process, by (path, size, mtime)
+file_digests = {}
+
+
+### Hash of a file's contents, read a megabyte at a time
+def file_digest(file_in):
+    stat = os.stat(file_in)
+    known = (os.path.abspath(file_in), stat.st_size, stat.st_mtime)
+    if known not in file_digests:
+        digest = hashlib.sha1()
+        with open(file_in, 'rb') as f:
+            for block in iter(lambda: f.read(1024 ** 2), b''):
+                digest.update(block)
+        file_digests[known] = digest.hexdigest()
+    return file_digests[known]
+
+
+### Cache key for process_image run on file_in with these settings
+def image_key(file_in, threshold, gauss_blur, binary_open_iterations,
+              binary_close_iterations, structuring_element, page=0):
+    settings = (CACHE_VERSION, str(threshold), float(gauss_blur),
+                int(binary_open_iterations), int(binary_close_iterations),
+                [[int(v) for v in row] for row in structuring_element],
+                int(page))
+    return hashlib.sha1(file_digest(file_in) +
+                        repr(settings).encode()).hexdigest()
+
+
+### Directory of cached arrays, kept under a size limit
+class ImageCache(object):
+    def __init__(self, directory, max_bytes=CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # made by another worker in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    # Arrays stored under key as a dict, or None if there are none
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with np.load(path) as stored:
+                arrays = dict((name, stored[name]) for name in stored.files)
+            os.utime(path, None)   # now the most recently used
+        except (IOError, OSError, ValueError):  # missing, evicted or damaged
+            return None
+        return arrays
+
+    # Store a dict of arrays under key, then make room for it
+    def put(self, key, arrays):
+        save_npz(self.path(key), arrays)
+        self.evict()
+
+    # Remove the least recently used entries until the cache fits its limit
+    def evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.npz')):
+            try:
+                stat = os.stat(path)
+            except OSError:   # removed by another worker
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for (used, size, path) in entries)
+        for used, size, path in entries[:-1]:   # always keep the newest
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    # Remove every entry
+    def clear(self):
+        for path in glob.glob(os.path.join(self.directory, '*.npz')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,90 @@
+# Drawing the plots of pyCWW with matplotlib
+#
+# The only module of the analysis that imports matplotlib, so the numeric
+# modules (cww_functions, cell_wall_erosion_fxn and the batch running them)
+# load without it and a process only pays for matplotlib's start up once it
+# draws a plot (see cww_plots).  Every function saves its figure through
+# cww_output.
+
+from matplotlib import pyplot as plt
+
+from cww_output import save_figure
+from cww_log import logger
+
+
+### Scatterplot of yvalues over xvalues saved to saveas (at dpi, if given)
+#   the figure is closed once saved
+def plot_scatter(xvalues, yvalues, xlabel, ylabel, mycolor, saveas,
+                 saveformat, axis, title, dpi=None):
+    fig = plt.figure()
+    try:
+        plt.plot(xvalues, yvalues, linestyle='solid', c=mycolor, marker="o",
+                 markersize=2)
+        plt.ylabel(ylabel)
+        plt.xlabel(xlabel)
+        plt.axis(axis)
+        save_figure(fig, saveas, saveformat, dpi)
+    finally:
+        plt.close(fig)
+    logger.info("%s holds output file", saveas)
+
+
+### Plot the grey image with the cell centers, the contours and the labels
+#   modified from canny edge detector tutorial:
+#   http://scikit-image.org/docs/dev/auto_examples/plot_canny.html
+def plot_image(im_raw, labels_open, labels_open_eroded,
+               y_center, x_center, contours, png_name, show_image, dpi=None):
+    # Display results on image; x and y axis switched since
+    # (0,0) is in upper left corner
+    plt.figure(figsize=(10, 4))
+
+    # Subplot 1s
+    plt.subplot(131)
+    plt.imshow(im_raw, cmap=plt.cm.gray)
+    plt.axis('off')
+    plt.title('Grey image', fontsize=20)
+    plt.scatter(x=y_center, y=x_center, c='r', s=10)
+
+    # Subplot 2
+    plt.subplot(132)
+    plt.imshow(contours, cmap=plt.cm.gray)
+    plt.axis('off')
+    plt.title('Contours, binary erosion', fontsize=20)
+    # Annotate each cell object with its label (corresponds to edge array
+    # numbers output to keep track of which cells are being measured)
+    for i in range(1, len(labels_open) - 1):
+        label1 = labels_open[i]  # skip the background, label 0
+        #x = y_center[i-1]
+        #y = x_center[i-1]
+        #plt.annotate(label1,xy = (x,y), xytext = (x,y), color = 'r')
+
+    # Subplot 3
+    plt.subplot(133)
+    plt.imshow(labels_open_eroded, cmap=plt.cm.gray)
+    plt.axis('off')
+    plt.title('Post-dilation', fontsize=20)
+    #plt.scatter(x=y_center, y=x_center, c='r', s=10)
+
+    # Create Figure
+    plt.subplots_adjust(wspace=0.02, hspace=0.02, top=0.9,
+                        bottom=0.02, left=0.02, right=0.98)
+
+    save_figure(plt.gcf(), png_name, dpi=dpi)
+    if show_image:
+        plt.show()
+
+
+### Plot the number of cell walls of each width, as cell_wall_analysis found
+def plot_distribution(pixel_count, object_count, dilation_iterations,
+                      dist_png_name, dpi=None):
+    max_merged = 0
+    prev_merged = 0
+    for merged in object_count:
+        prev_merged += merged
+        if max_merged < prev_merged:  # for optimizing y axis in plot
+            max_merged = prev_merged
+    plot_scatter(pixel_count, object_count, "Cell Wall Pixel Width",
+                 "Number of Cell Walls", 'b', dist_png_name,
+                 "png", [0, (dilation_iterations * 2) + 5,
+                         0, max_merged + 5],
+                 "Distribution of Cell Wall Widths", dpi)
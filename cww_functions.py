@@ -1,24 +1,43 @@
 # File of functions for finding cell wall widths (and area and perimeter of cells)
 
+# (no matplotlib here, so the analysis loads without it; plots are in cww_draw)
 import numpy as np
-import scipy
 from scipy.ndimage import measurements, morphology, gaussian_filter
 #from scipy.cluster.vq import *
-from scipy.misc import imresize,imfilter
-from pylab import *
-from PIL import Image
-import re, getopt, sys
 from math import atan2
+from cww_log import logger
 
 
 # Function for histogram equalization (to increase image contrast); from Jan Erik Solem: Programming with Computer Vision pg. 24
 def histeq(im,nbr_bins=256):
-   imhist,bins = histogram(im.flatten(),nbr_bins,normed=True) #flatten to 2D array, setting bins for hist image
+   counts,bins = np.histogram(im.flatten(),nbr_bins) #flatten to 2D array, setting bins for hist image
+   imhist = counts/(counts*np.diff(bins)).sum() #normed histogram, as histogram(normed=True) computes it
    cdf = imhist.cumsum() #cumulative distribution function from hist cumulative sum
    cdf = 255*cdf/cdf[-1] #normalize values to lie between 0 and 1
-   im2 = interp(im.flatten(),bins[:-1],cdf) #linear interpolation of cdf to find new pixel values
+   im2 = np.interp(im.flatten(),bins[:-1],cdf) #linear interpolation of cdf to find new pixel values
    return im2.reshape(im.shape),cdf
 
+# Function for histogram equalization of 8-bit images as a 256-entry lookup table
+#   lut[v] is the value histeq gives grey level v, so lut[im] == histeq(im)[0]
+#   without any float copies of the image; counts[v] is the number of pixels at
+#   grey level v (so lut, counts is the histogram of the equalized image)
+def histeq_lut(im,nbr_bins=256):
+   counts = np.bincount(im.ravel(),minlength=256)   #one pass over the image
+   lut,cdf = counts_lut(counts,nbr_bins)
+   return lut,cdf,counts
+
+# Function for the histeq_lut lookup table from the grey level counts alone
+#   (e.g. counts summed over the tiles of an image too large to load at once)
+def counts_lut(counts,nbr_bins=256):
+   grey = np.flatnonzero(counts)
+   # same bins and bin counts as histogram(im.flatten(),nbr_bins)
+   bin_counts,bins = np.histogram(grey,nbr_bins,(grey[0],grey[-1]),weights=counts[grey])
+   imhist = bin_counts/(bin_counts*np.diff(bins)).sum()
+   cdf = imhist.cumsum()
+   cdf = 255*cdf/cdf[-1]
+   lut = np.interp(np.arange(256),bins[:-1],cdf)
+   return lut,cdf
+
 # Function to calculate distance between x,y coordinates
 def distance(a,b):    # a and b are x,y points
   dist = (np.linalg.norm(np.array(a) - np.array(b)))  # same as dist = dist = sqrt((a[0]-b[0])**2+(a[1]-b[1])**2) 
@@ -78,16 +97,19 @@ def sort_coord(xycoord):
   #print "Scoord",scoords
   return scoords
 
-# Function to make scatterplot in matlab
-from matplotlib import pyplot as plt    # matplotlib scatter plot fxn to test coordinate mapping
-def plot_scatter(xvalues,yvalues,xlabel,ylabel,mycolor,saveas,saveformat,axis,title):
-	fig = plt.figure()
-	plt.plot(xvalues, yvalues, linestyle='solid',c=mycolor, marker="o", markersize=2)
-	plt.ylabel(ylabel)
-	plt.xlabel(xlabel)
-	plt.axis(axis)
-	plt.savefig(saveas, format=saveformat)
-	print saveas, "holds output file"
-
+# Function to find the edge pixels of every labeled object without looping over pixels
+#   edges are pixels where contours == 0 (outside the eroded labels); they are
+#   grouped by label with a stable sort so each label keeps row-major order.
+#   Returns the sorted labels, an (N,2) array of x,y edge coordinates and an
+#   offsets array so the edges of labels[i] are coords[offsets[i]:offsets[i+1]]
+def label_edges(labels_open, contours):
+  xs, ys = np.nonzero(np.logical_not(contours))   # edge mask, row-major order
+  edge_labels = labels_open[xs, ys]
+  order = np.argsort(edge_labels, kind='mergesort')   # mergesort is stable
+  edge_labels = edge_labels[order]
+  coords = np.column_stack((xs[order], ys[order]))
+  labels, starts = np.unique(edge_labels, return_index=True)
+  offsets = np.append(starts, len(edge_labels))
+  return labels, coords, offsets
 
 ################## Main Program
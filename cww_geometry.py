@@ -0,0 +1,73 @@
+# Batched polygon functions for the area and perimeter of every cell at once
+#
+# Cells are passed in the ragged form returned by label_edges: one (N,2) array
+# of x,y edge coordinates for all cells, plus an offsets array so that the
+# points of cell i are coords[offsets[i]:offsets[i+1]].  Each function works on
+# all cells in a few whole-array passes instead of a Python loop per cell.
+
+import numpy as np
+
+
+### Index of the cell each point belongs to
+def segment_ids(offsets):
+    counts = np.diff(offsets)
+    return np.repeat(np.arange(len(counts)), counts)
+
+
+### Sort each cell's points by angle around its centroid (batched sort_coord)
+def sort_edges(coords, offsets):
+    # Same rules as sort_coord: the centroid is the integer mean of the
+    # coordinates, and points at an identical angle keep only the last one
+    # (sort_coord stores them in a dict keyed on the angle)
+    coords = np.asarray(coords, dtype=np.int64)
+    counts = np.diff(offsets)
+    seg = segment_ids(offsets)
+    sums = np.add.reduceat(coords, offsets[:-1], axis=0)
+    means = sums // counts[:, np.newaxis]
+    rel = coords - means[seg]
+    angles = np.arctan2(rel[:, 1], rel[:, 0])
+
+    # order by cell, then angle, then original position
+    order = np.lexsort((np.arange(len(coords)), angles, seg))
+    seg = seg[order]
+    angles = angles[order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[:-1] = (seg[1:] != seg[:-1]) | (angles[1:] != angles[:-1])
+    order = order[keep]
+
+    new_counts = np.bincount(seg[keep], minlength=len(counts))
+    new_offsets = np.zeros(len(counts) + 1, dtype=np.intp)
+    np.cumsum(new_counts, out=new_offsets[1:])
+    return coords[order], new_offsets
+
+
+### Index of the next vertex around each polygon (last wraps to first)
+def next_vertex(offsets):
+    nxt = np.arange(1, offsets[-1] + 1)
+    nxt[offsets[1:] - 1] = offsets[:-1]
+    return nxt
+
+
+### Shoelace area of each sorted polygon (batched area2D_Polygon)
+def polygon_areas(coords, offsets):
+    nxt = next_vertex(offsets)
+    cross = coords[:, 0] * coords[nxt, 1] - coords[:, 1] * coords[nxt, 0]
+    total = np.add.reduceat(cross, offsets[:-1]).astype(np.float64)
+    return np.abs(total / 2)
+
+
+### Perimeter of each sorted polygon, closed back to the first point
+def polygon_perimeters(coords, offsets):
+    nxt = next_vertex(offsets)
+    delta = coords[nxt] - coords
+    dist = np.sqrt((delta * delta).sum(axis=1).astype(np.float64))
+    return np.add.reduceat(dist, offsets[:-1])
+
+
+### Sort edge points and return (areas, perimeters) for every cell
+def area_perimeter(coords, offsets):
+    if len(offsets) < 2:  # no cells
+        return np.zeros(0), np.zeros(0)
+    scoords, soffsets = sort_edges(coords, offsets)
+    return (polygon_areas(scoords, soffsets),
+            polygon_perimeters(scoords, soffsets))
@@ -0,0 +1,123 @@
+# Running a batch on a background thread, with progress reports and cancelling
+#
+# A BatchJob runs cww_batch.batch_process on a thread of its own, so a GUI
+# stays responsive while the batch runs.  Every stage of every file reports as
+# it starts (through a queue the worker processes share) and every file as it
+# is done, each time with the throughput so far and an estimate of the time
+# left.  Cancelling stops each running file at its next stage, and files not
+# yet started are never run.
+
+import time
+import threading
+import traceback
+import multiprocessing
+
+from cww_batch import batch_process, Cancelled
+
+
+### Images per minute, and seconds left (None until a file is done)
+def throughput(done, total, elapsed):
+    if done == 0 or elapsed <= 0:
+        return 0.0, None
+    per_second = done / float(elapsed)
+    return per_second * 60, (total - done) / per_second
+
+
+### Seconds as h:mm:ss, or m:ss under an hour
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "%d:%02d:%02d" % (hours, minutes, seconds)
+    return "%d:%02d" % (minutes, seconds)
+
+
+### A batch running on a background thread
+class BatchJob(object):
+    # report is called with a status dict (see status) as each stage starts
+    # and each file is done, and finished with the (file_in, outputs, error)
+    # of every file done and whether the batch was cancelled, once it ends.
+    # Both are called on the job's threads, so a GUI passes them on with
+    # wx.CallAfter.  options are the keyword arguments of batch_process.
+    def __init__(self, file_list, out_path, formatted, stages, report,
+                 finished, **options):
+        self.file_list = list(file_list)
+        self.out_path = out_path
+        self.formatted = formatted
+        self.stages = stages
+        self.report = report
+        self.finished = finished
+        self.options = options
+        self.results = []
+        self.manager = None
+        self.events = None
+        self.cancelled = None
+        self.started = None
+        self.thread = None
+
+    # Start the batch; it runs until every file is done or it is cancelled
+    def start(self):
+        # the queue and the cancel event are shared with worker processes
+        # through a manager process
+        self.manager = multiprocessing.Manager()
+        self.events = self.manager.Queue()
+        self.cancelled = self.manager.Event()
+        self.started = time.time()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # Stop the batch at the next stage of each running file
+    def cancel(self):
+        if self.cancelled is not None:
+            self.cancelled.set()
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # Progress of the batch, with stage the stage file_in is starting (or
+    # 'done' when the file is done)
+    def status(self, file_in, stage):
+        done = len(self.results)
+        elapsed = time.time() - self.started
+        rate, left = throughput(done, len(self.file_list), elapsed)
+        return {'file': file_in,
+                'stage': stage,
+                'done': done,
+                'failed': sum(1 for r in self.results if r[2] is not None),
+                'total': len(self.file_list),
+                'elapsed': elapsed,
+                'rate': rate,    # images per minute
+                'left': left}    # seconds, or None if not known yet
+
+    # Pass the stages reported by the workers on to report, until None
+    def relay(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            self.report(self.status(*event))
+
+    def run(self):
+        relay = threading.Thread(target=self.relay)
+        relay.daemon = True
+        relay.start()
+        results = batch_process(self.file_list, self.out_path,
+                                self.formatted, self.stages, separate=True,
+                                progress=self.events, cancel=self.cancelled,
+                                **self.options)
+        try:
+            for result in results:
+                self.results.append(result)
+                self.report(self.status(result[0], 'done'))
+        except Cancelled:
+            pass
+        except Exception:   # e.g. the worker pool could not be started
+            self.results.append((None, None, traceback.format_exc()))
+        finally:
+            results.close()
+            self.events.put(None)
+            relay.join()
+            cancelled = self.cancelled.is_set()
+            self.manager.shutdown()
+            self.finished(self.results, cancelled)
@@ -0,0 +1,80 @@
+# Logging for pyCWW
+#
+# The modules log to the 'pycww' logger instead of printing.  Messages about a
+# whole image (threshold, number of objects, output files) are at INFO, and
+# messages about single cells or dilation steps are at DEBUG, through a
+# LimitedLog so an image with thousands of cells logs a few of them and how
+# many more there were.  Loops check whether DEBUG is on once, so at INFO and
+# above they do no console output at all.  Messages from batch worker
+# processes are prefixed with the worker's name, so the lines of files run at
+# the same time can be told apart.
+
+import sys
+import logging
+import multiprocessing
+
+logger = logging.getLogger('pycww')
+logger.addHandler(logging.NullHandler())   # quiet until setup_logging
+
+# Per-cell or per-step DEBUG messages logged for each image at most
+CELL_LOG_LIMIT = 20
+
+
+### Adds the worker's prefix to every record (empty in the main process)
+class WorkerPrefix(logging.Filter):
+    def filter(self, record):
+        name = multiprocessing.current_process().name
+        if name == 'MainProcess':
+            record.worker = ''
+        else:
+            record.worker = '[%s] ' % name
+        return True
+
+
+### Send the log to stream (stderr if none) from level up
+def setup_logging(level=logging.INFO, stream=None):
+    # called again, only the level and stream change; worker processes that
+    # are forked keep the parent's set up
+    for handler in list(logger.handlers):
+        if not isinstance(handler, logging.NullHandler):
+            logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.addFilter(WorkerPrefix())
+    if level <= logging.DEBUG:
+        form = '%(worker)s%(levelname)s: %(message)s'
+    else:
+        form = '%(worker)s%(message)s'
+    handler.setFormatter(logging.Formatter(form))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+### Log level for a number of -v and -q options (WARNING with neither)
+def verbosity_level(verbose=0, quiet=0):
+    levels = [logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR]
+    return levels[max(0, min(len(levels) - 1, 2 - verbose + quiet))]
+
+
+### DEBUG messages of a loop, only the first limit of them logged
+class LimitedLog(object):
+    def __init__(self, what, limit=CELL_LOG_LIMIT):
+        self.what = what   # what the messages are about, e.g. 'cells'
+        self.limit = limit
+        self.logged = 0
+        self.skipped = 0
+        self.enabled = logger.isEnabledFor(logging.DEBUG)
+
+    def debug(self, message, *args):
+        if not self.enabled:
+            return
+        if self.logged < self.limit:
+            logger.debug(message, *args)
+            self.logged += 1
+        else:
+            self.skipped += 1
+
+    # Log how many messages were not logged
+    def close(self):
+        if self.skipped:
+            logger.debug("... and %d more %s", self.skipped, self.what)
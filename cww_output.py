@@ -0,0 +1,113 @@
+# Writing the analysis's output files whole or not at all
+#
+# Every table, array file, profile and plot is written to a temporary file
+# next to it and renamed into place once it is complete (the way cww_cache
+# stores its entries), so a batch that is interrupted or fails part way never
+# leaves a truncated file that looks like a finished one; at worst a stray
+# .tmp file is left.  Tables are written in bulk: each row's fields are
+# joined in memory and a block of rows goes to the file in one write, instead
+# of a write per field.
+
+import os
+import tempfile
+import numpy as np
+
+# Rows of a table joined into each write
+BLOCK_ROWS = 4096
+
+# Temporary files are made readable only by their owner; the finished files
+# get the permissions a file opened the usual way would
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+### Rename temp to path, replacing any file there
+def replace_file(temp, path):
+    try:
+        os.rename(temp, path)
+    except OSError:   # Windows will not rename over an existing file
+        if not os.path.exists(path):
+            raise
+        os.remove(path)
+        os.rename(temp, path)
+
+
+### A file that only appears under its name once it is closed
+class AtomicFile(object):
+    # with AtomicFile(path) as f: f.write(...) renames the file into place
+    # if the block finishes, and removes it if the block raises
+    def __init__(self, path, mode='wb'):
+        self.path = path
+        directory, name = os.path.split(os.path.abspath(path))
+        handle, self.temp = tempfile.mkstemp('.tmp', '.' + name, directory,
+                                             text='b' not in mode)
+        self.file = os.fdopen(handle, mode)
+
+    def write(self, text):
+        self.file.write(text)
+
+    # Finish the file and give it its name
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        os.chmod(self.temp, 0o666 & ~UMASK)
+        replace_file(self.temp, self.path)
+
+    # Throw the file away, leaving any file already under its name
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temp):
+            os.remove(self.temp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, trace):
+        if kind is None:
+            self.close()
+        else:
+            self.discard()
+
+
+### Write lines of text to a file in blocks of BLOCK_ROWS lines
+def write_lines(output, lines):
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) == BLOCK_ROWS:
+            output.write('\n'.join(block) + '\n')
+            block = []
+    if block:
+        output.write('\n'.join(block) + '\n')
+
+
+### Write a table: its header line, then each row's fields joined by tabs
+def write_tsv(path, header, rows, mode='wb'):
+    # rows are sequences of field strings (see columns_rows)
+    with AtomicFile(path, mode) as output:
+        output.write(header + '\n')
+        write_lines(output, ('\t'.join(fields) for fields in rows))
+
+
+### Rows of fields from equal length columns (lists or arrays), as str
+def columns_rows(*columns):
+    return zip(*[[str(value) for value in np.asarray(column).tolist()]
+                 for column in columns])
+
+
+### Save arrays to a compressed .npz as np.savez_compressed does
+def save_npz(path, arrays):
+    with AtomicFile(path) as output:
+        np.savez_compressed(output.file, **arrays)
+
+
+### Save a matplotlib figure, in the format its file name ends in
+def save_figure(figure, path, form=None, dpi=None):
+    # dpi None is matplotlib's savefig.dpi setting
+    form = form or os.path.splitext(path)[1][1:] or 'png'
+    options = {'format': form}
+    if dpi is not None:
+        options['dpi'] = dpi
+    with AtomicFile(path) as output:
+        figure.savefig(output.file, **options)
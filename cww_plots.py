@@ -0,0 +1,139 @@
+# Drawing an image's plots once its tables are written
+#
+# The analysis of an image collects what its plots need (the image, its labels
+# and contours, the number of walls of each width) in a plot job instead of
+# drawing them as it goes, and the plots are drawn from the job once the
+# tables are written.  A batch on a worker pool saves each job to a compressed
+# temporary file next to its plots (see defer) and draws it on the pool as a
+# task of its own, removing the file once drawn or given up on, so drawing
+# plots overlaps the analysis of the next images instead of holding up the
+# worker.  With thumbnails the plots are drawn small, from the arrays cut down
+# to THUMBNAIL_PIXELS on their longest side, which takes a fraction of the
+# time for large images.  Every figure is closed once saved, even if it fails,
+# so a long batch does not gather figures.  The drawing itself is in cww_draw,
+# which render loads the first time it draws, so a process that draws no plots
+# never loads matplotlib.
+
+import os
+import sys
+import tempfile
+import numpy as np
+
+from cell_wall_erosion_fxn import distribution_file
+
+# Longest side of the images drawn in thumbnails, and their resolution
+THUMBNAIL_PIXELS = 256
+THUMBNAIL_DPI = 32   # the 10x4 inch image plot is 320x128 pixels
+
+
+### A plot job for the plots of an image (png_name is its plot's name)
+def plot_job(png_name, thumbnail=False):
+    return {'image': None, 'distribution': None, 'thumbnail': thumbnail,
+            'png_name': png_name, 'arrays': {}}
+
+
+### Add the processed image plot to a job
+def add_image(job, im_raw, labels_open, y_center, x_center, contours):
+    arrays = {'im_raw': im_raw, 'labels_open': labels_open,
+              'y_center': np.asarray(y_center, dtype=float),
+              'x_center': np.asarray(x_center, dtype=float),
+              'contours': contours}
+    if job['thumbnail']:
+        arrays = shrink(arrays)
+    job['arrays'].update(arrays)
+    job['image'] = job['png_name']
+
+
+### Add the wall width distribution plot to a job
+def add_distribution(job, pixel_count, object_count, dilation_iterations):
+    job['arrays'].update({'pixel_count': np.asarray(pixel_count),
+                          'object_count': np.asarray(object_count),
+                          'dilation_iterations':
+                              np.asarray(dilation_iterations)})
+    job['distribution'] = distribution_file(job['png_name'])
+
+
+### The image plot's arrays cut down to THUMBNAIL_PIXELS on the longest side
+def shrink(arrays):
+    step = -(-max(arrays['im_raw'].shape[:2]) // THUMBNAIL_PIXELS)
+    if step <= 1:
+        return arrays
+    shrunk = dict((name, arrays[name][::step, ::step])
+                  for name in ('im_raw', 'labels_open', 'contours'))
+    shrunk['y_center'] = arrays['y_center'] / step
+    shrunk['x_center'] = arrays['x_center'] / step
+    return shrunk
+
+
+### Save a job's arrays to a temporary file, for drawing in another process
+def defer(job, directory=None):
+    # the file is compressed (labels and contours shrink to a fraction) and
+    # in directory, by default the one the plots are saved to rather than
+    # the system's temporary directory, which may be small; the arrays are
+    # replaced with the name of the file, which is removed once the plots
+    # are drawn (or by discard)
+    if directory is None:
+        directory = os.path.dirname(job['png_name']) or '.'
+    handle, path = tempfile.mkstemp('.npz', '.plot_', directory)
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            np.savez_compressed(f, **job['arrays'])
+    except Exception:
+        os.remove(path)
+        raise
+    job = dict(job, arrays=None)
+    job['data'] = path
+    return job
+
+
+### Remove the temporary file of a deferred job that will not be drawn
+def discard(job):
+    try:
+        os.remove(job['data'])
+    except (KeyError, OSError):   # not deferred, or already drawn
+        pass
+
+
+### Close every figure, if matplotlib has been loaded at all
+def close_figures():
+    pyplot = sys.modules.get('matplotlib.pyplot')
+    if pyplot is not None:
+        pyplot.close('all')
+
+
+### Draw with the Agg backend (to files only) from now on in this process
+def use_agg():
+    pyplot = sys.modules.get('matplotlib.pyplot')
+    if pyplot is None:
+        import matplotlib
+        matplotlib.use('Agg')
+    elif pyplot.get_backend().lower() != 'agg':
+        pyplot.switch_backend('Agg')
+
+
+### Draw and save the plots of a job, closing every figure it opens
+def render(job):
+    # matplotlib is loaded here, the first time a plot is drawn
+    from cww_draw import plot_image, plot_distribution
+    if job.get('data'):
+        try:
+            with np.load(job['data']) as stored:
+                arrays = dict((name, stored[name]) for name in stored.files)
+        finally:
+            discard(job)
+    else:
+        arrays = job['arrays']
+    dpi = THUMBNAIL_DPI if job['thumbnail'] else None
+    if job['image']:
+        try:
+            plot_image(arrays['im_raw'], arrays['labels_open'],
+                       arrays['labels_open'], arrays['y_center'],
+                       arrays['x_center'], arrays['contours'], job['image'],
+                       False, dpi)
+        finally:
+            close_figures()
+    if job['distribution']:
+        plot_distribution(arrays['pixel_count'].tolist(),
+                          arrays['object_count'].tolist(),
+                          int(arrays['dilation_iterations']),
+                          job['distribution'], dpi)
@@ -0,0 +1,75 @@
+# Functions for reading pyCWW presets from config.xml (no GUI needed)
+#
+# Presets are kept as lists of the text values in config.xml, in this order
+# (the GUI indexes them the same way, e.g. presets[preset_choice][4]):
+
+import xml.etree.ElementTree as et
+from cww_threshold import parse_threshold
+from cww_widths import WIDTH_MODES
+
+PRESET_FIELDS = ('threshold', 'gauss_blur', 'binary_open_iterations',
+                 'binary_close_iterations', 'dilation_iterations',
+                 'area_cutoff', 'perimeter_cutoff', 'structuring_element',
+                 'width_mode')   # width_mode is optional ('dilation')
+
+
+### Read every preset in config.xml as {preset name: [value text, ...]}
+def read_presets(xml_file='config.xml'):
+    presets = {}
+    root = et.parse(xml_file).getroot()
+    for child in root:
+        presets[child.tag] = [value.text for value in child]
+    return presets
+
+
+### Parse a structuring element such as [[1,1,1],[1,1,1],[1,1,1]]
+def check_structure(elem):
+    # returns (success, message, rows of the element as strings)
+    msg = ""
+    elem = str(elem)
+    rtrn_array = []
+    if elem[0:2] == "[[":
+        brackets = elem.split("],[")
+        for i in brackets:
+            if i.startswith("[["):
+                rtrn_array.append(i[2:].strip(",").split(","))
+            elif i.endswith("]]"):
+                rtrn_array.append(i.strip("]]").split(","))
+            else:
+                rtrn_array.append(i.split(","))
+        success = True
+        msg = "good"
+    else:
+        msg = "Structuring element needs to be in the format:\n"
+        msg += "\t[[1,1,1],[1,1,1],[1,1,1]]"
+        success = False
+    return (success, msg, rtrn_array)
+
+
+### Convert a preset's text values to the arguments process_image expects
+def format_values(preset_values):
+    thresh = preset_values[0]
+    gauss = preset_values[1]
+    binO = preset_values[2]
+    binC = preset_values[3]
+    dil = preset_values[4]
+    area = preset_values[5]
+    perim = preset_values[6]
+    elem = preset_values[7]
+    if len(preset_values) > 8:
+        mode = preset_values[8]
+    else:
+        mode = 'dilation'
+    if mode not in WIDTH_MODES:
+        raise ValueError("width_mode must be one of %s, not %r" %
+                         (', '.join(WIDTH_MODES), mode))
+    thresh = parse_threshold(thresh)   # a number or a method name
+    gauss = int(gauss)
+    binO = int(binO)
+    binC = int(binC)
+    dil = int(dil)
+    area = int(area)
+    perim = int(perim)
+    # as integers, since the strings '0' and '1' would both count as True
+    elem = [[int(v) for v in row] for row in check_structure(elem)[2]]
+    return [thresh, gauss, binO, binC, dil, area, perim, elem, mode]
@@ -0,0 +1,80 @@
+# Functions for quick previews of a preset on reduced-resolution images
+#
+# An image pyramid halves the image size at each level (each pixel of a level
+# is the mean of 2 x 2 pixels of the level below).  The pipeline is run on a
+# small level first, with the preset's settings scaled to that level's pixel
+# size, then on each larger level up to the full image, so a preview appears
+# at once and is refined while the user looks at it (see cww_stages.Pipeline).
+
+import numpy as np
+
+# Levels are only made while both sides stay at least this many pixels
+MIN_LEVEL_SIZE = 64
+
+# The first preview is of the largest level no longer than this on any side
+PREVIEW_SIZE = 512
+
+
+### Half size image, each pixel the mean of 2 x 2 pixels (odd edges dropped)
+def halve(im):
+    rows = im.shape[0] // 2 * 2
+    cols = im.shape[1] // 2 * 2
+    total = (im[0:rows:2, 0:cols:2].astype(np.uint16) +
+             im[1:rows:2, 0:cols:2] + im[0:rows:2, 1:cols:2] +
+             im[1:rows:2, 1:cols:2])
+    return ((total + 2) // 4).astype(im.dtype)
+
+
+### Image pyramid of an 8-bit image, making levels only when asked for
+class Pyramid(object):
+    def __init__(self, im_raw, min_size=MIN_LEVEL_SIZE):
+        self.levels = [im_raw]
+        self.min_size = min_size
+
+    # Number of levels, including the full image (level 0)
+    def __len__(self):
+        count = 1
+        size = min(self.levels[0].shape[:2])
+        while size // 2 >= self.min_size:
+            size //= 2
+            count += 1
+        return count
+
+    # Image of level n (the smallest level if there are fewer levels)
+    def level(self, n):
+        n = min(n, len(self) - 1)
+        while len(self.levels) <= n:
+            self.levels.append(halve(self.levels[-1]))
+        return self.levels[n]
+
+
+### Level to preview first: the largest no longer than size on any side
+def first_level(pyramid, size=PREVIEW_SIZE):
+    longest = max(pyramid.levels[0].shape[:2])
+    level = 0
+    while longest > size and level < len(pyramid) - 1:
+        longest //= 2
+        level += 1
+    return level
+
+
+### Preset settings (as from format_values) scaled to a pyramid level
+def scale_settings(formatted, level):
+    # distances shrink by 2 per level and areas by 4; a setting that was at
+    # least one iteration stays at least one (0 iterations would mean repeat
+    # until nothing changes).  The threshold is kept, as equalization gives
+    # every level nearly the same histogram.
+    factor = 2 ** level
+    scaled = list(formatted)
+    scaled[1] = formatted[1] / float(factor)   # gauss_blur
+
+    def iterations(n):
+        if n > 0:
+            return max(1, int(round(n / float(factor))))
+        return n
+    scaled[2] = iterations(formatted[2])   # binary opening
+    scaled[3] = iterations(formatted[3])   # binary closing
+    scaled[4] = max(2, iterations(formatted[4]))   # dilation
+    scaled[5] = formatted[5] / float(factor ** 2)   # area_cutoff
+    scaled[6] = formatted[6] / float(factor)   # perimeter_cutoff
+    return scaled
@@ -0,0 +1,181 @@
+# Timing, memory and counters of the stages of each image's pipeline
+#
+# The pipeline's functions time their stages with 'with stage(name):' and add
+# up counters such as pixels and objects with count(name, n).  Both do nothing
+# unless a Profile is active (see profiling), so the functions cost the same
+# as before when no profile is asked for.  A stage records its wall clock and
+# CPU time (a stage with much less CPU than wall time was waiting on the
+# disk, or on worker processes, whose CPU time is not counted), the resident
+# memory after it and how much it raised the peak resident memory of the
+# process.  Stages run again add up.
+#
+# Each image's profile is saved as profile_<name>.json next to its tables, and
+# summarize adds the profiles of a batch together.  One profile is active per
+# process at a time; batch workers each have their own.
+
+import os
+import sys
+import json
+import time
+import contextlib
+from collections import OrderedDict
+from cww_output import AtomicFile
+try:
+    import resource
+except ImportError:  # not on Windows; peak memory is not recorded there
+    resource = None
+
+# The profile the stages are recorded in, if any (see profiling)
+active = None
+
+
+### Peak resident memory of this process so far, in MB (None if unknown)
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':   # bytes there, kilobytes elsewhere
+        return peak / 1024.0 ** 2
+    return peak / 1024.0
+
+
+### Resident memory of this process now, in MB (None if unknown)
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):  # not Linux
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024.0 ** 2
+
+
+### CPU time (user and system) of this process so far, in seconds
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+
+### Stage timings, memory and counters of one image
+class Profile(object):
+    def __init__(self, name=None):
+        self.name = name
+        self.stages = OrderedDict()   # name: totals, in the order first run
+        self.counters = OrderedDict()
+        self.started = time.time()
+        self.start_rss = current_rss()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start, start_cpu, start_peak = time.time(), cpu_time(), peak_rss()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, {
+                'calls': 0, 'seconds': 0.0, 'cpu_seconds': 0.0,
+                'rss_mb': None, 'peak_rise_mb': 0.0})
+            totals['calls'] += 1
+            totals['seconds'] += time.time() - start
+            totals['cpu_seconds'] += cpu_time() - start_cpu
+            totals['rss_mb'] = current_rss()
+            if start_peak is not None:
+                totals['peak_rise_mb'] += peak_rss() - start_peak
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # The profile as a dict ready to save as JSON
+    def as_dict(self):
+        return OrderedDict([('name', self.name),
+                            ('seconds', time.time() - self.started),
+                            ('start_rss_mb', self.start_rss),
+                            ('peak_rss_mb', peak_rss()),
+                            ('stages', self.stages),
+                            ('counters', self.counters)])
+
+    def save(self, path):
+        with AtomicFile(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+
+
+### Record the stages run inside the with block in profile
+@contextlib.contextmanager
+def profiling(profile):
+    global active
+    previous, active = active, profile
+    try:
+        yield profile
+    finally:
+        active = previous
+
+
+@contextlib.contextmanager
+def unprofiled():
+    yield
+
+
+### Time a stage in the active profile: with stage('read'): ...
+def stage(name):
+    if active is None:
+        return unprofiled()
+    return active.stage(name)
+
+
+### Add amount to a counter of the active profile
+def count(name, amount=1):
+    if active is not None:
+        active.count(name, amount)
+
+
+### Name of the profile of an image, next to its tables (see name_files)
+def profile_file(file_out):
+    head, tail = os.path.split(file_out)
+    return os.path.join(head, "profile_" + os.path.splitext(tail)[0] +
+                        ".json")
+
+
+### Add a profile's stages and counters to the profile saved at path
+def add_to_file(profile, path):
+    # for stages of an image run in another process, such as drawing its
+    # plots after the rest (see cww_batch.render_in_worker)
+    with open(path) as f:
+        saved = json.load(f, object_pairs_hook=OrderedDict)
+    for name, totals in profile.stages.items():
+        summed = saved['stages'].setdefault(name, {
+            'calls': 0, 'seconds': 0.0, 'cpu_seconds': 0.0,
+            'rss_mb': None, 'peak_rise_mb': 0.0})
+        for key in ('calls', 'seconds', 'cpu_seconds', 'peak_rise_mb'):
+            summed[key] += totals[key]
+        summed['rss_mb'] = totals['rss_mb']
+    for name, value in profile.counters.items():
+        saved['counters'][name] = saved['counters'].get(name, 0) + value
+    saved['seconds'] += time.time() - profile.started
+    peaks = [p for p in (saved['peak_rss_mb'], peak_rss()) if p is not None]
+    saved['peak_rss_mb'] = max(peaks) if peaks else None
+    with AtomicFile(path, 'w') as f:
+        json.dump(saved, f, indent=1)
+
+
+### Profiles of a batch (as saved) added together
+def summarize(profiles):
+    # stage totals are summed, with each stage's share of the time of all
+    # stages; peak memory is the largest of any image
+    stages = OrderedDict()
+    counters = OrderedDict()
+    peaks = [p['peak_rss_mb'] for p in profiles
+             if p.get('peak_rss_mb') is not None]
+    for profile in profiles:
+        for name, totals in profile['stages'].items():
+            summed = stages.setdefault(name, {'calls': 0, 'seconds': 0.0,
+                                              'cpu_seconds': 0.0})
+            for key in summed:
+                summed[key] += totals[key]
+        for name, value in profile['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+    total = sum(totals['seconds'] for totals in stages.values())
+    for totals in stages.values():
+        totals['share'] = totals['seconds'] / total if total else 0.0
+    return OrderedDict([('images', len(profiles)),
+                        ('seconds', sum(p['seconds'] for p in profiles)),
+                        ('peak_rss_mb', max(peaks) if peaks else None),
+                        ('stages', stages),
+                        ('counters', counters)])
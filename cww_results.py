@@ -0,0 +1,284 @@
+# Results of a batch as a few columnar tables, instead of files per image
+#
+# A results store is a directory with one file and one subdirectory per table:
+#   images  - one row per image: its path, size, number of objects and the
+#             settings it was analyzed with
+#   cells   - one row per object: area and perimeter (the values of every
+#             object, whatever the cutoffs)
+#   widths  - the wall width histogram: number of walls of each width
+#   pairs   - the wall between each pair of touching cells (see pair_table)
+# Every row has an 'image' column.  While a batch runs, each image's rows of a
+# table are one chunk in the table's subdirectory, a .npz of columns written
+# whole or not at all (see cww_output), so workers append to a store at the
+# same time without locking and running an image again replaces its chunks.
+# Once the batch is over, close joins the chunks of each table into the
+# table's one .npz file (its rows in order of image name), so a store holds a
+# file per table however many images it has.  read_table reads a table (in
+# order of image name) from both, and export_tsvs writes the per-image files
+# process_image and friends write without a store, byte for byte.
+
+import os
+import glob
+import numpy as np
+
+from cww_output import AtomicFile, write_tsv, columns_rows, save_npz
+
+TABLES = ('images', 'cells', 'widths', 'pairs')
+
+# Array of a table file listing its images (even those with no rows)
+STORED_IMAGES = 'stored_images'
+
+
+### Name of an image in a store: its output files' name (see name_files)
+def image_name(file_out):
+    return os.path.splitext(os.path.basename(file_out))[0]
+
+
+### Names of an image's per-image output files, as name_files names them
+def table_files(file_out):
+    head, tail = os.path.split(file_out)
+    return {'cells': file_out,
+            'widths': os.path.join(head, "widths_" + tail),
+            'all_widths': os.path.join(head, "all_widths_" + tail),
+            'pairs': os.path.join(head, "pairs_" + os.path.splitext(tail)[0] +
+                                  ".npz")}
+
+
+### Area and perimeter TSV of an image (values over a cutoff are left out)
+def write_cells_tsv(path, labels, areas, perimeters, area_cutoff,
+                    perimeter_cutoff):
+    # 0th is background, will end on last i+1 (=last j)
+    rows = []
+    for label, area, p in zip(labels.tolist(), areas.tolist(),
+                              perimeters.tolist()):
+        fields = [str(label)]
+        if area < area_cutoff:
+            fields.append(str(area))
+        if p < perimeter_cutoff:
+            fields.append(str(p))
+        rows.append(fields)
+    write_tsv(path, 'object_label, area, perimeter', rows, 'w')
+
+
+### Wall width histogram TSV of an image
+def write_widths_tsv(path, pixel_widths, wall_counts):
+    write_tsv(path, 'pixel_width\tnum_cell_walls',
+              columns_rows(pixel_widths, wall_counts))
+
+
+### Ways of writing the width of every wall of an image to all_widths_
+#   lines - one line per wall, repeating each width once for every wall (the
+#           format the all_widths_ table has always had)
+#   runs  - one line per width: the width and how many walls have it (only
+#           the widths some wall has), much smaller for large images
+ALL_WIDTHS_FORMATS = ('lines', 'runs')
+
+
+### TSV of the width of every wall of an image, as runs or one line per wall
+def write_all_widths_tsv(path, pixel_widths, wall_counts, form='lines'):
+    if form not in ALL_WIDTHS_FORMATS:
+        raise ValueError("unknown all widths format %s" % form)
+    if form == 'runs':
+        write_tsv(path, 'pixel_width\tnum_cell_walls',
+                  [fields for fields in columns_rows(pixel_widths,
+                                                     wall_counts)
+                   if fields[1] != '0'])
+        return
+    with AtomicFile(path) as output:
+        output.write('pixel_width\n')
+        for width, walls in zip(pixel_widths, wall_counts):
+            output.write((str(width) + '\n') * walls)
+
+
+### The width of every wall, one at a time, from widths and their counts
+def expand_runs(pixel_widths, wall_counts):
+    for width, walls in zip(pixel_widths, wall_counts):
+        for i in xrange(walls):
+            yield width
+
+
+### The width of every wall in an all_widths_ (or widths_) TSV, one at a time
+def expand_widths(path):
+    # reads either format of write_all_widths_tsv, so tools that need the
+    # flat list of widths do not hold it in memory or care how it was
+    # written; a file that is neither raises ValueError at once
+    f = open(path, 'rb')
+    header = f.readline().split()
+    if header == ['pixel_width']:
+        return read_widths(f)
+    if header == ['pixel_width', 'num_cell_walls']:
+        return read_runs(f)
+    f.close()
+    raise ValueError("%s is not a wall widths table" % path)
+
+
+### Widths of an all_widths_ table written one per line, after the header
+def read_widths(f):
+    with f:
+        for line in f:
+            if line.strip():
+                yield int(line)
+
+
+### Widths of an all_widths_ table written as runs, after the header
+def read_runs(f):
+    with f:
+        for line in f:
+            if line.strip():
+                width, walls = line.split()
+                for i in xrange(int(walls)):
+                    yield int(width)
+
+
+### A directory of columnar tables that images are added to a chunk at a time
+class ResultStore(object):
+    def __init__(self, directory):
+        self.directory = directory
+        self.loaded = {}   # table: (file stamp, columns, images) of its file
+        for table in TABLES:
+            path = os.path.join(directory, table)
+            if not os.path.isdir(path):
+                try:
+                    os.makedirs(path)
+                except OSError:  # made by another worker in the meantime
+                    if not os.path.isdir(path):
+                        raise
+
+    def path(self, table, image):
+        return os.path.join(self.directory, table, image + '.npz')
+
+    # File of a table's joined chunks (see close)
+    def table_path(self, table):
+        return os.path.join(self.directory, table + '.npz')
+
+    # Store an image's rows of a table (a dict of equal length columns),
+    # replacing any it had; the image column is added
+    def put(self, table, image, columns):
+        rows = len(next(iter(columns.values()))) if columns else 0
+        columns = dict(columns, image=np.repeat(np.array([image]), rows))
+        save_npz(self.path(table, image), columns)
+
+    # Names of the images with a chunk of a table, in order
+    def chunk_images(self, table):
+        return sorted(os.path.splitext(os.path.basename(path))[0] for path in
+                      glob.glob(os.path.join(self.directory, table, '*.npz')))
+
+    # Columns of a table's file (rows sorted by image) and the names of its
+    # images, read once for each version of the file ({} and () if none)
+    def joined(self, table):
+        path = self.table_path(table)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return {}, ()
+        stamp = (stat.st_mtime, stat.st_size)
+        if self.loaded.get(table, (None,))[0] != stamp:
+            with np.load(path) as stored:
+                columns = dict((name, stored[name]) for name in stored.files)
+            images = columns.pop(STORED_IMAGES)
+            self.loaded[table] = (stamp, columns, images)
+        return self.loaded[table][1:]
+
+    # Names of the images with rows in a table, in order
+    def images(self, table='images'):
+        images = set(self.joined(table)[1])
+        images.update(self.chunk_images(table))
+        return sorted(images)
+
+    # An image's rows of a table as a dict of columns (None if it has none);
+    # a chunk of the image replaces its rows in the table's file
+    def get(self, table, image):
+        try:
+            with np.load(self.path(table, image)) as stored:
+                return dict((name, stored[name]) for name in stored.files)
+        except (IOError, OSError):
+            pass
+        columns, images = self.joined(table)
+        if image not in images:
+            return None
+        start = np.searchsorted(columns['image'], image, 'left')
+        end = np.searchsorted(columns['image'], image, 'right')
+        return dict((name, column[start:end])
+                    for name, column in columns.items())
+
+    # All rows of a table as a dict of columns, or of only some images
+    def read_table(self, table, images=None):
+        chunks = [self.get(table, image)
+                  for image in (images or self.images(table))]
+        chunks = [chunk for chunk in chunks if chunk is not None]
+        if not chunks:
+            return {}
+        return dict((name, np.concatenate([chunk[name] for chunk in chunks]))
+                    for name in chunks[0])
+
+    # Join the chunks of every table into its file, then remove them; only
+    # once no batch is writing to the store (batch_process does this when
+    # its batch is over, and export_tsvs before exporting)
+    def close(self):
+        for table in TABLES:
+            chunks = self.chunk_images(table)
+            if not chunks:
+                continue
+            images = self.images(table)
+            columns = self.read_table(table, images)
+            columns[STORED_IMAGES] = np.array(images)
+            save_npz(self.table_path(table), columns)
+            self.loaded.pop(table, None)
+            for image in chunks:
+                os.remove(self.path(table, image))
+
+    # A table as a pandas DataFrame (pandas is only needed for this)
+    def dataframe(self, table, images=None):
+        import pandas
+        return pandas.DataFrame(self.read_table(table, images))
+
+
+### Metadata row of an image, for the images table
+def image_row(file_in, im_raw, labels_open, formatted):
+    # formatted is the list made by format_values from a preset
+    return {'path': np.array([os.path.abspath(file_in)]),
+            'rows': np.array([im_raw.shape[0]], np.int32),
+            'cols': np.array([im_raw.shape[1]], np.int32),
+            'objects': np.array([labels_open.max()], np.int32),
+            'threshold': np.array([str(formatted[0])]),
+            'gauss_blur': np.array([formatted[1]], np.float64),
+            'binary_open_iterations': np.array([formatted[2]], np.int32),
+            'binary_close_iterations': np.array([formatted[3]], np.int32),
+            'dilation_iterations': np.array([formatted[4]], np.int32),
+            'area_cutoff': np.array([formatted[5]], np.float64),
+            'perimeter_cutoff': np.array([formatted[6]], np.float64),
+            'width_mode': np.array([formatted[8]])}
+
+
+### Write the per-image files of the images in a store to out_path
+def export_tsvs(store, out_path, images=None, all_widths='lines'):
+    # the same <name>.tsv, widths_, all_widths_ (in the all_widths format)
+    # and pairs_ files the analysis writes without a store; returns the names
+    # of the images exported
+    store.close()
+    exported = []
+    for image in images or store.images():
+        meta = store.get('images', image)
+        if meta is None:
+            continue
+        files = table_files(os.path.join(out_path, image + ".tsv"))
+        cells = store.get('cells', image)
+        if cells is not None:
+            write_cells_tsv(files['cells'], cells['object_label'],
+                            cells['area'], cells['perimeter'],
+                            meta['area_cutoff'][0],
+                            meta['perimeter_cutoff'][0])
+        widths = store.get('widths', image)
+        if widths is not None:
+            write_widths_tsv(files['widths'], widths['pixel_width'].tolist(),
+                             widths['num_cell_walls'].tolist())
+            write_all_widths_tsv(files['all_widths'],
+                                 widths['pixel_width'].tolist(),
+                                 widths['num_cell_walls'].tolist(),
+                                 all_widths)
+        pairs = store.get('pairs', image)
+        if pairs is not None:
+            del pairs['image']
+            save_npz(files['pairs'], pairs)
+        exported.append(image)
+    return exported
@@ -0,0 +1,170 @@
+# Functions for analyzing a stack of images (z-stack or time series) stored as
+# the pages of one multi-page TIFF
+#
+# Slices are read one at a time (see cww_tiff.iter_pages) and processed as
+# process_image does, with the same blur and threshold buffers for every slice,
+# so a stack is neither split into separate files nor reloaded slice by slice.
+# The results of all slices go to a few consolidated files instead of a set of
+# files per slice:
+#   stack_<name>.tsv  - one row per slice: threshold, number of objects and the
+#                       number of cell walls of each width
+#   cells_<name>.tsv  - one row per cell per slice: area and perimeter (and the
+#                       3D object the cell is part of, with label_3d)
+#   pairs_<name>.npz  - the cell pair table of every slice, with a slice column
+#                       (not with the dilation width engine, which only counts)
+# With label_3d the slices are also labeled together in 3D (6-connected, the 3D
+# form of the 4-connected 2D labels), so cells can be followed across slices.
+
+import os
+import numpy as np
+from scipy.ndimage import measurements, morphology
+
+from cww_functions import label_edges
+from cww_geometry import area_perimeter
+from cww_widths import wall_widths
+from cww_tiff import iter_pages, page_count
+from cell_wall_erosion_fxn import preprocess, open_close
+from cww_log import logger
+from cww_output import AtomicFile, write_lines, save_npz
+
+
+### Names of the consolidated output files of a stack (see name_files)
+def stack_files(file_out):
+    head, tail = os.path.split(file_out)
+    return (os.path.join(head, "stack_" + tail),
+            os.path.join(head, "cells_" + tail),
+            os.path.join(head, "pairs_" + os.path.splitext(tail)[0] + ".npz"))
+
+
+### Opened and closed mask of every slice, and its threshold, one at a time
+def slice_masks(file_in, threshold, gauss_blur, binary_open_iterations,
+                binary_close_iterations, structuring_element):
+    # methods such as mean or otsu find a threshold for each slice
+    buffers = {}
+    for im_raw in iter_pages(file_in):
+        im, found = preprocess(im_raw, threshold, gauss_blur, buffers)
+        yield (open_close(im, structuring_element, binary_open_iterations,
+                          binary_close_iterations), found)
+
+
+### Label the masks of all slices together as 3D objects
+def label_stack(masks, slices):
+    # returns the 3D labels, the number of 3D objects and the slices' masks
+    # and thresholds; all slices must be the same size
+    stack = None
+    thresholds = []
+    for i, (mask, found) in enumerate(masks):
+        if stack is None:
+            stack = np.zeros((slices,) + mask.shape, dtype=bool)
+        elif mask.shape != stack.shape[1:]:
+            raise ValueError("all slices must be the same size to label "
+                             "them in 3D")
+        stack[i] = mask
+        thresholds.append(found)
+    labels_3d, num_3d = measurements.label(
+        stack, morphology.generate_binary_structure(3, 1))
+    return labels_3d, num_3d, zip(stack, thresholds)
+
+
+#### Analyze every slice of a stack into consolidated tables
+#   stages are as for cww_batch.run_pipeline: 'widths' adds the wall width
+#   columns of the stack table and the pairs file, 'area' writes the cells
+#   table.  Returns the names of the stack and cells tables.
+def process_stack(file_in, file_out, threshold, gauss_blur,
+                  binary_open_iterations, binary_close_iterations,
+                  dilation_iterations, area_cutoff, perimeter_cutoff,
+                  structuring_element, width_mode='dilation', label_3d=False,
+                  stages=('widths', 'area')):
+    (stack_out, cells_out, pairs_out) = stack_files(file_out)
+    slices = page_count(file_in)
+    logger.info("Open stack of %d slices", slices)
+    masks = slice_masks(file_in, threshold, gauss_blur,
+                        binary_open_iterations, binary_close_iterations,
+                        structuring_element)
+    labels_3d = None
+    if label_3d:
+        labels_3d, num_3d, masks = label_stack(masks, slices)
+        logger.info("Number of 3D objects: %d", num_3d)
+
+    widths = range(2, dilation_iterations * 2, 2)
+    # both tables are written as the slices are analyzed, and only appear
+    # under their names once every slice is done (see cww_output)
+    output = AtomicFile(stack_out, 'w')
+    output2 = AtomicFile(cells_out, 'w') if 'area' in stages else None
+    try:
+        write_stack_tables(output, output2, masks, slices, stages, widths,
+                           dilation_iterations, area_cutoff,
+                           perimeter_cutoff, width_mode, labels_3d,
+                           pairs_out)
+    except Exception:
+        output.discard()
+        if output2 is not None:
+            output2.discard()
+        raise
+    output.close()
+    if output2 is not None:
+        output2.close()
+    return stack_out, cells_out
+
+
+### Write the rows of every slice to the stack and cells tables (output and
+### output2, None without the 'area' stage) and the pairs file
+def write_stack_tables(output, output2, masks, slices, stages, widths,
+                       dilation_iterations, area_cutoff, perimeter_cutoff,
+                       width_mode, labels_3d, pairs_out):
+    label_3d = labels_3d is not None
+    output.write('slice\tthreshold\tnum_objects')
+    if 'widths' in stages:
+        output.write(''.join('\twalls_%dpx' % w for w in widths))
+    output.write('\n')
+    if output2 is not None:
+        output2.write('slice\tobject_label\tarea\tperimeter')
+        if label_3d:
+            output2.write('\tobject_3d')
+        output2.write('\n')
+    pair_tables = []
+
+    for i, (mask, found) in enumerate(masks):
+        logger.info("Slice %d of %d", i + 1, slices)
+        labels_open, num_objects_open = measurements.label(mask)
+        logger.info("Threshold = %s  Number of objects: %d", found,
+                    num_objects_open)
+        row = [i, found, num_objects_open]
+        if 'widths' in stages:
+            merged, pairs = wall_widths(dilation_iterations, labels_open,
+                                        width_mode)
+            row.extend(merged)
+            if pairs is not None:
+                pairs['slice'] = np.repeat(np.int32(i),
+                                           len(pairs['label_a']))
+                pair_tables.append(pairs)
+        output.write('\t'.join(str(value) for value in row) + '\n')
+
+        if output2 is not None:
+            # as area_perim, with an empty column for values over the cutoffs
+            # and without the background (label 0)
+            contours = morphology.binary_erosion(labels_open)
+            labels, edge_coords, offsets = label_edges(labels_open, contours)
+            areas, perimeters = area_perimeter(edge_coords, offsets)
+            if label_3d:
+                present, first = np.unique(labels_open.ravel(),
+                                           return_index=True)
+                object_3d = dict(zip(present.tolist(),
+                                     labels_3d[i].ravel()[first].tolist()))
+            rows = []
+            for label, area, p in zip(labels.tolist(), areas.tolist(),
+                                      perimeters.tolist()):
+                if label == 0:
+                    continue
+                fields = [str(i), str(label),
+                          str(area) if area < area_cutoff else '',
+                          str(p) if p < perimeter_cutoff else '']
+                if label_3d:
+                    fields.append(str(object_3d[label]))
+                rows.append('\t'.join(fields))
+            write_lines(output2, rows)
+
+    if pair_tables:
+        save_npz(pairs_out, dict(
+            (key, np.concatenate([table[key] for table in pair_tables]))
+            for key in pair_tables[0]))
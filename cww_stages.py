@@ -0,0 +1,244 @@
+# The pipeline as a graph of stages, each cached in memory on its own inputs
+#
+#   load -> pyramid -> level -> histogram -> threshold
+#   level + histogram -> equalize -> blur
+#   blur + threshold -> mask -> open -> close -> label
+#   label -> contours, widths (dilation iterations, engine)
+#   label + contours -> area;  close + label -> centroids
+#
+# A stage's key is its own settings plus the keys of the stages it depends on,
+# so when a setting changes only the stages downstream of it run again; e.g. a
+# new dilation iteration count only finds the widths again, and a new opening
+# reuses the loaded, equalized, blurred and thresholded image.  The stages do
+# what process_image does (the same operations, in float32), so the results
+# are the same.  The last few results of every stage are kept, for each level
+# of the image pyramid, so a preview refined through every level still has
+# the other levels' results when a setting changes.
+#
+# Level 0 is the full image; preview runs the stages on a smaller level of the
+# image pyramid with the settings scaled to it (see cww_preview).
+
+from collections import OrderedDict
+import os
+import numpy as np
+from scipy.ndimage import measurements, morphology, gaussian_filter
+
+from cww_functions import histeq_lut, label_edges
+from cww_geometry import area_perimeter
+from cww_threshold import find_threshold
+from cww_tiff import read_page
+from cww_widths import wall_widths
+from cww_preview import Pyramid, scale_settings
+
+
+### Stage functions: results of the stages depended on, then the settings
+def load_stage(file_in, stamp, page):
+    return read_page(file_in, page)
+
+
+def pyramid_stage(im_raw):
+    return Pyramid(im_raw)
+
+
+def level_stage(pyramid, level):
+    return pyramid.level(level)
+
+
+def histogram_stage(im_raw):
+    return histeq_lut(im_raw)   # lut, cdf, counts
+
+
+def threshold_stage(histogram, threshold):
+    lut, cdf, counts = histogram
+    return find_threshold(threshold, counts, lut)
+
+
+def equalize_stage(im_raw, histogram):
+    return np.take(histogram[0].astype(np.float32), im_raw, mode='clip')
+
+
+def blur_stage(equalized, gauss_blur):
+    return gaussian_filter(equalized, gauss_blur, output=np.float32)
+
+
+def mask_stage(blurred, threshold):
+    return blurred < threshold
+
+
+def open_stage(mask, binary_open_iterations, structuring_element):
+    if binary_open_iterations < 1:   # skipped, as in open_close
+        return mask
+    return morphology.binary_opening(mask, structuring_element,
+                                     iterations=binary_open_iterations)
+
+
+def close_stage(im_open, binary_close_iterations, structuring_element):
+    if binary_close_iterations < 1:
+        return im_open
+    return morphology.binary_closing(im_open, structuring_element,
+                                     iterations=binary_close_iterations)
+
+
+def label_stage(im_open):
+    return measurements.label(im_open)   # labels_open, num_objects_open
+
+
+def contours_stage(label):
+    return morphology.binary_erosion(label[0])
+
+
+def centroids_stage(im_open, label):
+    labels_open, num_objects_open = label
+    centroids = measurements.center_of_mass(im_open, labels_open,
+                                            xrange(1, num_objects_open + 1))
+    return (tuple(x[1] for x in centroids), tuple(x[0] for x in centroids))
+
+
+def widths_stage(label, dilation_iterations, width_mode):
+    return wall_widths(dilation_iterations, label[0], width_mode)
+
+
+def area_stage(label, contours):
+    labels, edge_coords, offsets = label_edges(label[0], contours)
+    areas, perimeters = area_perimeter(edge_coords, offsets)
+    return labels, areas, perimeters
+
+
+# name: (function, stages it depends on, settings it uses)
+STAGES = {
+    'load': (load_stage, (), ('file_in', 'stamp', 'page')),
+    'pyramid': (pyramid_stage, ('load',), ()),
+    'level': (level_stage, ('pyramid',), ('level',)),
+    'histogram': (histogram_stage, ('level',), ()),
+    'threshold': (threshold_stage, ('histogram',), ('threshold',)),
+    'equalize': (equalize_stage, ('level', 'histogram'), ()),
+    'blur': (blur_stage, ('equalize',), ('gauss_blur',)),
+    'mask': (mask_stage, ('blur', 'threshold'), ()),
+    'open': (open_stage, ('mask',), ('binary_open_iterations',
+                                     'structuring_element')),
+    'close': (close_stage, ('open',), ('binary_close_iterations',
+                                       'structuring_element')),
+    'label': (label_stage, ('close',), ()),
+    'contours': (contours_stage, ('label',), ()),
+    'centroids': (centroids_stage, ('close', 'label'), ()),
+    'widths': (widths_stage, ('label',), ('dilation_iterations',
+                                          'width_mode')),
+    'area': (area_stage, ('label', 'contours'), ()),
+}
+
+
+### True if a stage's result depends on the setting name
+def uses_setting(stage, name):
+    func, depends, names = STAGES[stage]
+    return name in names or any(uses_setting(d, name) for d in depends)
+
+# Stages whose results are kept for each pyramid level
+LEVEL_STAGES = frozenset(stage for stage in STAGES
+                         if uses_setting(stage, 'level'))
+
+
+### The stages of the pipeline with the last keep results of each (per level)
+class Pipeline(object):
+    def __init__(self, keep=2):
+        self.keep = keep
+        # stage: {level (None if it uses none): {key: result, oldest first}}
+        self.results = dict((stage, {}) for stage in STAGES)
+        self.runs = dict((stage, 0) for stage in STAGES)  # times each ran
+
+    # Settings of a run of the pipeline, as the stages expect them
+    def settings(self, file_in, threshold, gauss_blur, binary_open_iterations,
+                 binary_close_iterations, structuring_element,
+                 dilation_iterations=None, width_mode='dilation', page=0,
+                 level=0):
+        stat = os.stat(file_in)
+        return {'file_in': os.path.abspath(file_in),
+                'stamp': (stat.st_size, stat.st_mtime),   # file changed
+                'page': page,
+                'level': level,
+                'threshold': threshold,
+                'gauss_blur': gauss_blur,
+                'binary_open_iterations': binary_open_iterations,
+                'binary_close_iterations': binary_close_iterations,
+                'structuring_element': tuple(tuple(int(v) for v in row)
+                                             for row in structuring_element),
+                'dilation_iterations': dilation_iterations,
+                'width_mode': width_mode}
+
+    # Key of a stage's result for these settings
+    def key(self, stage, settings):
+        func, depends, names = STAGES[stage]
+        return (tuple(self.key(d, settings) for d in depends) +
+                tuple(settings[name] for name in names))
+
+    # Result of a stage, running it (and the stages it needs) if not cached
+    def result(self, stage, settings):
+        key = self.key(stage, settings)
+        level = settings['level'] if stage in LEVEL_STAGES else None
+        results = self.results[stage].setdefault(level, OrderedDict())
+        if key in results:
+            results[key] = results.pop(key)   # now the most recently used
+            return results[key]
+        func, depends, names = STAGES[stage]
+        args = ([self.result(d, settings) for d in depends] +
+                [settings[name] for name in names])
+        value = func(*args)
+        self.runs[stage] += 1
+        results[key] = value
+        while len(results) > self.keep:
+            results.popitem(last=False)
+        return value
+
+    # Forget every cached result
+    def clear(self):
+        for levels in self.results.values():
+            levels.clear()
+
+    # Same arguments and results as process_image
+    def process_image(self, file_in, file_out, threshold, gauss_blur,
+                      binary_open_iterations, binary_close_iterations,
+                      dilation_iterations, area_cutoff, perimeter_cutoff,
+                      structuring_element, page=0):
+        settings = self.settings(file_in, threshold, gauss_blur,
+                                 binary_open_iterations,
+                                 binary_close_iterations, structuring_element,
+                                 page=page)
+        return self.images(settings)
+
+    # process_image's results for these settings
+    def images(self, settings):
+        labels_open = self.result('label', settings)[0]
+        y_center, x_center = self.result('centroids', settings)
+        return (self.result('level', settings), labels_open, y_center,
+                x_center, self.result('contours', settings))
+
+    # Pyramid of a file's image (built once per file)
+    def pyramid(self, file_in, page=0):
+        return self.result('pyramid', self.settings(file_in, None, None, None,
+                                                    None, (), page=page))
+
+    # process_image's results for pyramid level level of the image, with
+    # the preset's settings (from format_values) scaled to that level
+    def preview(self, file_in, formatted, level, page=0):
+        level = min(level, len(self.pyramid(file_in, page)) - 1)
+        scaled = scale_settings(formatted, level)
+        return self.images(self.settings(file_in, scaled[0], scaled[1],
+                                         scaled[2], scaled[3], scaled[7],
+                                         page=page, level=level))
+
+    # Merge counts and wall width table, as wall_widths
+    def wall_widths(self, file_in, threshold, gauss_blur,
+                    binary_open_iterations, binary_close_iterations,
+                    structuring_element, dilation_iterations,
+                    width_mode='dilation', page=0):
+        return self.result('widths', self.settings(
+            file_in, threshold, gauss_blur, binary_open_iterations,
+            binary_close_iterations, structuring_element, dilation_iterations,
+            width_mode, page))
+
+    # Labels, areas and perimeters of the cells, as area_perim finds them
+    def cell_areas(self, file_in, threshold, gauss_blur,
+                   binary_open_iterations, binary_close_iterations,
+                   structuring_element, page=0):
+        return self.result('area', self.settings(
+            file_in, threshold, gauss_blur, binary_open_iterations,
+            binary_close_iterations, structuring_element, page=page))
@@ -0,0 +1,119 @@
+# Functions for choosing the black/white threshold of the equalized image
+#
+# A preset's threshold is either a fixed grey level (e.g. 170) or one of:
+#   mean          - mean of all grey (> 0) pixels
+#   otsu          - Otsu's method, best split of the histogram into two classes
+#   triangle      - triangle method, for one large peak with a long tail
+#   percentile:N  - grey level below which N percent of the pixels lie
+# All of them use the histogram of the equalized image that histeq_lut already
+# computed (pixel counts at each equalized grey level), so none of them need
+# another pass over the image.
+
+import numpy as np
+
+THRESHOLD_METHODS = ('mean', 'otsu', 'triangle', 'percentile')
+
+
+### Threshold text from a preset as a number or a method name
+def parse_threshold(threshold):
+    # raises ValueError for anything that is neither
+    text = str(threshold).strip().lower()
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    method, sep, percent = text.partition(':')
+    if method == 'percentile':
+        try:
+            percent = float(percent)
+        except ValueError:
+            raise ValueError("Threshold must be 'percentile:N' with N a "
+                             "number from 0 to 100, not %r" % threshold)
+        if not 0 <= percent <= 100:
+            raise ValueError("percentile must be between 0 and 100")
+        return text
+    if method in THRESHOLD_METHODS and not sep:
+        return text
+    raise ValueError("Threshold must be an integer, 'mean', 'otsu', "
+                     "'triangle' or 'percentile:N', not %r" % threshold)
+
+
+### True if parse_threshold accepts the threshold
+def valid_threshold(threshold):
+    try:
+        parse_threshold(threshold)
+    except ValueError:
+        return False
+    return True
+
+
+### Mean of the grey (> 0) pixels of the equalized image, from its histogram
+def mean_threshold(counts, levels):
+    grey = levels > 0
+    return ((counts[grey] * levels[grey]).sum() /
+            float(counts[grey].sum()))
+
+
+### Otsu's threshold of a histogram (counts of pixels at sorted grey levels)
+def otsu_threshold(counts, levels):
+    counts = np.asarray(counts, dtype=np.float64)
+    occupied = np.flatnonzero(counts)
+    if len(occupied) < 2:   # one grey level (a blank image): nothing to split
+        return levels[occupied[0]]
+    weight0 = np.cumsum(counts)
+    weight1 = weight0[-1] - weight0
+    moment0 = np.cumsum(counts * levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean0 = moment0 / weight0
+        mean1 = (moment0[-1] - moment0) / weight1
+        between = weight0 * weight1 * (mean0 - mean1) ** 2
+    k = np.nanargmax(between[:-1])
+    # split halfway between the last level of the dark class and the next
+    return (levels[k] + levels[k + 1]) / 2.0
+
+
+### Triangle threshold of a histogram (counts of pixels at even grey levels)
+def triangle_threshold(counts, levels):
+    # farthest bin below the line from the peak to the end of the longer tail
+    counts = np.asarray(counts, dtype=np.float64)
+    grey = np.flatnonzero(counts)
+    first, last = grey[0], grey[-1]
+    peak = np.argmax(counts)
+    if peak - first > last - peak:
+        bins = np.arange(first, peak + 1)
+        end = first
+    else:
+        bins = np.arange(peak, last + 1)
+        end = last
+    dx = end - peak
+    dy = counts[end] - counts[peak]
+    distance = np.abs(dy * (bins - peak) - dx * (counts[bins] - counts[peak]))
+    return levels[bins[np.argmax(distance)]]
+
+
+### Grey level below which percent of the pixels lie
+def percentile_threshold(counts, levels, percent):
+    cumulative = np.cumsum(counts, dtype=np.float64)
+    k = np.searchsorted(cumulative, cumulative[-1] * percent / 100.0)
+    return levels[min(k, len(levels) - 1)]
+
+
+### Threshold for the equalized image, from a preset's threshold value
+def find_threshold(threshold, counts, levels):
+    # counts and levels are the pixel counts and equalized grey levels of
+    # the image histogram (from histeq_lut); fixed thresholds are returned
+    # unchanged
+    threshold = parse_threshold(threshold)
+    if not isinstance(threshold, str):
+        return threshold
+    if threshold == 'mean':
+        return mean_threshold(counts, levels)
+    # rebin onto even grey levels, as the histogram methods expect
+    counts, edges = np.histogram(levels, 256, (0, 256), weights=counts)
+    centers = (edges[:-1] + edges[1:]) / 2
+    if threshold == 'otsu':
+        return otsu_threshold(counts, centers)
+    if threshold == 'triangle':
+        return triangle_threshold(counts, centers)
+    percent = float(threshold.partition(':')[2])
+    return percentile_threshold(counts, edges[1:], percent)
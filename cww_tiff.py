@@ -0,0 +1,216 @@
+# Functions for reading the pages of (multi-page) TIFF images as 8-bit grey
+#
+# Uncompressed 8-bit TIFF pages (strips or tiles, grey, RGB or RGBA) are read
+# through a memory map of the file, so only the pages that are used are ever
+# read from disk: grey pages stored in one block are returned as a view of the
+# file with no copy, and colour pages are converted to grey a block of rows at
+# a time, the same way PIL's convert("L") does.  Other pages (compressed, other
+# bit depths, palettes) and other image formats are read a page at a time with
+# PIL.  Both classic TIFF and BigTIFF (> 4 GB) files are understood.
+
+import struct
+import numpy as np
+from PIL import Image
+
+# Rows of a colour page converted to grey at a time
+GREY_BLOCK_ROWS = 256
+
+# Added before the shift in the RGB to grey conversion; newer versions of PIL
+# round to the nearest grey level, older ones round down
+GREY_ROUNDING = 0
+if Image.new('RGB', (1, 1), (104, 47, 44)).convert('L').getpixel((0, 0)) == 64:
+    GREY_ROUNDING = 0x8000
+
+# TIFF tags used
+WIDTH = 256
+LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+PLANAR_CONFIG = 284
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+SAMPLE_FORMAT = 339
+
+# struct formats of the integer tag types (BYTE, SHORT, LONG, LONG8)
+TAG_TYPES = {1: 'B', 3: 'H', 4: 'I', 16: 'Q'}
+
+
+### Tags of every page (IFD) of a TIFF file, one dict at a time
+def tiff_pages(fh):
+    # yields {tag: tuple of values} for the integer tags of each page, in
+    # file order; yields nothing if fh is not a TIFF file
+    fh.seek(0)
+    head = fh.read(8)
+    order = {b'II': '<', b'MM': '>'}.get(head[:2])
+    if order is None or len(head) < 8:
+        return
+    version = struct.unpack(order + 'H', head[2:4])[0]
+    if version == 42:      # classic TIFF
+        count_fmt, offset_fmt, entry_size = 'H', 'I', 12
+        offset = struct.unpack(order + 'I', head[4:8])[0]
+    elif version == 43:    # BigTIFF
+        count_fmt, offset_fmt, entry_size = 'Q', 'Q', 20
+        offset = struct.unpack(order + 'Q', fh.read(8))[0]
+    else:
+        return
+    count_size = struct.calcsize(count_fmt)
+    offset_size = struct.calcsize(offset_fmt)
+    value_size = entry_size - 4 - offset_size   # inline value bytes
+
+    seen = set()
+    while offset and offset not in seen:   # stop at a loop in the page chain
+        seen.add(offset)
+        fh.seek(offset)
+        entries = struct.unpack(order + count_fmt, fh.read(count_size))[0]
+        data = fh.read(entries * entry_size + offset_size)
+        tags = {}
+        for i in xrange(entries):
+            entry = data[i * entry_size:(i + 1) * entry_size]
+            tag, tag_type = struct.unpack(order + 'HH', entry[:4])
+            fmt = TAG_TYPES.get(tag_type)
+            if fmt is None:
+                continue
+            count = struct.unpack(order + offset_fmt,
+                                  entry[4:4 + offset_size])[0]
+            size = struct.calcsize(fmt) * count
+            value = entry[4 + offset_size:]
+            if size > value_size:   # value is stored elsewhere in the file
+                fh.seek(struct.unpack(order + offset_fmt, value)[0])
+                value = fh.read(size)
+            tags[tag] = struct.unpack(order + '%d%s' % (count, fmt),
+                                      value[:size])
+        yield tags
+        offset = struct.unpack(order + offset_fmt,
+                               data[entries * entry_size:])[0]
+
+
+### True if the page is uncompressed 8-bit grey, RGB or RGBA pixels
+def can_map(tags):
+    samples = tags.get(SAMPLES_PER_PIXEL, (1,))[0]
+    photometric = tags.get(PHOTOMETRIC, (None,))[0]
+    if samples == 1:
+        grey_or_rgb = photometric == 1          # BlackIsZero
+    else:
+        grey_or_rgb = samples in (3, 4) and photometric == 2
+    return (grey_or_rgb and
+            tags.get(COMPRESSION, (1,))[0] == 1 and
+            set(tags.get(BITS_PER_SAMPLE, (1,))) == set([8]) and
+            tags.get(SAMPLE_FORMAT, (1,))[0] == 1 and
+            (samples == 1 or tags.get(PLANAR_CONFIG, (1,))[0] == 1) and
+            (STRIP_OFFSETS in tags or TILE_OFFSETS in tags))
+
+
+### Blocks of a mapped page as (row, column, pixel array) views of the file
+def page_blocks(raw, tags):
+    # raw is the whole file as a uint8 memmap; arrays are rows x columns x
+    # samples, and tiles at the right and bottom edges are cropped to the page.
+    # Raises ValueError if a block runs past the end of the file.
+    width = tags[WIDTH][0]
+    length = tags[LENGTH][0]
+    samples = tags.get(SAMPLES_PER_PIXEL, (1,))[0]
+    if TILE_OFFSETS in tags:
+        tile_width = tags[TILE_WIDTH][0]
+        tile_length = tags[TILE_LENGTH][0]
+        across = -(-width // tile_width)
+        size = tile_length * tile_width * samples
+        for i, start in enumerate(tags[TILE_OFFSETS]):
+            row = (i // across) * tile_length
+            col = (i % across) * tile_width
+            tile = raw[start:start + size].reshape(tile_length, tile_width,
+                                                   samples)
+            yield (row, col, tile[:length - row, :width - col])
+    else:
+        rows_per_strip = min(tags.get(ROWS_PER_STRIP, (length,))[0], length)
+        for i, start in enumerate(tags[STRIP_OFFSETS]):
+            row = i * rows_per_strip
+            rows = min(rows_per_strip, length - row)
+            size = rows * width * samples
+            yield (row, 0, raw[start:start + size].reshape(rows, width,
+                                                           samples))
+
+
+### Convert RGB(A) pixels to grey as PIL's convert("L") does, a block at a time
+def grey_rows(rgb, out):
+    # L = (19595 R + 38470 G + 7471 B + GREY_ROUNDING) >> 16, alpha ignored
+    for start in xrange(0, len(rgb), GREY_BLOCK_ROWS):
+        block = rgb[start:start + GREY_BLOCK_ROWS].astype(np.uint32)
+        grey = (block[..., 0] * 19595 + block[..., 1] * 38470 +
+                block[..., 2] * 7471 + GREY_ROUNDING)
+        out[start:start + len(block)] = grey >> 16
+
+
+### 8-bit grey array of a mapped page
+def map_page(raw, tags):
+    width = tags[WIDTH][0]
+    length = tags[LENGTH][0]
+    samples = tags.get(SAMPLES_PER_PIXEL, (1,))[0]
+    blocks = list(page_blocks(raw, tags))
+    if samples == 1 and len(blocks) == 1:
+        return blocks[0][2].reshape(length, width)   # no copy
+    im = np.empty((length, width), np.uint8)
+    for (row, col, pixels) in blocks:
+        rows, cols = pixels.shape[:2]
+        if samples == 1:
+            im[row:row + rows, col:col + cols] = pixels[..., 0]
+        else:
+            grey_rows(pixels, im[row:row + rows, col:col + cols])
+    return im
+
+
+### 8-bit grey array of page number page of a file opened with PIL
+def pil_page(im, page):
+    im.seek(page)
+    return np.array(im.convert("L"))
+
+
+### Pages of an image file as 8-bit grey arrays, one at a time
+def iter_pages(file_in, pages=None):
+    # pages is a collection of page numbers to read (default: every page);
+    # pages are only read as they are asked for, so a stack can be worked
+    # through a page at a time.  Mapped pages stay valid after the loop.
+    with open(file_in, 'rb') as fh:
+        pil_im = None
+        raw = None
+        page = -1
+        for page, tags in enumerate(tiff_pages(fh)):
+            if pages is not None and page not in pages:
+                continue
+            if can_map(tags):
+                if raw is None:
+                    raw = np.memmap(file_in, np.uint8, 'r')
+                try:
+                    im = map_page(raw, tags)
+                except (KeyError, ValueError):   # damaged tags; let PIL try
+                    im = None
+                if im is not None:
+                    yield im
+                    continue
+            if pil_im is None:
+                pil_im = Image.open(file_in)
+            yield pil_page(pil_im, page)
+    if page < 0:   # not a TIFF file
+        pil_im = Image.open(file_in)
+        for page in xrange(getattr(pil_im, 'n_frames', 1)):
+            if pages is None or page in pages:
+                yield pil_page(pil_im, page)
+
+
+### One page of an image file as an 8-bit grey array
+def read_page(file_in, page=0):
+    for im in iter_pages(file_in, (page,)):
+        return im
+    raise IndexError("%s has no page %d" % (file_in, page))
+
+
+### Number of pages in an image file
+def page_count(file_in):
+    with open(file_in, 'rb') as fh:
+        pages = sum(1 for tags in tiff_pages(fh))
+    if pages == 0:
+        pages = getattr(Image.open(file_in), 'n_frames', 1)
+    return pages
@@ -0,0 +1,195 @@
+# Functions for working through a large image in overlapping tiles
+#
+# The image is cut into square core tiles that cover it without overlap.  Each
+# core is worked on together with a halo of the pixels around it, as wide as
+# the farthest any pixel of the core can be affected by the step being run
+# (blur radius, opening and closing, dilation), so the result inside the core
+# is exactly what the whole image would give there.  Only the cores are kept.
+# Objects cut by tile seams are joined afterwards by stitch_labels.
+
+import tempfile
+import numpy as np
+from scipy.ndimage import measurements
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:  # python 2 needs the 'futures' backport; run serially
+    ProcessPoolExecutor = None
+
+from cww_widths import (WIDTH_MODES, UnionFind, object_contacts,
+                        first_contacts, count_merges, pair_table)
+
+# Core tile size used when none is given (pixels along each side)
+TILE_SIZE = 1024
+
+
+### (core, halo) pairs of slices for every tile of an image, in raster order
+def tile_boxes(shape, tile_size=TILE_SIZE, halo=0):
+    # the halo box is the core grown by halo pixels, cut off at the image
+    # edges; boxes are (row slice, column slice) tuples
+    rows, cols = shape[:2]
+    boxes = []
+    for top in xrange(0, rows, tile_size):
+        bottom = min(top + tile_size, rows)
+        for left in xrange(0, cols, tile_size):
+            right = min(left + tile_size, cols)
+            core = (slice(top, bottom), slice(left, right))
+            grown = (slice(max(top - halo, 0), min(bottom + halo, rows)),
+                     slice(max(left - halo, 0), min(right + halo, cols)))
+            boxes.append((core, grown))
+    return boxes
+
+
+### The core of a tile as slices of its halo box
+def core_in_halo(core, grown):
+    return tuple(slice(c.start - g.start, c.stop - g.start)
+                 for c, g in zip(core, grown))
+
+
+### Apply func to every set of arguments, on a pool of worker processes
+def tile_map(func, arg_lists, workers=1):
+    # yields the results in order; at most two tiles per worker are waiting
+    # at a time, so only a few tiles are ever copied to the workers at once
+    if workers <= 1 or ProcessPoolExecutor is None:
+        for args in arg_lists:
+            yield func(*args)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        waiting = []
+        for args in arg_lists:
+            waiting.append(pool.submit(func, *args))
+            if len(waiting) >= 2 * workers:
+                yield waiting.pop(0).result()
+        for future in waiting:
+            yield future.result()
+
+
+### Array for a whole-image result, in memory or in a file under scratch_dir
+def image_array(shape, dtype, scratch_dir=None):
+    # arrays in scratch_dir are memory-mapped temporary files, for images
+    # whose labels do not fit in memory; the file is deleted when it closes
+    if scratch_dir is None:
+        return np.zeros(shape, dtype)
+    handle = tempfile.TemporaryFile(dir=scratch_dir)
+    return np.memmap(handle, dtype, 'w+', shape=shape)
+
+
+### Label the objects of every tile core and join them across tile seams
+def stitch_labels(core_masks, labels):
+    # core_masks yields (core box, boolean mask of the core) for tiles that
+    # cover labels.  labels is filled in exactly as measurements.label would
+    # label the whole mask (4-connected objects, numbered in raster order of
+    # their first pixel), and the number of objects is returned.
+    cols = labels.shape[1]
+    total = 0
+    firsts = [np.zeros(1, np.int64)]   # first pixel of each tile's objects
+    seams = set()
+    for core, mask in core_masks:
+        local, count = measurements.label(mask)
+        top, left = core[0].start, core[1].start
+        if top > 0:
+            seams.add((0, top))
+        if left > 0:
+            seams.add((1, left))
+        if count == 0:
+            labels[core] = 0
+            continue
+        local[local > 0] += total
+        labels[core] = local
+        found, first = np.unique(local.ravel(), return_index=True)
+        first = first[found > 0]
+        firsts.append((top + first // mask.shape[1]) * np.int64(cols) +
+                      left + first % mask.shape[1])
+        total += count
+
+    # objects that touch across a seam are the same object
+    sets = UnionFind(total + 1)
+    for axis, at in sorted(seams):
+        if axis == 0:
+            a, b = labels[at - 1, :], labels[at, :]
+        else:
+            a, b = labels[:, at - 1], labels[:, at]
+        both = (a > 0) & (b > 0)
+        pairs = np.unique(np.asarray(a[both], np.int64) * (total + 1) +
+                          b[both])
+        for a_label, b_label in zip((pairs // (total + 1)).tolist(),
+                                    (pairs % (total + 1)).tolist()):
+            sets.union(a_label, b_label)
+
+    # number the joined objects in order of their first pixel
+    roots = np.array([sets.find(i) for i in xrange(total + 1)])
+    firsts = np.concatenate(firsts)
+    first_of_root = np.full(total + 1, np.iinfo(np.int64).max, np.int64)
+    np.minimum.at(first_of_root, roots, firsts)
+    is_root = roots == np.arange(total + 1)
+    is_root[0] = False
+    order = np.flatnonzero(is_root)[np.argsort(first_of_root[is_root],
+                                               kind='mergesort')]
+    renumber = np.zeros(total + 1, labels.dtype)
+    renumber[order] = np.arange(1, len(order) + 1)
+    renumber = renumber[roots]
+    for core, grown in tile_boxes(labels.shape, TILE_SIZE):
+        labels[core] = renumber[labels[core]]
+    return len(order)
+
+
+### Centre of mass (row, column) of every labeled object, a tile at a time
+def tile_centroids(labels, total, tile_size=TILE_SIZE):
+    sums = np.zeros((2, total + 1))
+    counts = np.zeros(total + 1)
+    for core, grown in tile_boxes(labels.shape, tile_size):
+        tile = labels[core]
+        x, y = np.nonzero(tile)
+        owner = tile[x, y]
+        counts += np.bincount(owner, minlength=total + 1)
+        sums[0] += np.bincount(owner, x + core[0].start, total + 1)
+        sums[1] += np.bincount(owner, y + core[1].start, total + 1)
+    return sums[:, 1:] / counts[1:]
+
+
+### Contacts closer than dilation_iterations steps whose pixel is in the core
+def tile_contacts(tile, core, grown, cols, dilation_iterations):
+    # tile is the labels in the halo box grown; contact pixels are returned
+    # as flat indices into the whole image, which has cols columns
+    if not tile.any():
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty, empty, empty
+    firsts, seconds, touch, where = object_contacts(tile,
+                                                    dilation_iterations - 1)
+    x = where // tile.shape[1] + grown[0].start
+    y = where % tile.shape[1] + grown[1].start
+    keep = ((touch < dilation_iterations) &
+            (x >= core[0].start) & (x < core[0].stop) &
+            (y >= core[1].start) & (y < core[1].stop))
+    return firsts[keep], seconds[keep], touch[keep], (x * cols + y)[keep]
+
+
+### Merge counts plus the wall width table of labels, a tile at a time
+def tiled_wall_widths(dilation_iterations, labels, total,
+                      tile_size=TILE_SIZE, workers=1, width_mode='dilation'):
+    # Same results as wall_widths with any width_mode: the contacts are the
+    # distance engine's, which gives the same counts as the dilation engine
+    # and the same pairs as the incremental one; as in wall_widths the table
+    # is None for the dilation engine.  Pixels closer than dilation_iterations
+    # steps to an object are covered by an object inside the halo, so every
+    # contact in a core is found exactly as in the whole image.
+    if width_mode not in WIDTH_MODES:
+        raise ValueError("width_mode must be one of %s, not %r" %
+                         (', '.join(WIDTH_MODES), width_mode))
+    halo = dilation_iterations + 1
+    found = tile_map(tile_contacts,
+                     ((np.array(labels[grown]), core, grown, labels.shape[1],
+                       dilation_iterations)
+                      for core, grown in tile_boxes(labels.shape, tile_size,
+                                                    halo)),
+                     workers)
+    firsts, seconds, touch, where = [np.concatenate(part) for part in
+                                     zip(*found)]
+    label_a, label_b, touch, where = first_contacts(firsts, seconds, touch,
+                                                    where, total)
+    object_count = count_merges(dilation_iterations, label_a, label_b, touch,
+                                total)
+    if width_mode == 'dilation':
+        return object_count, None
+    table = pair_table(label_a, label_b, touch, where, labels.shape,
+                       dilation_iterations)
+    return object_count, table
@@ -0,0 +1,310 @@
+# Functions for finding the distribution of cell wall widths
+#
+# cell_wall_widths counts how many objects merge at each dilation step.  The
+# dilation width engine does that literally (dilate the whole image, relabel,
+# count); the distance engine gets the same counts in one pass:
+#  - a taxicab distance transform gives the dilation step at which every
+#    background pixel is first covered and the nearest object that covers it
+#  - two 4-connected neighbour pixels owned by different objects join those
+#    objects at the later of their two steps
+#  - merging the object pairs in order of step with a union-find counts the
+#    objects lost at each step, which is what relabeling the dilated image finds
+# The incremental engine keeps the dilation steps but grows the original labels
+# one ring at a time, only visiting the newly covered (frontier) pixels, and
+# records the merges in a union-find instead of relabeling the image.
+#
+# A pixel as far from two or more objects is owned by the lowest labeled of
+# them in both the distance and incremental engines (see grow_owners), so the
+# two report exactly the same touching pairs, widths and contact pixels, not
+# just the same counts.
+
+import numpy as np
+from scipy.ndimage import measurements, morphology
+
+WIDTH_MODES = ('dilation', 'distance', 'incremental')
+
+
+### Disjoint sets of object labels, to keep track of merged objects
+class UnionFind(object):
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, label):
+        parent = self.parent
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]  # path halving
+            label = parent[label]
+        return label
+
+    # Join the sets holding a and b; False if they were already joined
+    def union(self, a, b):
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a == root_b:
+            return False
+        if root_a > root_b:  # keep the smallest label as the root
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        return True
+
+
+### Object pairs that touch when dilated, and the dilation step they touch at
+def touching_pairs(labels_open, levels=None):
+    # Label objects within image and count number of objects (as the
+    # dilation loop does, so both engines see the same objects); only pairs
+    # touching within levels steps are found (all of them if levels is None)
+    base, total = measurements.label(labels_open)
+    if total < 2:
+        empty = np.zeros(0, dtype=np.intp)
+        return base, total, empty, empty, empty, empty
+    label_a, label_b, touch, where = first_contacts(
+        *(object_contacts(base, levels) + (total,)))
+    return base, total, label_a, label_b, touch, where
+
+
+### Every pair of 4-connected neighbour pixels covered by different objects
+def object_contacts(base, levels=None):
+    # returns the two objects of each pair, the dilation step they touch at
+    # there and the flat index of the contact pixel, all unsorted; only
+    # pixels covered within levels steps are owned (all if levels is None),
+    # so pairs touching later are left out
+
+    # steps to reach each pixel from the nearest object
+    # (binary_dilation's default cross grows by one taxicab step)
+    steps = morphology.distance_transform_cdt(base == 0, metric='taxicab')
+    owner = nearest_owners(base, steps, levels).reshape(base.shape)
+
+    cols = base.shape[1]
+    firsts, seconds, touch, where = [], [], [], []
+    for axis in (0, 1):  # vertical then horizontal neighbours
+        here = [slice(None), slice(None)]
+        there = [slice(None), slice(None)]
+        here[axis] = slice(None, -1)
+        there[axis] = slice(1, None)
+        a = owner[tuple(here)]
+        b = owner[tuple(there)]
+        boundary = (a != b) & (a != 0) & (b != 0)
+        step_a = steps[tuple(here)][boundary]
+        step_b = steps[tuple(there)][boundary]
+        firsts.append(a[boundary])
+        seconds.append(b[boundary])
+        touch.append(np.maximum(step_a, step_b))
+        # the contact is the pixel of the pair that is covered last
+        x, y = np.nonzero(boundary)
+        later = step_b > step_a
+        x[later] += 1 - axis
+        y[later] += axis
+        where.append(x.astype(np.intp) * cols + y)
+    return (np.concatenate(firsts), np.concatenate(seconds),
+            np.concatenate(touch), np.concatenate(where))
+
+
+### Owner of every pixel covered within levels steps (flat), 0 for the rest
+def nearest_owners(base, steps, levels=None):
+    # the pixels of each step are owned from the step before, one ring at a
+    # time, as incremental_merges grows them
+    owner = base.flatten()
+    flat = steps.ravel()
+    if levels is None:
+        levels = flat.max()
+    ring = np.flatnonzero((flat > 0) & (flat <= levels))
+    ring = ring[np.argsort(flat[ring], kind='mergesort')]
+    bounds = np.searchsorted(flat[ring], np.arange(1, levels + 2))
+    for i in range(levels):
+        grow_owners(ring[bounds[i]:bounds[i + 1]], owner, *base.shape)
+    return owner
+
+
+### Give newly covered pixels the lowest owner of their covered neighbours
+def grow_owners(pixels, owner, rows, cols):
+    # pixels are flat indices, all uncovered (owner 0) and each next to a
+    # pixel covered at the step before; owner is changed in place.  A
+    # neighbour outside the image is read as the pixel itself, uncovered.
+    row = pixels // cols
+    col = pixels % cols
+    unowned = np.iinfo(owner.dtype).max
+    lowest = np.full(len(pixels), unowned, owner.dtype)
+    for inside, offset in ((row > 0, -cols), (row < rows - 1, cols),
+                           (col > 0, -1), (col < cols - 1, 1)):
+        other = owner[np.where(inside, pixels + offset, pixels)]
+        other[other == 0] = unowned
+        np.minimum(lowest, other, out=lowest)
+    owner[pixels] = lowest
+
+
+### Each touching object pair once, at its earliest step, ordered by step
+def first_contacts(firsts, seconds, touch, where, total):
+    # a pair touching in several places at that step keeps the first pixel,
+    # so the contact does not depend on the order the contacts were found in
+    label_a = np.minimum(firsts, seconds).astype(np.intp)
+    label_b = np.maximum(firsts, seconds).astype(np.intp)
+    key = label_a * (total + 1) + label_b
+    order = np.lexsort((where, touch, key))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = key[order][1:] != key[order][:-1]
+    order = order[first]
+    order = order[np.argsort(touch[order], kind='mergesort')]
+    return label_a[order], label_b[order], touch[order], where[order]
+
+
+### Objects merged at each dilation step by iteratively dilating and relabeling
+def dilation_merges(dilation_iterations, labels_open):
+    dilating, total = measurements.label(labels_open)
+    prev_merged = 0
+    object_count = []
+    for i in range(1, dilation_iterations):
+        # Erode objects 1 pixel width at a time
+        # (2  objects touching side of edge at time, so 2 pixels off cell wall)
+        dilating = morphology.binary_dilation(dilating, iterations=1)
+        # Label objects within image and count number of objects
+        labels_open, num_objects_open = measurements.label(dilating)
+        merged_objects = total - num_objects_open
+        object_count.append(merged_objects - prev_merged)
+        prev_merged = merged_objects
+    return object_count
+
+
+### Objects merged at each dilation step from a single distance transform
+def distance_merges(dilation_iterations, labels_open):
+    # Returns the same counts and touching pairs as incremental_merges
+    (base, total, label_a, label_b, touch,
+     where) = touching_pairs(labels_open,
+                              max(dilation_iterations - 1, 0))
+    object_count = count_merges(dilation_iterations, label_a, label_b, touch,
+                                total)
+    return object_count, label_a, label_b, touch, where
+
+
+### Objects merged at each dilation step, from pairs ordered by touching step
+def count_merges(dilation_iterations, label_a, label_b, touch, total):
+    object_count = [0] * max(dilation_iterations - 1, 0)
+    sets = UnionFind(total + 1)
+    for a, b, step in zip(label_a.tolist(), label_b.tolist(),
+                          touch.tolist()):
+        if step >= dilation_iterations:
+            break
+        if sets.union(a, b):
+            object_count[step - 1] += 1
+    return object_count
+
+
+### Grow labels one ring per dilation step and track merges with a union-find
+def incremental_merges(dilation_iterations, labels_open):
+    # Returns the number of objects merged at each step (as dilation_merges)
+    # and every pair of objects that touched, with the step they touched at
+    # and the flat index of the pixel where they touched
+    grown, total = measurements.label(labels_open)
+    rows, cols = grown.shape
+    owner = grown.ravel()  # owning object of every covered pixel, 0 if not
+    sets = UnionFind(total + 1)
+    object_count = []
+    firsts, seconds, touch, where = [], [], [], []
+
+    # the first frontier is every object pixel next to the background
+    objects = grown > 0
+    frontier = np.flatnonzero(objects & ~morphology.binary_erosion(objects))
+    for i in range(1, dilation_iterations):
+        if len(frontier) == 0:  # whole image covered, nothing left to merge
+            object_count.append(0)
+            continue
+        # cover the uncovered neighbours of the frontier
+        grew = []
+        for src, dst in neighbours(frontier, rows, cols):
+            grew.append(dst[owner[dst] == 0])
+        frontier = np.unique(np.concatenate(grew))
+        grow_owners(frontier, owner, rows, cols)
+
+        # objects touch where a new pixel borders another object's pixel
+        a = []
+        b = []
+        contact = []
+        for src, dst in neighbours(frontier, rows, cols):
+            other = owner[dst]
+            touching = (other != 0) & (other != owner[src])
+            a.append(owner[src[touching]])
+            b.append(other[touching])
+            contact.append(src[touching])
+        # each pair once per step, at its first contact pixel
+        a = np.concatenate(a).astype(np.intp)
+        b = np.concatenate(b).astype(np.intp)
+        key = np.minimum(a, b) * (total + 1) + np.maximum(a, b)
+        contact = np.concatenate(contact)
+        order = np.lexsort((contact, key))
+        key = key[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = key[1:] != key[:-1]
+        key = key[first]
+        contact = contact[order][first]
+        a = key // (total + 1)
+        b = key % (total + 1)
+        merged = 0
+        for label_a, label_b in zip(a.tolist(), b.tolist()):
+            if sets.union(label_a, label_b):
+                merged += 1
+        object_count.append(merged)
+        firsts.append(a)
+        seconds.append(b)
+        touch.append(np.repeat(i, len(a)))
+        where.append(contact)
+
+    if not touch:
+        empty = np.zeros(0, dtype=np.intp)
+        return object_count, empty, empty, empty, empty
+    label_a, label_b, touch, where = first_contacts(
+        np.concatenate(firsts), np.concatenate(seconds),
+        np.concatenate(touch), np.concatenate(where), total)
+    return object_count, label_a, label_b, touch, where
+
+
+### (pixel, 4-connected neighbour) flat index pairs for pixels inside the image
+def neighbours(pixels, rows, cols):
+    row = pixels // cols
+    col = pixels % cols
+    yield pixels[row > 0], pixels[row > 0] - cols
+    yield pixels[row < rows - 1], pixels[row < rows - 1] + cols
+    yield pixels[col > 0], pixels[col > 0] - 1
+    yield pixels[col < cols - 1], pixels[col < cols - 1] + 1
+
+
+### Objects merged at each dilation step, with the chosen width engine
+def merge_counts(dilation_iterations, labels_open, width_mode='dilation'):
+    if width_mode == 'distance':
+        return distance_merges(dilation_iterations, labels_open)[0]
+    elif width_mode == 'incremental':
+        return incremental_merges(dilation_iterations, labels_open)[0]
+    elif width_mode == 'dilation':
+        return dilation_merges(dilation_iterations, labels_open)
+    raise ValueError("width_mode must be one of %s, not %r" %
+                     (', '.join(WIDTH_MODES), width_mode))
+
+
+### Merge counts plus a table of the wall width between each touching pair
+def wall_widths(dilation_iterations, labels_open, width_mode='dilation'):
+    # The distance and incremental engines find the pairs as they count;
+    # the dilation engine only counts, and its table is None (the other
+    # engines give the same counts, so they are the way to get the pairs)
+    if width_mode == 'distance':
+        (object_count, label_a, label_b, touch,
+         where) = distance_merges(dilation_iterations, labels_open)
+    elif width_mode == 'incremental':
+        (object_count, label_a, label_b, touch,
+         where) = incremental_merges(dilation_iterations, labels_open)
+    else:
+        return merge_counts(dilation_iterations, labels_open,
+                            width_mode), None
+    table = pair_table(label_a, label_b, touch, where,
+                       np.shape(labels_open), dilation_iterations)
+    return object_count, table
+
+
+### Columns of (label_a, label_b, width_px, contact_x, contact_y) per wall
+def pair_table(label_a, label_b, touch, where, shape, dilation_iterations):
+    # only walls within the measured widths, as in the widths_*.tsv file;
+    # contact_x, contact_y is the row, column of the pixel where they touched
+    keep = touch < dilation_iterations
+    where = where[keep]
+    return {'label_a': label_a[keep].astype(np.int32),
+            'label_b': label_b[keep].astype(np.int32),
+            'width_px': (touch[keep] * 2).astype(np.int32),
+            'contact_x': (where // shape[1]).astype(np.int32),
+            'contact_y': (where % shape[1]).astype(np.int32)}
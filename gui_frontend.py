@@ -7,6 +7,7 @@
 from Tkinter import Frame, Tk, BOTH, Text, Menu, END, RIGHT, RAISED
 import tkFileDialog
 from ttk import Frame, Button, Style
+import tkMessageBox
 from PIL import Image, ImageTk
 import os
 
@@ -20,7 +21,14 @@ import os
 #  perimeter_max = 350 pixels                                                 #
 #  pixel_conversion = 1                                                       #
 ###############################################################################
-from cell_wall_erosion import *
+from cww_batch import batch_process, find_images
+
+# The settings above (those of cell_wall_erosion.py, which this GUI used to
+# run), as cww_presets.format_values gives them: mean threshold, blur 3, one
+# opening and no closing with a 3x3 element, 15 dilations, area and perimeter
+# cut-offs, dilation width engine; its all_widths_ tables have a line per wall
+SCRIPT_PRESET = ['mean', 3, 1, 0, 15, 3000, 350,
+                 [[1, 1, 1], [1, 1, 1], [1, 1, 1]], 'dilation']
 
 class gui(Frame):
 
@@ -60,18 +68,38 @@ class gui(Frame):
             print fl
             #text = self.readFile(fl)
             #self.txt.insert(END, text)
-            run_this = "python cell_wall_erosion.py " + fl
-            os.system(run_this)
+            self.runFiles([fl])
 
     def onOpenDir(self):
-        dirname = tkFileDialog.askdirectory(parent=root, initialdir="/",
-                                            title="Please select a directory")
-        directory = dirname.show()
+        directory = tkFileDialog.askdirectory(
+            parent=self, initialdir="/", title="Please select a directory")
 
         if directory != '':
             print directory
-            run_this = "python frontend.py " + directory
-            os.system(run_this)
+            self.runFiles([directory])
+
+    # Analyze image files (and the images in directories) with SCRIPT_PRESET
+    # into the current directory, showing any errors in a dialog
+    def runFiles(self, inputs):
+        files = find_images(inputs)
+        if not files:
+            tkMessageBox.showerror("pyCWW", "No image files found in " +
+                                   ", ".join(inputs))
+            return
+        failed = []
+        try:
+            for (each_file, outs, error) in batch_process(
+                    files, '.', SCRIPT_PRESET, all_widths='lines'):
+                if error is not None:
+                    print error
+                    failed.append(each_file)
+        except Exception as err:
+            tkMessageBox.showerror("pyCWW", "The batch failed: %s" % err)
+            return
+        if failed:
+            tkMessageBox.showerror("pyCWW", "%d of %d files failed:\n%s" %
+                                   (len(failed), len(files),
+                                    "\n".join(failed)))
 
 
 
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# encoding: utf-8
+###############################################################################
+#  Command-line interface for pyCWW, for running the analysis on servers or   #
+#  in scripts without wx.  Uses the presets in config.xml and runs the        #
+#  functions in cell_wall_erosion_fxn.py in-process, on a pool of workers.    #
+#                                                                             #
+#  List the presets:                                                          #
+#    python pycww.py presets                                                  #
+#  Analyze images, directories of images or glob patterns (quoted); -r also   #
+#  searches the subdirectories of the directories given:                      #
+#    python pycww.py run --preset Confocal --jobs 8 -o results images/        #
+#    python pycww.py run --preset Confocal_Avg -r data/ "more/*.tif"          #
+#  Analyze a multi-page TIFF as a z-stack, following its cells in 3D:         #
+#    python pycww.py run --preset Confocal --stack --label-3d zstack.tif      #
+#  Write the tables of all images to one results store, then export them:     #
+#    python pycww.py run --preset Confocal --results store -o plots images/   #
+#    python pycww.py export store -o tables                                   #
+#  Write the widths in an all_widths_ table one wall per line:                #
+#    python pycww.py expand-widths results/all_widths_image.tsv               #
+###############################################################################
+
+import os
+import sys
+import json
+import argparse
+from collections import OrderedDict
+# plots are only ever saved to files from the command line (the backend is
+# read when matplotlib is first loaded, which is only to draw a plot)
+os.environ['MPLBACKEND'] = 'Agg'
+
+import cww_presets
+import cww_profile
+from cww_log import setup_logging, verbosity_level
+from cww_widths import WIDTH_MODES
+from cww_batch import STAGES, IMAGE_TYPES, batch_process, find_images
+from cww_output import AtomicFile, write_lines
+from cww_results import (ResultStore, export_tsvs, expand_widths,
+                         ALL_WIDTHS_FORMATS)
+
+app_path = os.path.dirname(os.path.abspath(__file__))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='pycww',
+        description="Find cell wall widths and cell area and perimeter "
+                    "from microscopy images.")
+    parser.add_argument('--config', default=os.path.join(app_path,
+                                                         'config.xml'),
+                        help="presets file (default: config.xml next to "
+                             "this script)")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="log each image's progress; twice to also log "
+                             "some of its cells and wall widths")
+    parser.add_argument('-q', '--quiet', action='count', default=0,
+                        help="log only errors")
+    commands = parser.add_subparsers(dest='command')
+
+    presets = commands.add_parser('presets', help="list the presets")
+    presets.set_defaults(func=list_presets)
+
+    run = commands.add_parser('run', help="analyze image files")
+    run.add_argument('inputs', nargs='+', metavar='INPUT',
+                     help="image files, directories or glob patterns")
+    run.add_argument('-p', '--preset', required=True,
+                     help="name of the preset in the config file to use")
+    run.add_argument('-j', '--jobs', type=int, default=None,
+                     help="number of images to process at once "
+                          "(default: number of CPUs)")
+    run.add_argument('-o', '--output', default='.',
+                     help="directory for the output files (default: .)")
+    run.add_argument('-r', '--recursive', action='store_true',
+                     help="also search the subdirectories of directory "
+                          "inputs (glob patterns are not recursive)")
+    run.add_argument('--pattern', action='append', dest='patterns',
+                     help="file pattern to pick from directories, may be "
+                          "repeated (default: %s)" % ' '.join(IMAGE_TYPES))
+    run.add_argument('--stages', default=','.join(STAGES),
+                     help="comma separated stages to run after processing "
+                          "the image (default: %(default)s)")
+    run.add_argument('--width-mode', choices=WIDTH_MODES,
+                     help="override the preset's cell wall width engine")
+    run.add_argument('--unordered', action='store_true',
+                     help="report files as they finish instead of in order")
+    run.add_argument('--tile-size', type=int, metavar='PIXELS',
+                     help="process each image in tiles of this size, for "
+                          "images too large to process at once (--jobs "
+                          "then sets how many tiles are processed at once)")
+    run.add_argument('--scratch-dir', metavar='DIR',
+                     help="with --tile-size, keep the labels of each image "
+                          "in temporary files in DIR instead of in memory")
+    run.add_argument('--cache-dir', metavar='DIR',
+                     help="keep the image processing results in DIR and reuse "
+                          "them when the same image is run with the same "
+                          "settings")
+    run.add_argument('--cache-size', type=float, default=1024, metavar='MB',
+                     help="size limit of the cache; the least recently used "
+                          "results are removed past it (default: "
+                          "%(default)s MB)")
+    run.add_argument('--page', type=int, default=1,
+                     help="page of multi-page files to analyze, counting "
+                          "from 1 (default: 1)")
+    run.add_argument('--stack', action='store_true',
+                     help="analyze every page of each file as a slice of a "
+                          "z-stack or time series, into one table per file")
+    run.add_argument('--label-3d', action='store_true',
+                     help="with --stack, also label the cells in 3D to follow "
+                          "them across slices")
+    run.add_argument('--results', metavar='DIR',
+                     help="write the tables of all images to the results "
+                          "store DIR (one table each for images, cells, "
+                          "widths and pairs) instead of files per image")
+    run.add_argument('--all-widths', choices=ALL_WIDTHS_FORMATS,
+                     default='lines',
+                     help="write all_widths_<name>.tsv as lines (each "
+                          "wall's width on a line of its own; the default) "
+                          "or as runs (each width and its number of walls, "
+                          "much smaller for large images)")
+    run.add_argument('--no-plots', dest='plots', action='store_false',
+                     help="draw no plots, only write the tables")
+    run.add_argument('--thumbnails', action='store_true',
+                     help="draw small plots, which is much faster for large "
+                          "images")
+    run.add_argument('--profile', action='store_true',
+                     help="save the time and memory of each stage of every "
+                          "image to profile_<name>.json, and of the whole "
+                          "batch to profile_summary.json")
+    run.set_defaults(func=run_files)
+
+    export = commands.add_parser('export', help="write the per-image files "
+                                 "of the images in a results store")
+    export.add_argument('results', metavar='DIR',
+                        help="results store written by run --results")
+    export.add_argument('-o', '--output', default='.',
+                        help="directory for the files (default: .)")
+    export.add_argument('images', nargs='*', metavar='IMAGE',
+                        help="names of the images to export (default: all)")
+    export.add_argument('--all-widths', choices=ALL_WIDTHS_FORMATS,
+                        default='lines',
+                        help="format of all_widths_<name>.tsv, as for run "
+                             "(default: lines)")
+    export.set_defaults(func=export_files)
+
+    expand = commands.add_parser('expand-widths', help="write the width of "
+                                 "every wall in all_widths_ tables on a line "
+                                 "of its own")
+    expand.add_argument('tables', nargs='+', metavar='TABLE',
+                        help="all_widths_ (or widths_) tables, in either "
+                             "format")
+    expand.add_argument('-o', '--output', metavar='FILE',
+                        help="file to write to (default: standard output)")
+    expand.set_defaults(func=expand_files)
+    return parser
+
+
+def list_presets(parser, args):
+    presets = cww_presets.read_presets(args.config)
+    for name in sorted(presets):
+        print name
+    return 0
+
+
+def run_files(parser, args):
+    presets = cww_presets.read_presets(args.config)
+    if args.preset not in presets:
+        parser.error("no preset named %s in %s (choose from %s)" %
+                     (args.preset, args.config, ', '.join(sorted(presets))))
+    try:
+        formatted = cww_presets.format_values(presets[args.preset])
+    except ValueError as error:
+        parser.error("preset %s: %s" % (args.preset, error))
+    if args.width_mode:
+        formatted[8] = args.width_mode
+    if args.tile_size is not None and args.tile_size < 1:
+        parser.error("--tile-size must be at least 1")
+    if args.stack and args.tile_size:
+        parser.error("--stack and --tile-size cannot be used together")
+    if args.label_3d and not args.stack:
+        parser.error("--label-3d needs --stack")
+    if args.stack and args.results:
+        parser.error("--stack and --results cannot be used together")
+    if args.page < 1:
+        parser.error("--page must be at least 1")
+    if args.stack and args.page != 1:
+        parser.error("--stack analyzes every page, so --page cannot be used")
+    stages = tuple(s.strip() for s in args.stages.split(',') if s.strip())
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error("unknown stage %s (choose from %s)" %
+                         (stage, ', '.join(STAGES)))
+
+    files = find_images(args.inputs, args.patterns or IMAGE_TYPES,
+                        args.recursive)
+    if not files:
+        parser.error("no image files found")
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    failed = []
+    results = batch_process(files, args.output, formatted, stages,
+                            args.jobs, not args.unordered,
+                            tile_size=args.tile_size,
+                            scratch_dir=args.scratch_dir,
+                            stack=args.stack, label_3d=args.label_3d,
+                            cache_dir=args.cache_dir,
+                            cache_size=int(args.cache_size * 1024 ** 2),
+                            profile=args.profile, results_dir=args.results,
+                            all_widths=args.all_widths, plots=args.plots,
+                            thumbnails=args.thumbnails, page=args.page - 1)
+    for (each_file, outs, error) in results:
+        if error is not None:
+            sys.stderr.write("%s failed:\n%s\n" % (each_file, error))
+            failed.append(each_file)
+        else:
+            print each_file, "->", args.results or outs[0]
+    print "%d of %d files done" % (len(files) - len(failed), len(files))
+    if args.profile:
+        write_summary(files, args.output)
+    if failed:
+        return 1
+    return 0
+
+
+def export_files(parser, args):
+    if not os.path.isdir(os.path.join(args.results, 'images')):
+        parser.error("%s is not a results store" % args.results)
+    store = ResultStore(args.results)
+    missing = set(args.images) - set(store.images())
+    if missing:
+        parser.error("no images named %s in %s" %
+                     (', '.join(sorted(missing)), args.results))
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    for image in export_tsvs(store, args.output, args.images,
+                             args.all_widths):
+        print image, "->", os.path.join(args.output, image + ".tsv")
+    return 0
+
+
+### Write the widths of all walls in the tables, one per line, as they are read
+def expand_files(parser, args):
+    for table in args.tables:
+        if not os.path.isfile(table):
+            parser.error("no file named %s" % table)
+    try:
+        widths = [expand_widths(table) for table in args.tables]
+    except ValueError as error:
+        parser.error(str(error))
+    output = AtomicFile(args.output) if args.output else sys.stdout
+    output.write('pixel_width\n')
+    for table in widths:
+        write_lines(output, (str(width) for width in table))
+    if args.output:
+        output.close()
+    return 0
+
+
+### Add up the profiles of the files into profile_summary.json and show it
+def write_summary(files, out_path):
+    profiles = []
+    for each_file in files:
+        name = os.path.join(out_path, os.path.basename(each_file))
+        path = cww_profile.profile_file(name)   # as name_files names it
+        if os.path.exists(path):
+            with open(path) as f:
+                profiles.append(json.load(f, object_pairs_hook=OrderedDict))
+    summary = cww_profile.summarize(profiles)
+    with AtomicFile(os.path.join(out_path, 'profile_summary.json'),
+                    'w') as f:
+        json.dump(summary, f, indent=1)
+    print "%-12s %10s %10s %7s" % ('stage', 'seconds', 'cpu', 'share')
+    for name, totals in summary['stages'].items():
+        print "%-12s %10.2f %10.2f %6.1f%%" % (name, totals['seconds'],
+                                               totals['cpu_seconds'],
+                                               100 * totals['share'])
+    if summary['peak_rss_mb'] is not None:
+        print "Peak memory of one image: %.0f MB" % summary['peak_rss_mb']
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    setup_logging(verbosity_level(args.verbose, args.quiet))
+    return args.func(parser, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+# Tests of the image processing in cell_wall_erosion_fxn
+#
+# python -m unittest test_cell_wall_erosion_fxn
+
+import unittest
+import numpy as np
+from scipy.ndimage import measurements, gaussian_filter
+
+from cww_functions import histeq, histeq_lut
+from cell_wall_erosion_fxn import preprocess, open_close
+
+# Settings the fixed image is processed with (blur, opening, closing, element)
+GAUSS_BLUR = 3
+OPEN_ITERATIONS = 1
+CLOSE_ITERATIONS = 1
+ELEMENT = [[1, 1, 1], [1, 1, 1], [1, 1, 1]]
+
+
+### A fixed 8-bit image of dark blobs on bright walls, with noise
+def fixed_image(size=256, seed=0):
+    rng = np.random.RandomState(seed)
+    field = gaussian_filter(rng.normal(0, 1, (size, size)), 6)
+    image = np.where(field > 0, 60, 190) + rng.normal(0, 12, field.shape)
+    return np.clip(np.round(image), 0, 255).astype(np.uint8)
+
+
+### Labels of the image as process_image found them before the lookup table
+def histeq_labels(im_raw, threshold):
+    # equalize the whole image as floats with histeq, blur it as float64 and
+    # take the mean of the grey (> 0) pixels for the 'mean' threshold
+    im, cdf = histeq(im_raw)
+    if threshold == 'mean':
+        threshold = im[im > 0].mean()
+    im = gaussian_filter(im, GAUSS_BLUR)
+    im_open = open_close(im < threshold, ELEMENT, OPEN_ITERATIONS,
+                         CLOSE_ITERATIONS)
+    return measurements.label(im_open)[0], threshold
+
+
+### Labels of the image as process_image finds them now
+def lut_labels(im_raw, threshold):
+    im, threshold = preprocess(im_raw, threshold, GAUSS_BLUR)
+    im_open = open_close(im, ELEMENT, OPEN_ITERATIONS, CLOSE_ITERATIONS)
+    return measurements.label(im_open)[0], threshold
+
+
+class TestPreprocess(unittest.TestCase):
+
+    ### The lookup table gives the labels histeq gave, for a fixed threshold
+    def test_fixed_threshold_labels(self):
+        im_raw = fixed_image()
+        for threshold in (100, 170):
+            expected, level = histeq_labels(im_raw, threshold)
+            found, level = lut_labels(im_raw, threshold)
+            np.testing.assert_array_equal(found, expected)
+
+    ### ... and for the mean threshold, which is the same level too
+    def test_mean_threshold_labels(self):
+        im_raw = fixed_image(seed=1)
+        expected, expected_level = histeq_labels(im_raw, 'mean')
+        found, level = lut_labels(im_raw, 'mean')
+        self.assertAlmostEqual(level, expected_level, places=6)
+        np.testing.assert_array_equal(found, expected)
+
+    ### The lookup table maps each grey level as histeq maps its pixels
+    def test_lut_is_histeq(self):
+        im_raw = fixed_image(seed=2)
+        lut, cdf, counts = histeq_lut(im_raw)
+        np.testing.assert_allclose(lut[im_raw], histeq(im_raw)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+# Tests of the deferred plot jobs in cww_plots
+#
+# python -m unittest test_cww_plots
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import numpy as np
+
+from cww_plots import plot_job, add_distribution, defer, render, use_agg
+from cww_batch import render_in_worker, Cancelled
+
+
+class TestDefer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.job = plot_job(os.path.join(self.directory, 'cells.png'))
+        add_distribution(self.job, [2, 4, 6], [3, 0, 1], 3)
+        use_agg()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    ### A deferred job is saved next to its plots and removed once drawn
+    def test_file_next_to_plots(self):
+        job = defer(self.job)
+        self.assertEqual(os.path.dirname(job['data']), self.directory)
+        with np.load(job['data']) as stored:
+            np.testing.assert_array_equal(stored['object_count'], [3, 0, 1])
+        render(job)
+        self.assertEqual(os.listdir(self.directory),
+                         ['distribution_cells.png'])
+
+    ### A job that is never drawn is removed too
+    def test_cancelled_job_removed(self):
+        job = defer(self.job)
+        cancel = threading.Event()
+        cancel.set()
+        self.assertRaises(Cancelled, render_in_worker, 'cells.tif', job,
+                          cancel=cancel)
+        self.assertFalse(os.path.exists(job['data']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# Tests of the results store in cww_results
+#
+# python -m unittest test_cww_results
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+
+from cww_results import (ResultStore, TABLES, write_all_widths_tsv,
+                         expand_widths)
+from cww_batch import batch_process
+from test_cell_wall_erosion_fxn import fixed_image
+
+# Images put in the store
+IMAGES = 60
+
+# Settings the images of a batch are analyzed with, as from format_values
+FORMATTED = ['mean', 3, 1, 1, 6, 3000, 350, [[1, 1, 1], [1, 1, 1], [1, 1, 1]],
+             'distance']
+
+
+### Files under a directory
+def count_files(directory):
+    return sum(len(files) for root, dirs, files in os.walk(directory))
+
+
+### Random columns of every table for an image (some with no rows)
+def random_tables(rng, image):
+    cells = rng.randint(0, 5)
+    walls = rng.randint(0, 3)
+    return {'images': {'path': np.array(['/data/%s.tif' % image]),
+                       'objects': np.array([cells], np.int32)},
+            'cells': {'object_label': np.arange(cells, dtype=np.int32),
+                      'area': rng.rand(cells)},
+            'widths': {'pixel_width': np.arange(2, 8, 2),
+                       'num_cell_walls': rng.randint(0, 9, 3)},
+            'pairs': {'label_a': rng.randint(1, 9, walls).astype(np.int32),
+                      'width_px': rng.randint(2, 9, walls)}}
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Every table of every image in the store, and every whole table
+    def contents(self, store):
+        return (dict(((table, image), store.get(table, image))
+                     for table in TABLES for image in store.images(table)),
+                dict((table, store.read_table(table)) for table in TABLES))
+
+    def assertSameContents(self, found, expected):
+        for part, other in zip(found, expected):
+            self.assertEqual(sorted(part), sorted(other))
+            for key in part:
+                self.assertEqual(sorted(part[key]), sorted(other[key]))
+                for name in part[key]:
+                    np.testing.assert_array_equal(part[key][name],
+                                                  other[key][name])
+
+    ### Closing joins many images' chunks into a file per table
+    def test_close_joins_chunks(self):
+        rng = np.random.RandomState(0)
+        store = ResultStore(self.directory)
+        for i in xrange(IMAGES):
+            image = 'image%02d' % i
+            for table, columns in random_tables(rng, image).items():
+                store.put(table, image, columns)
+        self.assertEqual(count_files(self.directory), IMAGES * len(TABLES))
+        before = self.contents(store)
+        store.close()
+        self.assertEqual(count_files(self.directory), len(TABLES))
+        self.assertSameContents(self.contents(ResultStore(self.directory)),
+                                before)
+        # an image run again replaces its rows, before and after closing
+        tables = random_tables(rng, 'image07')
+        for table, columns in tables.items():
+            store.put(table, 'image07', columns)
+        for closed in (False, True):
+            for table, columns in tables.items():
+                found = store.get(table, 'image07')
+                for name in columns:
+                    np.testing.assert_array_equal(found[name], columns[name])
+            self.assertEqual(store.images('cells'), sorted(
+                'image%02d' % i for i in xrange(IMAGES)))
+            store.close()
+        self.assertEqual(count_files(self.directory), len(TABLES))
+
+    ### A batch leaves one file per table in its store
+    def test_batch_files(self):
+        out_path = os.path.join(self.directory, 'out')
+        results_dir = os.path.join(self.directory, 'store')
+        os.makedirs(out_path)
+        files = []
+        for i in xrange(6):
+            files.append(os.path.join(self.directory, 'cells%d.tif' % i))
+            Image.fromarray(fixed_image(96, seed=i)).save(files[-1])
+        for file_in, outputs, error in batch_process(
+                files, out_path, FORMATTED, workers=1,
+                results_dir=results_dir, plots=False):
+            self.assertIsNone(error)
+        self.assertEqual(count_files(results_dir), len(TABLES))
+        self.assertEqual(ResultStore(results_dir).images(),
+                         ['cells%d' % i for i in xrange(6)])
+
+    ### all_widths_ has a line per wall unless runs are asked for
+    def test_all_widths_formats(self):
+        path = os.path.join(self.directory, 'all_widths_cells.tsv')
+        write_all_widths_tsv(path, [2, 4, 6], [2, 0, 1])
+        with open(path) as f:
+            self.assertEqual(f.read(), 'pixel_width\n2\n2\n6\n')
+        self.assertEqual(list(expand_widths(path)), [2, 2, 6])
+        write_all_widths_tsv(path, [2, 4, 6], [2, 0, 1], 'runs')
+        self.assertEqual(list(expand_widths(path)), [2, 2, 6])
+
+
+if __name__ == '__main__':
+    unittest.main()
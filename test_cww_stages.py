@@ -0,0 +1,137 @@
+# Tests of the memoized pipeline stages in cww_stages
+#
+# python -m unittest test_cww_stages
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+
+from cww_stages import Pipeline, STAGES
+from cww_functions import label_edges
+from cww_geometry import area_perimeter
+from cww_widths import wall_widths
+from cell_wall_erosion_fxn import process_image
+from test_cell_wall_erosion_fxn import fixed_image
+
+# Settings of the first run: threshold, blur, opening, closing, element
+SETTINGS = ('mean', 3, 1, 1, [[1, 1, 1], [1, 1, 1], [1, 1, 1]])
+DILATION_ITERATIONS = 6
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_in = os.path.join(self.directory, 'cells.tif')
+        Image.fromarray(fixed_image()).save(self.file_in)
+        self.pipeline = Pipeline()
+        self.counts = {}   # times each stage had run, at the last ran()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Stages run since the last call (and the counts so far)
+    def ran(self):
+        runs = self.pipeline.runs
+        changed = set(stage for stage in STAGES
+                      if runs[stage] != self.counts.get(stage, 0))
+        self.counts = dict(runs)
+        return changed
+
+    # process_image's results with the pipeline, for these settings
+    def images(self, threshold, gauss_blur, binary_open_iterations,
+               binary_close_iterations, structuring_element):
+        return self.pipeline.process_image(
+            self.file_in, None, threshold, gauss_blur, binary_open_iterations,
+            binary_close_iterations, DILATION_ITERATIONS, 0, 0,
+            structuring_element)
+
+    ### The pipeline gives process_image's results
+    def test_same_as_process_image(self):
+        expected = process_image(self.file_in, None, SETTINGS[0],
+                                 *(SETTINGS[1:4] + (DILATION_ITERATIONS, 0, 0,
+                                                    SETTINGS[4])))
+        found = self.images(*SETTINGS)
+        for name, a, b in zip(('image', 'labels', 'y', 'x', 'contours'),
+                              found, expected):
+            np.testing.assert_array_equal(a, b, name)
+        labels = found[1]
+        merged, pairs = self.pipeline.wall_widths(
+            self.file_in, *(SETTINGS + (DILATION_ITERATIONS, 'distance')))
+        widths = wall_widths(DILATION_ITERATIONS, labels, 'distance')
+        self.assertEqual(merged, widths[0])
+        for key in pairs:
+            np.testing.assert_array_equal(pairs[key], widths[1][key], key)
+        # as area_perim finds them from process_image's labels and contours
+        labels, edge_coords, offsets = label_edges(labels, expected[4])
+        found = self.pipeline.cell_areas(self.file_in, *SETTINGS)
+        expected = (labels,) + area_perimeter(edge_coords, offsets)
+        for name, a, b in zip(('labels', 'areas', 'perimeters'), found,
+                              expected):
+            np.testing.assert_array_equal(a, b, name)
+
+    ### A changed setting runs only the stages downstream of it
+    def test_downstream_stages_run(self):
+        self.images(*SETTINGS)
+        self.assertEqual(self.ran(), set(STAGES) - set(['widths', 'area']))
+        self.images(*SETTINGS)
+        self.assertEqual(self.ran(), set())
+        # a new closing reuses the read, equalized, blurred and opened image
+        self.images(SETTINGS[0], SETTINGS[1], SETTINGS[2], 2, SETTINGS[4])
+        self.assertEqual(self.ran(), set(['close', 'label', 'contours',
+                                          'centroids']))
+        # a new threshold reuses the blurred image and its histogram
+        self.images(150, SETTINGS[1], SETTINGS[2], 2, SETTINGS[4])
+        self.assertEqual(self.ran(), set(['threshold', 'mask', 'open',
+                                          'close', 'label', 'contours',
+                                          'centroids']))
+        # the last results are kept, so going back runs nothing
+        self.images(SETTINGS[0], SETTINGS[1], SETTINGS[2], 2, SETTINGS[4])
+        self.assertEqual(self.ran(), set())
+
+    ### Widths and areas run on the labels already found
+    def test_widths_and_areas(self):
+        self.images(*SETTINGS)
+        self.ran()
+        widths = SETTINGS + (DILATION_ITERATIONS, 'dilation')
+        self.pipeline.wall_widths(self.file_in, *widths)
+        self.assertEqual(self.ran(), set(['widths']))
+        self.pipeline.wall_widths(self.file_in, *widths[:5] + (8, 'dilation'))
+        self.assertEqual(self.ran(), set(['widths']))
+        self.pipeline.wall_widths(self.file_in, *widths)
+        self.assertEqual(self.ran(), set())
+        self.pipeline.cell_areas(self.file_in, *SETTINGS)
+        self.assertEqual(self.ran(), set(['area']))
+
+    ### A preview through every pyramid level keeps the results of each level
+    def test_preview_levels(self):
+        Image.fromarray(fixed_image(512)).save(self.file_in)
+        levels = range(len(self.pipeline.pyramid(self.file_in)) - 1, -1, -1)
+        formatted = list(SETTINGS[:4]) + [DILATION_ITERATIONS, 0, 0,
+                                          SETTINGS[4], 'dilation']
+        for level in levels:
+            self.pipeline.preview(self.file_in, formatted, level)
+        self.ran()
+        before = dict(self.pipeline.runs)
+        # a new threshold runs the stages after it once at each level
+        formatted[0] = 150
+        for level in levels:
+            self.pipeline.preview(self.file_in, formatted, level)
+        changed = set(['threshold', 'mask', 'open', 'close', 'label',
+                       'contours', 'centroids'])
+        self.assertEqual(self.ran(), changed)
+        for stage in changed:
+            self.assertEqual(self.pipeline.runs[stage] - before[stage],
+                             len(levels), stage)
+        # and going back to the first threshold runs nothing
+        formatted[0] = SETTINGS[0]
+        for level in levels:
+            self.pipeline.preview(self.file_in, formatted, level)
+        self.assertEqual(self.ran(), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
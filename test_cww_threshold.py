@@ -0,0 +1,59 @@
+# Tests of the histogram thresholds in cww_threshold
+#
+# python -m unittest test_cww_threshold
+
+import unittest
+import numpy as np
+
+from cww_functions import histeq_lut
+from cww_threshold import find_threshold, otsu_threshold
+
+
+### Threshold of an 8-bit image, found from its histogram as process_image does
+def image_threshold(im_raw, threshold):
+    lut, cdf, counts = histeq_lut(im_raw)
+    return find_threshold(threshold, counts, lut)
+
+
+class TestOtsu(unittest.TestCase):
+
+    ### A blank image has one grey level, which is its threshold
+    def test_uniform(self):
+        self.assertEqual(otsu_threshold([0, 0, 7, 0], np.arange(4.0)), 2.0)
+        # a blank 50 x 50 page, whose one level is rebinned to 255.5
+        im_raw = np.full((50, 50), 50, np.uint8)
+        self.assertEqual(image_threshold(im_raw, 'otsu'), 255.5)
+        for method in ('mean', 'triangle', 'percentile:50'):
+            self.assertTrue(np.isfinite(image_threshold(im_raw, method)),
+                            method)
+
+    ### Two grey levels are split just above the darker one
+    def test_two_levels(self):
+        self.assertEqual(otsu_threshold([0, 5, 0, 0, 3, 0], np.arange(6.0)),
+                         1.5)
+        im_raw = np.zeros((40, 40), np.uint8)
+        im_raw[:, 10:] = 200
+        lut = histeq_lut(im_raw)[0]
+        threshold = image_threshold(im_raw, 'otsu')
+        self.assertTrue(lut[0] < threshold < lut[200])
+
+    ### Two well separated peaks are split between them
+    def test_bimodal(self):
+        levels = np.arange(256.0)
+        counts = (1000 * np.exp(-(levels - 60) ** 2 / 200.0) +
+                  500 * np.exp(-(levels - 190) ** 2 / 200.0))
+        threshold = otsu_threshold(counts, levels)
+        self.assertTrue(110 < threshold < 140, threshold)
+        # nearly the same split of an image of two peaks, which equalization
+        # spreads over all grey levels
+        rng = np.random.RandomState(0)
+        im_raw = np.where(rng.rand(128, 128) < 0.5, 60, 190)
+        im_raw = np.clip(im_raw + rng.normal(0, 8, im_raw.shape), 0, 255)
+        im_raw = im_raw.astype(np.uint8)
+        lut = histeq_lut(im_raw)[0]
+        dark = lut[im_raw] < image_threshold(im_raw, 'otsu')
+        self.assertTrue((dark == (im_raw < 125)).mean() > 0.95)
+
+
+if __name__ == '__main__':
+    unittest.main()
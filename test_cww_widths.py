@@ -0,0 +1,81 @@
+# Tests of the wall width engines in cww_widths (and their tiled form)
+#
+# python -m unittest test_cww_widths
+
+import unittest
+import numpy as np
+from scipy.ndimage import measurements, morphology
+
+from cww_widths import WIDTH_MODES, wall_widths, nearest_owners
+from cww_tiles import tiled_wall_widths
+
+# Random label images tested, and the largest side of each
+IMAGES = 200
+MAX_SIDE = 60
+
+
+### Random sparse object masks of random shapes, with a dilation count each
+def random_images(seed=0):
+    rng = np.random.RandomState(seed)
+    for i in xrange(IMAGES):
+        shape = rng.randint(5, MAX_SIDE, 2)
+        yield (rng.rand(*shape) < rng.uniform(0.05, 0.5),
+               rng.randint(1, 12))
+
+
+class TestWidthEngines(unittest.TestCase):
+
+    ### Every engine counts the same merges at every step
+    def test_same_counts(self):
+        for labels_open, dilation_iterations in random_images():
+            counts = [wall_widths(dilation_iterations, labels_open, mode)[0]
+                      for mode in WIDTH_MODES]
+            for count in counts[1:]:
+                self.assertEqual(count, counts[0])
+
+    ### The distance and incremental engines report the same pair tables
+    def test_same_pairs(self):
+        for labels_open, dilation_iterations in random_images(1):
+            distance = wall_widths(dilation_iterations, labels_open,
+                                   'distance')[1]
+            incremental = wall_widths(dilation_iterations, labels_open,
+                                      'incremental')[1]
+            for key in distance:
+                np.testing.assert_array_equal(distance[key],
+                                              incremental[key], key)
+
+    ### Tiles give what the whole image gives, with every engine
+    def test_tiles_match_whole_image(self):
+        rng = np.random.RandomState(2)
+        for labels_open, dilation_iterations in random_images(2):
+            labels, total = measurements.label(labels_open)
+            tile_size = rng.randint(3, 20)
+            for mode in WIDTH_MODES:
+                whole = wall_widths(dilation_iterations, labels_open, mode)
+                tiled = tiled_wall_widths(dilation_iterations, labels, total,
+                                          tile_size, width_mode=mode)
+                self.assertEqual(tiled[0], whole[0])
+                if whole[1] is None:
+                    self.assertIsNone(tiled[1])
+                    continue
+                for key in whole[1]:
+                    np.testing.assert_array_equal(tiled[1][key],
+                                                  whole[1][key], key)
+
+    ### A pixel as far from several objects goes to the lowest label
+    def test_tie_to_lowest_label(self):
+        # objects 1, 2 and 3 are all 2 steps from the top middle pixel
+        base = np.array([[1, 0, 0, 0, 2],
+                         [0, 0, 0, 0, 0],
+                         [0, 0, 3, 0, 0]], np.int32)
+        steps = morphology.distance_transform_cdt(base == 0,
+                                                  metric='taxicab')
+        np.testing.assert_array_equal(
+            nearest_owners(base, steps).reshape(base.shape),
+            [[1, 1, 1, 2, 2],
+             [1, 1, 3, 2, 2],
+             [1, 3, 3, 3, 2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
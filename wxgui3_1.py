@@ -18,7 +18,20 @@ import os
 import glob
 import xml.etree.ElementTree as et
 import json
+import threading
+import traceback
+from matplotlib import pyplot as plt
 from cell_wall_erosion_fxn import *
+from cww_draw import plot_image
+from cww_batch import default_workers
+from cww_cache import ImageCache
+from cww_jobs import BatchJob, format_duration
+from cww_log import logger, setup_logging
+from cww_stages import Pipeline
+from cww_preview import first_level
+import cww_presets
+from cww_threshold import valid_threshold
+from cww_widths import WIDTH_MODES
 
 
 class Frame(wx.Frame):
@@ -51,6 +64,9 @@ class Frame(wx.Frame):
         # initiate the presets menu
         presets_menu = wx.Menu()
         presets_menu.Append(ID_SET_OUTPUT, 'Choose Output File Location')
+        presets_menu.Append(ID_SET_WORKERS, 'Choose Number of Workers')
+        presets_menu.Append(ID_SET_PAGE, 'Choose Page of Multi-page Files')
+        presets_menu.Append(ID_CLEAR_CACHE, 'Clear Image Cache')
         presets_menu.AppendSeparator()
         presets_menu.Append(ID_SETTINGS_SAVE, 'Save Current Settings')
         presets_menu.Append(ID_SETTINGS_LOAD, 'Load Previous Settings')
@@ -77,6 +93,9 @@ class Frame(wx.Frame):
         wx.EVT_MENU(self, ID_PRESETS_HELP, self.PresetHelp)
         wx.EVT_MENU(self, ID_PRESETS_CUSTOM, self.PresetConfig)
         wx.EVT_MENU(self, ID_SET_OUTPUT, self.SetOut)
+        wx.EVT_MENU(self, ID_SET_WORKERS, self.SetWorkers)
+        wx.EVT_MENU(self, ID_SET_PAGE, self.SetPage)
+        wx.EVT_MENU(self, ID_CLEAR_CACHE, self.ClearCache)
         wx.EVT_MENU(self, ID_HELP_HELP, self.OnHelp)
         wx.EVT_MENU(self, ID_HELP_ABOUT, self.OnAbout)
         wx.EVT_MENU(self, ID_FILE_LIST_SAVE, self.FileListSave)
@@ -118,6 +137,8 @@ class Frame(wx.Frame):
         self.Bind(wx.EVT_BUTTON, self.UpdatePresetList, id=5)
         # put the image up on the panel
         self.MaxImageSize = 200
+        self.job = None        # the batch running in the background, if any
+        self.progress = None   # its progress dialog
 
     def HideDirs(self, evt):
         global full_file_list
@@ -134,6 +155,8 @@ class Frame(wx.Frame):
     def SaveSettings(self, evt):
         settings_dict = {}
         settings_dict['outpath'] = outpath
+        settings_dict['workers'] = num_workers
+        settings_dict['page'] = page_number
         file_list = self.file_list_box.GetStrings()
         settings_dict['file_list'] = '\n'.join(file_list)
         preset_choice = self.choose_preset.GetValue()
@@ -201,9 +224,11 @@ class Frame(wx.Frame):
             self.file_list_box.Append(entry)
 
     def importAllBut(self, preset):
-        global outpath
+        global outpath, num_workers, page_number
         old_file_list = preset['file_list'].split('\n')
         outpath = preset['outpath']
+        num_workers = preset.get('workers', num_workers)
+        page_number = preset.get('page', page_number)
         self.choose_preset.SetStringSelection(preset['preset_name'])
         for entry in old_file_list:
             self.file_list_box.Append(entry)
@@ -227,125 +252,129 @@ class Frame(wx.Frame):
         else:
             file_list = self.file_list_box.GetStrings()
         preset_choice = self.choose_preset.GetValue()
-        for each_file in file_list:
-            (file_out, png_name) = name_files(each_file, outpath)
-            print file_out, png_name
-            print each_file
-            formatted = []
-            formatted = Functions.formatValues(presets[preset_choice])
-            print formatted
-            (im_raw, labels_open, y_center, x_center,
-             contours) = process_image(each_file,
-                                       png_name,
-                                       formatted[0],
-                                       formatted[1],
-                                       formatted[2],
-                                       formatted[3],
-                                       formatted[4],
-                                       formatted[5],
-                                       formatted[6],
-                                       formatted[7])
-            plot_image(im_raw,
-                       labels_open,
-                       labels_open,
-                       y_center,
-                       x_center,
-                       contours,
-                       png_name,
-                       True)
+        formatted = Functions.formatValues(presets[preset_choice])
+        logger.debug("Settings: %s", formatted)
+        # the workers save the plots, then ShowPlots shows them here
+        self.RunBatch(file_list, formatted, ('plot',), self.ShowPlots)
+
+    def ShowPlots(self, outputs):
+        for (file_out, png_name) in outputs:
+            plt.figure(figsize=(10, 4))
+            plt.imshow(plt.imread(png_name))
+            plt.axis('off')
+            plt.show()
 
     def GetCWW(self, evt):
         if self.hide_directories.IsChecked():
             file_list = full_file_list
         else:
             file_list = self.file_list_box.GetStrings()
-        for each_file in file_list:
-            formatted = []
-            formatted = Functions.formatValues(presets[preset_choice])
-            print formatted
-            (file_out, png_name) = name_files(each_file, outpath)
-            (im_raw, labels_open, y_center, x_center,
-             contours) = process_image(each_file,
-                                       png_name,
-                                       formatted[0],
-                                       formatted[1],
-                                       formatted[2],
-                                       formatted[3],
-                                       formatted[4],
-                                       formatted[5],
-                                       formatted[6],
-                                       formatted[7])
-            cell_wall_widths(formatted[4],
-                             labels_open,
-                             file_out,
-                             png_name)
-            cell_aggregates(formatted[4],
-                            labels_open,
-                            file_out,
-                            png_name)
+        formatted = Functions.formatValues(presets[preset_choice])
+        logger.debug("Settings: %s", formatted)
+        self.RunBatch(file_list, formatted, ('widths',))
 
     def GetAP(self, evt):
         if self.hide_directories.IsChecked():
             file_list = full_file_list
         else:
             file_list = self.file_list_box.GetStrings()
-        for each_file in file_list:
-            (file_out, png_name) = name_files(each_file, outpath)
-            print file_out, png_name
-            print each_file
-            formatted = []
-            formatted = Functions.formatValues(presets[preset_choice])
-            print formatted
-            (im_raw, labels_open, y_center, x_center,
-             contours) = process_image(each_file,
-                                       png_name,
-                                       formatted[0],
-                                       formatted[1],
-                                       formatted[2],
-                                       formatted[3],
-                                       formatted[4],
-                                       formatted[5],
-                                       formatted[6],
-                                       formatted[7])
-            area_perim(int(presets[preset_choice][5]),
-                       int(presets[preset_choice][6]),
-                       labels_open,
-                       contours,
-                       file_out)
+        formatted = Functions.formatValues(presets[preset_choice])
+        logger.debug("Settings: %s", formatted)
+        self.RunBatch(file_list, formatted, ('area',))
 
     def RunAll(self, evt):
         file_list = self.file_list_box.GetStrings()
-        #labels_open_eroded = [[]
-        # print file_list
-        for each_file in file_list:
-            (file_out, png_name) = name_files(each_file, outpath)
-            formatted = []
-            formatted = Functions.formatValues(presets[preset_choice])
-            print formatted
-            (im_raw, labels_open, y_center, x_center,
-             contours) = process_image(each_file,
-                                       png_name,
-                                       formatted[0],
-                                       formatted[1],
-                                       formatted[2],
-                                       formatted[3],
-                                       formatted[4],
-                                       formatted[5],
-                                       formatted[6],
-                                       formatted[7])
-            cell_wall_widths(int(presets[preset_choice][4]),
-                             labels_open,
-                             file_out,
-                             png_name)
-            cell_aggregates(int(presets[preset_choice][4]),
-                            labels_open,
-                            file_out,
-                            png_name)
-            area_perim(int(presets[preset_choice][5]),
-                       int(presets[preset_choice][6]),
-                       labels_open,
-                       contours,
-                       file_out)
+        formatted = Functions.formatValues(presets[preset_choice])
+        logger.debug("Settings: %s", formatted)
+        self.RunBatch(file_list, formatted, ('widths', 'area'))
+
+    def RunBatch(self, file_list, formatted, stages, then=None):
+        # run the stages on every file with the worker pool (see cww_batch)
+        # in the background (see cww_jobs), with a progress dialog that can
+        # cancel the batch; a file that fails is reported without stopping
+        # the rest, and then is called with the outputs of the files done.
+        # Image processing results are cached, so e.g. Run All after Preview
+        # does not process the same images again
+        file_list = list(file_list)
+        if not file_list or (self.job is not None and self.job.running()):
+            return
+        self.progress = wx.ProgressDialog("Running", "Starting..." + " " * 60,
+                                          len(file_list), self,
+                                          wx.PD_CAN_ABORT |
+                                          wx.PD_ELAPSED_TIME)
+        self.job = BatchJob(file_list, outpath, formatted, stages,
+                            lambda status: wx.CallAfter(self.ShowProgress,
+                                                        status),
+                            lambda results, cancelled: wx.CallAfter(
+                                self.BatchDone, results, cancelled, then),
+                            workers=num_workers, cache_dir=cache_dir,
+                            page=page_number - 1)
+        self.job.start()
+
+    def ShowProgress(self, status):
+        if self.progress is None:   # the batch is over
+            return
+        message = "%s: %s\n%d of %d images done" % (
+            os.path.basename(status['file']), status['stage'],
+            status['done'], status['total'])
+        if status['failed']:
+            message += " (%d failed)" % status['failed']
+        if status['left'] is not None:
+            message += "\n%.1f images/min, about %s left" % (
+                status['rate'], format_duration(status['left']))
+        (keep_going, skip) = self.progress.Update(
+            min(status['done'], status['total'] - 1), message)
+        if not keep_going:
+            self.progress.Update(status['done'], "Cancelling...")
+            self.job.cancel()
+
+    def BatchDone(self, results, cancelled, then):
+        self.progress.Destroy()
+        self.progress = None
+        outputs = []
+        failed = []
+        for (each_file, outs, error) in results:
+            if error is not None:
+                logger.error("%s", error)
+                failed.append(str(each_file))
+            else:
+                logger.info("%s done", each_file)
+                outputs.append(outs)
+        if cancelled:
+            logger.info("Cancelled after %d of %d files", len(results),
+                        len(self.job.file_list))
+        if failed:
+            msg = "These files could not be processed:\n" + "\n".join(failed)
+            dlg = wx.MessageDialog(self, msg, 'Error!',
+                                   wx.OK | wx.ICON_INFORMATION)
+            dlg.ShowModal()
+            dlg.Destroy()
+        if then is not None and not cancelled:
+            then(outputs)
+
+    def SetWorkers(self, evt):
+        global num_workers
+        value = wx.GetNumberFromUser("Number of images to process at once:",
+                                     "Workers", "Number of Workers",
+                                     num_workers, 1, 256, self)
+        if value > 0:
+            num_workers = value
+
+    def SetPage(self, evt):
+        global page_number
+        value = wx.GetNumberFromUser("Page of multi-page (TIFF) files to "
+                                     "analyze:", "Page", "Page to Analyze",
+                                     page_number, 1, 100000, self)
+        if value > 0:
+            page_number = value
+
+    def ClearCache(self, evt):
+        global preview_stages
+        ImageCache(cache_dir).clear()
+        # a fresh pipeline instead of clearing the old one under the lock,
+        # which would wait for a preview being refined in the background;
+        # that preview finishes its level on the old pipeline
+        preview_stages = Pipeline()
 
     def scaleImage(self, evt, image_file):
         img = wx.Image(image_file, wx.BITMAP_TYPE_ANY)
@@ -365,9 +394,9 @@ class Frame(wx.Frame):
                            style=wx.DD_DEFAULT_STYLE)
         if dlg.ShowModal() == wx.ID_OK:
             dirpath = dlg.GetPath()
-            print "You selected: %s" % dirpath
+            logger.info("You selected: %s", dirpath)
             dlg.Destroy()
-            print self.getImageFilesInDir(dirpath)
+            logger.debug("Image files: %s", self.getImageFilesInDir(dirpath))
             return dirpath
         else:
             dlg.Destroy()
@@ -378,7 +407,7 @@ class Frame(wx.Frame):
         image_files = []
         image_file_paths = []
         os.chdir(dirpath)
-        print dirpath
+        logger.debug("%s", dirpath)
         for files in filetypes:
             image_files.extend(glob.glob(files))
         for item in image_files:
@@ -398,7 +427,7 @@ class Frame(wx.Frame):
         if dlg.ShowModal() == wx.ID_OK:
             path = dlg.GetPath()
             mypath = os.path.abspath(path)
-            print "You selected: %s" % mypath
+            logger.info("You selected: %s", mypath)
             full_file_list.append(mypath)
             self.file_list_box.Append(mypath)
         dlg.Destroy()
@@ -416,6 +445,8 @@ class Frame(wx.Frame):
         result = dlg.ShowModal()
         dlg.Destroy()
         if result == wx.ID_OK:
+            if self.job is not None:
+                self.job.cancel()
             self.Destroy()
 
     def OnAbout(self, evt):
@@ -447,7 +478,7 @@ class Frame(wx.Frame):
         global preset_choice
         preset_choice = evt.GetString()
         preset_values = Functions.xmlread()[preset_choice]
-        print preset_values
+        logger.debug("%s", preset_values)
 
     def FileListSave(self, evt):
         saveLB = self.file_list_box.GetStrings()
@@ -480,11 +511,11 @@ class Frame(wx.Frame):
             path = dlg.GetPath()
             flp = file(path, 'r')  # opens the file
             listEntry = flp.read().splitlines()
-            print listEntry
+            logger.debug("%s", listEntry)
             for entry in listEntry:
                 self.file_list_box.Append(entry)
                 full_file_list.append(entry)
-                print full_file_list
+                logger.debug("%s", full_file_list)
             dlg.Destroy()
 
 
@@ -580,7 +611,7 @@ class ConfigurePresets(wx.Dialog):
     def __init__(self):
         wx.Dialog.__init__(self, None, -1, "Configure Presets",
                            style=wx.CAPTION | wx.CLOSE_BOX | wx.THICK_FRAME |
-                           wx.SYSTEM_MENU, size=(500, 255))
+                           wx.SYSTEM_MENU, size=(500, 285))
         pnl = wx.Panel(self)
         main_lbl = "Experiment with these values to improve"
         main_lbl += " the results of pyCWW."
@@ -619,6 +650,9 @@ class ConfigurePresets(wx.Dialog):
         self.select_preset = wx.StaticText(self,
                                            label="Select Preset to View/Edit:",
                                            pos=(300, 160))
+        self.width_mode_lbl = wx.StaticText(self,
+                                            label="Width Mode:",
+                                            pos=(300, 200))
         self.edit_thresh = wx.TextCtrl(self,
                                        value="",
                                        pos=(2, 36),
@@ -669,6 +703,12 @@ class ConfigurePresets(wx.Dialog):
                                          pos=(300, 175),
                                          size=(160, 18),
                                          style=wx.CB_DROPDOWN | wx.CB_READONLY)
+        self.width_mode = wx.ComboBox(self,
+                                      choices=list(WIDTH_MODES),
+                                      value='dilation',
+                                      pos=(300, 215),
+                                      size=(160, 18),
+                                      style=wx.CB_DROPDOWN | wx.CB_READONLY)
         self.save_btn = wx.Button(self, label="Save", pos=(200, 200))
         self.reset_btn = wx.Button(self,
                                    label="Default Presets",
@@ -680,6 +720,8 @@ class ConfigurePresets(wx.Dialog):
         self.Bind(wx.EVT_BUTTON, self.OnPreview, self.preview_btn)
         self.Bind(wx.EVT_COMBOBOX, self.OnSelect, self.pred_elem)
         self.Bind(wx.EVT_COMBOBOX, self.PresetSelect, self.preset_select)
+        self.preview_run = 0   # counts previews, so old ones stop refining
+        self.preview_figure = None
 
     def OnPreview(self, event):
         error_happen = False
@@ -692,6 +734,7 @@ class ConfigurePresets(wx.Dialog):
         new_values.append(self.edit_area.GetValue())
         new_values.append(self.edit_perim.GetValue())
         new_values.append(str(self.edit_elem.GetValue()))
+        new_values.append(self.width_mode.GetValue())
         chk = Errors.check_threshold(new_values[0], 2)
         if chk[0]:
             error_happen = True
@@ -703,7 +746,7 @@ class ConfigurePresets(wx.Dialog):
                 self.OnError(chk[1])
         # check the structuring element
         chk = Errors.check_structure(new_values[7])
-        print full_file_list
+        logger.debug("%s", full_file_list)
         if not chk[0]:
             error_happen = True
             self.OnError(chk[1])
@@ -711,26 +754,53 @@ class ConfigurePresets(wx.Dialog):
             test_file = full_file_list[0]
             (file_out, png_name) = name_files(test_file, outpath)
             formatted = Functions.formatValues(new_values)
-            print formatted
-            (im_raw, labels_open, y_center, x_center,
-             contours) = process_image(test_file,
-                                       png_name,
-                                       formatted[0],
-                                       formatted[1],
-                                       formatted[2],
-                                       formatted[3],
-                                       formatted[4],
-                                       formatted[5],
-                                       formatted[6],
-                                       formatted[7])
-            plot_image(im_raw,
-                       labels_open,
-                       labels_open,
-                       y_center,
-                       x_center,
-                       contours,
-                       png_name,
-                       True)
+            logger.debug("Settings: %s", formatted)
+            # preview a reduced image at once, then refine it up to the full
+            # image in the background (see cww_preview); only the stages after
+            # the first changed setting run again (see cww_stages)
+            self.preview_run += 1
+            thread = threading.Thread(target=self.RefinePreview,
+                                      args=(self.preview_run, test_file,
+                                            png_name, formatted))
+            thread.daemon = True
+            thread.start()
+
+    def RefinePreview(self, run, test_file, png_name, formatted):
+        # runs in the background, one pyramid level at a time, until a newer
+        # preview is asked for
+        try:
+            with preview_lock:
+                levels = range(first_level(preview_stages.pyramid(
+                    test_file, page_number - 1)), -1, -1)
+            for level in levels:
+                if run != self.preview_run:
+                    return
+                with preview_lock:
+                    results = preview_stages.preview(test_file, formatted,
+                                                     level, page_number - 1)
+                wx.CallAfter(self.ShowPreview, run, level, png_name, results)
+        except Exception:
+            wx.CallAfter(self.OnError, traceback.format_exc())
+
+    def ShowPreview(self, run, level, png_name, results):
+        if not self or run != self.preview_run:   # closed or out of date
+            return
+        (im_raw, labels_open, y_center, x_center, contours) = results
+        if self.preview_figure is not None:
+            plt.close(self.preview_figure)
+        plot_image(im_raw,
+                   labels_open,
+                   labels_open,
+                   y_center,
+                   x_center,
+                   contours,
+                   png_name,
+                   False)
+        self.preview_figure = plt.gcf()
+        if level > 0:
+            self.preview_figure.suptitle("Preview at 1/%d size, refining..." %
+                                         2 ** level)
+        plt.show(block=False)
 
 
     def PresetSelect(self, event):
@@ -744,6 +814,10 @@ class ConfigurePresets(wx.Dialog):
         self.edit_area.SetValue(preset_values[5])
         self.edit_perim.SetValue(preset_values[6])
         self.edit_elem.SetValue(preset_values[7])
+        if len(preset_values) > 8:
+            self.width_mode.SetValue(preset_values[8])
+        else:
+            self.width_mode.SetValue('dilation')
         self.edit_name.SetValue(self.presetlist[item])
 
     def OnSelect(self, event):
@@ -762,6 +836,7 @@ class ConfigurePresets(wx.Dialog):
         new_values.append(self.edit_area.GetValue())
         new_values.append(self.edit_perim.GetValue())
         new_values.append(str(self.edit_elem.GetValue()))
+        new_values.append(self.width_mode.GetValue())
         #print new_values
         name = self.edit_name.GetValue()
         if name in self.presetlist:
@@ -769,7 +844,7 @@ class ConfigurePresets(wx.Dialog):
             self.OnError(msg)
         else:
             # check the threshold
-            print Errors.check_threshold(new_values[0], 2)
+            logger.debug("%s", Errors.check_threshold(new_values[0], 2))
             chk = Errors.check_threshold(new_values[0], 2)
             if chk[0]:
                 error_happen = True
@@ -794,8 +869,8 @@ class ConfigurePresets(wx.Dialog):
                                        wx.OK | wx.CANCEL | wx.ICON_INFORMATION)
                 result = dlg.ShowModal()
                 if result == wx.ID_OK:
-                    print new_values, name
-                    print new_values[3]
+                    logger.debug("%s %s", new_values, name)
+                    logger.debug("%s", new_values[3])
                     Functions.xmlUpdate(name, new_values)
                     dlg.Destroy()
                     self.Destroy()
@@ -839,9 +914,9 @@ class SelectPresetWindow(wx.Dialog):
 
     def PresetChoice(self, event):
         global preset_choice
-        print "You chose %s" % event.GetString()
+        logger.info("You chose %s", event.GetString())
         preset_choice = event.GetString()
-        print Functions.xmlread()[preset_choice]
+        logger.debug("%s", Functions.xmlread()[preset_choice])
 
     def Close(self, event):
         self.Destroy()
@@ -896,15 +971,11 @@ class Functions:
         # Area Cutoff       presets[preset_choice][5]        #
         # Perim Cutoff      presets[preset_choice][6]        #
         # Structuring Elem  presets[preset_choice][7]        #
+        # Width Mode        presets[preset_choice][8]        #
+        #   (optional, 'dilation' when missing)              #
         ######################################################
         xmlFile = "config.xml"
-        tree = et.parse(xmlFile)
-        root = tree.getroot()
-        for child in root:
-            child_values = []
-            for value in child:
-                child_values.append(value.text)
-            presets[child.tag] = child_values
+        presets = cww_presets.read_presets(xmlFile)
         return presets
 
     @staticmethod
@@ -926,7 +997,8 @@ class Functions:
         perim_line += "</perimeter_cutoff>\n"
         struct_line = "\t\t<structuring_element>%s"
         struct_line += "</structuring_element>\n"
-        print lines
+        mode_line = "\t\t<width_mode>%s</width_mode>\n"
+        logger.debug("%s", lines)
         with open(xmlFile, 'w') as xml_out:
             for line in lines:
                 xml_out.write(line)
@@ -940,6 +1012,7 @@ class Functions:
                     xml_out.write(area_line % new_values[5])
                     xml_out.write(perim_line % new_values[6])
                     xml_out.write(struct_line % new_values[7])
+                    xml_out.write(mode_line % new_values[8])
                     xml_out.write('\t</%s>\n' % name)
 
     @staticmethod
@@ -955,50 +1028,23 @@ class Functions:
     def readPresets():
         xml = Functions.xmlread()
         presets = xml.keys()
-        print presets
+        logger.debug("%s", presets)
         return presets
 
     @staticmethod
     def formatValues(preset_values):
-        thresh = preset_values[0]
-        gauss = preset_values[1]
-        binO = preset_values[2]
-        binC = preset_values[3]
-        dil = preset_values[4]
-        area = preset_values[5]
-        perim = preset_values[6]
-        elem = preset_values[7]
-        if thresh != "mean":
-            thresh = int(thresh)
-        else:
-            pass
-        gauss = int(gauss)
-        binO = int(binO)
-        binC = int(binC)
-        dil = int(dil)
-        area = int(area)
-        perim = int(perim)
-        elem = Errors.check_structure(elem)[2]
-        return [thresh, gauss, binO, binC, dil, area, perim, elem]
+        return cww_presets.format_values(preset_values)
 
 
 class Errors():
     @staticmethod
     def check_threshold(threshold, Return):
-        accept = False
-        if threshold == "mean":
-            accept = True
+        if valid_threshold(threshold):
             if Return == 2:
                 return [False, "good"]
-        try:
-            int(threshold)
-            if Return == 2:
-                return [False, "good"]
-        except ValueError:
-            if accept:
-                pass
-            else:
-                return [True, "Threshold must be 'mean' or an integer!"]
+        else:
+            return [True, "Threshold must be an integer, 'mean', 'otsu', " +
+                    "'triangle' or 'percentile:N'!"]
 
     @staticmethod
     def check_int(var, number):
@@ -1011,27 +1057,7 @@ class Errors():
 
     @staticmethod
     def check_structure(elem):
-        msg = ""
-        elem = str(elem)
-        rtrn_array = []
-        if elem[0:2] == "[[":
-            #elem = elem[1:]
-            brackets = elem.split("],[")
-            for i in brackets:
-                if i.startswith("[["):
-                    rtrn_array.append(i[2:].strip(",").split(","))
-                elif i.endswith("]]"):
-                    rtrn_array.append(i.strip("]]").split(","))
-                else:
-                    rtrn_array.append(i.split(","))
-            #print rtrn_array
-            success = True
-            msg = "good"
-        else:
-            msg = "Structuring element needs to be in the format:\n"
-            msg += "\t[[1,1,1],[1,1,1],[1,1,1]]"
-            success = False
-        return (success, msg, rtrn_array)
+        return cww_presets.check_structure(elem)
 
 
 def def_text():
@@ -1192,13 +1218,23 @@ def def_text():
     are useful for his/her applications. Threshold is the value at which a
     binary (black/white) cutoff is made, and must be within the range of 0 and
     255, or a mean of pixel values in the input image can be calculated with
-    'mean'. Gaussian blur iterations, used to blur away noise in an image, can
+    'mean'. It can also be found from the image histogram with 'otsu',
+    'triangle', or 'percentile:N' (the grey level below which N percent of
+    the pixels lie, e.g. percentile:60). Gaussian blur iterations, used to blur away noise in an image, can
     be adjusted with gauss_blur values. Iterations of binary opening and
     closing to clean noise surrounding objects and within objects can be
     specified. Also, the maximum number of cell wall widths output is
     controlled by the number of dilation iterations. Cut-offs (in pixels) of
     area and perimeter can also be specified.
-    </p>"""
+    </p><br>
+    <p>An optional width_mode element (Width Mode when configuring presets)
+    picks how cell wall widths are found:
+    'dilation' (the default) dilates and relabels the image once per
+    iteration, 'incremental' grows the labeled cells one ring per iteration
+    without relabeling the image, and 'distance' finds the same widths from a
+    single distance transform, which is much faster on large images. Only
+    'incremental' and 'distance' write the pairs_ table of the cells on either
+    side of each wall.</p>"""
 
 
 def main():
@@ -1209,11 +1245,19 @@ def main():
     global ID_FILE_LIST_SAVE, ID_FILE_LIST_LOAD, ID_FILE_LIST_CLEAR
     global ID_SET_OUTPUT, ID_CWW, ID_AP, ID_PREVIEW, ID_RUN_ALL
     global ID_SETTINGS_SAVE, ID_SETTINGS_LOAD, outpath, new_name
-    global full_file_list
+    global full_file_list, ID_SET_WORKERS, num_workers
+    global ID_SET_PAGE, page_number
+    global ID_CLEAR_CACHE, cache_dir, preview_stages, preview_lock
+    setup_logging()   # each image's progress to the console
     full_file_list = []
+    num_workers = default_workers()
+    page_number = 1   # of multi-page files, counting from 1
     new_name = ""
     app_path = os.path.dirname(os.path.abspath(__file__))
     outpath = app_path
+    cache_dir = os.path.join(app_path, 'cache')
+    preview_stages = Pipeline()
+    preview_lock = threading.Lock()
     def_text()
     if os.path.isfile('config.xml'):
         pass
@@ -1240,6 +1284,9 @@ def main():
     ID_FILE_LIST_LOAD = wx.NewId()
     ID_FILE_LIST_CLEAR = wx.NewId()
     ID_SET_OUTPUT = wx.NewId()
+    ID_SET_WORKERS = wx.NewId()
+    ID_SET_PAGE = wx.NewId()
+    ID_CLEAR_CACHE = wx.NewId()
     ID_SETTINGS_SAVE = wx.NewId()
     ID_SETTINGS_LOAD = wx.NewId()
     filetypes = ('*.jpg', '*.JPG', '*.png', '*.PNG', '*.jpeg', '*.JPEG',